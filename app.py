@@ -1,19 +1,118 @@
-from fastapi import FastAPI, WebSocket,File, UploadFile, Form, HTTPException
+import hmac
+import time
+import asyncio
+import logging
+import importlib
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List
+import os
+from fastapi import FastAPI, WebSocket,File, UploadFile, Form, HTTPException, Header, Query
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
 
-from src.websocket.ppe_w_local1 import run_ppe_detection
 from src.store_s3.video_storage import upload_video_to_s3
+from src.models.ppe_local import ppe_registry, two_stage_registry, reload_ppe_model, resolve_weights
+from src.utils.metrics import refresh_gauges_forever, render_metrics, track_executor, track_sessions
+from src.utils.profiler import profile_session, AllocationProbe
+from src.utils.loop_monitor import LoopLagMonitor
+from src.websocket.stream_hub import StreamHub
 
 # n
 
 
-from src.handlers.ppe_handler import ppe_websocket_handler
+from src.handlers.ppe_handler import ppe_websocket_handler, gateway_websocket_handler, draining
 
 from fastapi.middleware.cors import CORSMiddleware
 
 
 from concurrent.futures import ThreadPoolExecutor
 
-app = FastAPI()
+logger = logging.getLogger("app")
+logger.setLevel(logging.INFO)
+
+PROCESS_STARTED = time.time()
+
+# Everything above is cheap; these are not needed to bind the port and are
+# imported on worker threads during the lifespan, next to the model load.
+# `python app.py --import-profile` shows what the startup path still costs.
+PRELOAD_MODULES = (
+    "src.websocket.ppe_w_local1",   # cv2, numpy, inference, spool, alerts
+    "boto3",
+    "psycopg2.extras",
+)
+
+# "standalone": detection runs in this worker; "gateway": streams are placed on inference nodes
+PPE_MODE = os.getenv("PPE_MODE", "standalone")
+# In-process nodes started next to a gateway using the memory:// broker (single host / tests)
+LOCAL_NODES = int(os.getenv("PPE_LOCAL_NODES", 1))
+
+
+def run_ppe_detection(*args):
+    """Detection entry point; the pipeline module is loaded by the first call (or the preload)."""
+    from src.websocket.ppe_w_local1 import run_ppe_detection as run
+    return run(*args)
+
+
+def _preload(name, timings):
+    start = time.perf_counter()
+    try:
+        importlib.import_module(name)
+    except ImportError as e:
+        logger.warning(f"Preload of {name} failed: {e}")
+        return
+    timings[name] = round(time.perf_counter() - start, 3)
+    logger.info(f"Preloaded {name} in {timings[name]}s")
+
+
+def _log_load_failure(future):
+    """The background model load is never awaited: surface its failure here (/ready stays 503)."""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Background model load failed", exc_info=future.exception())
+
+
+# ---------------- Lifespan ----------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Kick off the model load once per worker; /ready reports when it is done."""
+    loop = asyncio.get_running_loop()
+    app.state.loop_monitor = LoopLagMonitor(loop)
+    app.state.loop_monitor.start()
+    app.state.gauges = asyncio.create_task(refresh_gauges_forever())
+    app.state.gateway = None
+    app.state.local_nodes = []
+    app.state.preload_seconds = {}
+
+    if PPE_MODE == "gateway":
+        from src.cluster.broker import InProcessBroker, get_broker
+        from src.cluster.gateway import Gateway
+
+        broker = get_broker()
+        app.state.gateway = Gateway(broker)
+        app.state.gateway.start()
+        if isinstance(broker, InProcessBroker):
+            from src.cluster.node import InferenceNode
+            for i in range(LOCAL_NODES):
+                node = InferenceNode(broker, f"local-{i}")
+                app.state.local_nodes.append(node)
+                loop.run_in_executor(None, node.start)
+    else:
+        # Not awaited: liveness answers immediately while weights load in the background
+        app.state.model_load = loop.run_in_executor(None, ppe_registry.load)
+        app.state.model_load.add_done_callback(_log_load_failure)
+        app.state.preloads = [loop.run_in_executor(None, _preload, name, app.state.preload_seconds)
+                              for name in PRELOAD_MODULES]
+    app.state.started_in = round(time.time() - PROCESS_STARTED, 3)
+    yield
+
+    for node in app.state.local_nodes:
+        await loop.run_in_executor(None, node.stop)
+    if app.state.gateway:
+        await loop.run_in_executor(None, app.state.gateway.stop)
+    app.state.loop_monitor.stop()
+    app.state.gauges.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +129,13 @@ ppe_sessions = {}
 detection_executor = ThreadPoolExecutor(max_workers=10)
 storage_executor = ThreadPoolExecutor(max_workers=5)
 
+# One detection pipeline per (stream_name, config), shared by all its viewers
+stream_hub = StreamHub(detection_executor, storage_executor, run_ppe_detection)
+
+track_sessions(ppe_sessions)
+track_executor("detection", detection_executor)
+track_executor("storage", storage_executor)
+
 
 #--------------------------------------------------------------------------- WebSocket for all Models ------------------------------------------------------------------------------#
 
@@ -38,7 +144,237 @@ storage_executor = ThreadPoolExecutor(max_workers=5)
 # ---------------- PPE WebSocket ----------------
 @app.websocket("/ws/ppe/{client_id}")
 async def websocket_ppe(ws: WebSocket,client_id: str):
-    await ppe_websocket_handler(detection_executor, storage_executor, ws,client_id, ppe_sessions, run_ppe_detection, "PPE")
+    if app.state.gateway:
+        await gateway_websocket_handler(app.state.gateway, ws, client_id, ppe_sessions, "PPE")
+        return
+    await ppe_websocket_handler(detection_executor, storage_executor, ws,client_id, ppe_sessions, run_ppe_detection, "PPE", stream_hub)
+
+
+
+# ---------------- Health / Readiness ----------------
+@app.get("/health")
+async def health():
+    """Liveness: the process is up and serving, regardless of model state."""
+    return {
+        "status": "ok",
+        "uptime_seconds": round(time.time() - PROCESS_STARTED, 3),
+        "startup_seconds": getattr(app.state, "started_in", None),
+        "preload_seconds": getattr(app.state, "preload_seconds", {}),
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: the model is loaded and streams can be started."""
+    if draining.is_set():
+        # Load balancers stop routing new cameras here; live streams keep running
+        return JSONResponse({"state": "draining", "active_streams": _active_streams()}, status_code=503)
+    if app.state.gateway:
+        # A gateway is ready once at least one inference node is alive
+        status = app.state.gateway.status()
+        return JSONResponse(status, status_code=200 if status["nodes"] else 503)
+    status = ppe_registry.status()
+    return JSONResponse(status, status_code=200 if ppe_registry.is_ready() else 503)
+
+
+
+@app.get("/admin/streams")
+async def streams(x_admin_token: str = Header(None)):
+    """Running pipelines and their viewers."""
+    _check_admin(x_admin_token)
+    return stream_hub.status()
+
+
+@app.get("/cluster")
+async def cluster_status():
+    if not app.state.gateway:
+        raise HTTPException(status_code=404, detail="Not running in gateway mode")
+    return app.state.gateway.status()
+
+
+
+# ---------------- Compliance rollups ----------------
+@app.get("/compliance")
+async def compliance(start: datetime, end: datetime, camera_id: List[int] = Query(None),
+                     org_id: int = None, bucket: str = "hour"):
+    """
+    Per-camera compliance from the per-minute rollups, grouped by `bucket`
+    (minute/hour/day/week/month). A month of hourly data is ~720 rows per camera.
+    """
+    from src.database.ppe_query import ROLLUP_BUCKETS, query_compliance
+
+    if bucket not in ROLLUP_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {list(ROLLUP_BUCKETS)}")
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    loop = asyncio.get_running_loop()
+    rows = await loop.run_in_executor(None, query_compliance, start, end, camera_id, org_id, bucket)
+    return {"bucket": bucket, "start": start.isoformat(), "end": end.isoformat(), "rows": rows}
+
+
+
+# ---------------- Prometheus ----------------
+@app.get("/metrics")
+async def metrics():
+    # Multiprocess mode reads every worker's files from disk
+    body, content_type = await asyncio.get_running_loop().run_in_executor(None, render_metrics)
+    return Response(content=body, media_type=content_type)
+
+
+
+# ---------------- Admin: live profiling ----------------
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def _check_admin(token):
+    # Fails closed: without ADMIN_TOKEN the admin API is disabled, not open
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin API disabled: ADMIN_TOKEN is not set")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def _active_streams():
+    return sum(1 for s in list(ppe_sessions.values()) if s.get("streaming"))
+
+
+def _admin_session(client_id: str, token):
+    _check_admin(token)
+    session = ppe_sessions.get(client_id)
+    if not session or not session.get("streaming"):
+        raise HTTPException(status_code=404, detail=f"No active stream for client {client_id}")
+    # Viewers behind the hub: the detection thread's state lives on the shared pipeline
+    session = stream_hub.pipeline_for(client_id) or session
+    if "metrics" not in session:
+        raise HTTPException(status_code=409, detail=f"Detection for client {client_id} is still starting")
+    return session
+
+
+@app.post("/admin/profile/{client_id}", response_class=PlainTextResponse)
+async def profile_stream(client_id: str, seconds: float = 10.0, interval_ms: float = 5.0,
+                         x_admin_token: str = Header(None)):
+    """Sample the session's detection thread; returns a flamegraph collapsed-stack file."""
+    session = _admin_session(client_id, x_admin_token)
+    loop = asyncio.get_running_loop()
+    try:
+        collapsed = await loop.run_in_executor(None, profile_session, session, seconds, interval_ms / 1000.0)
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f'attachment; filename="{client_id}.collapsed"'}
+    )
+
+
+@app.post("/admin/timings/{client_id}")
+async def enable_timings(client_id: str, frames: int = 1000, x_admin_token: str = Header(None)):
+    """Start recording per-frame stage timings into a ring buffer of `frames` rows."""
+    session = _admin_session(client_id, x_admin_token)
+    session["metrics"].enable_timings(frames)
+    return {"client_id": client_id, "recording": True, "frames": frames}
+
+
+@app.get("/admin/timings/{client_id}")
+async def get_timings(client_id: str, x_admin_token: str = Header(None)):
+    session = _admin_session(client_id, x_admin_token)
+    return session["metrics"].timings_snapshot()
+
+
+@app.delete("/admin/timings/{client_id}")
+async def disable_timings(client_id: str, x_admin_token: str = Header(None)):
+    session = _admin_session(client_id, x_admin_token)
+    session["metrics"].disable_timings()
+    return {"client_id": client_id, "recording": False}
+
+
+
+@app.post("/admin/allocations/{client_id}")
+async def start_allocation_probe(client_id: str, frames: int = 200, x_admin_token: str = Header(None)):
+    """
+    Trace allocations per frame (tracemalloc) for the next `frames` frames of one stream.
+    tracemalloc counts every thread in the process, so the figures include
+    whatever other streams and the event loop allocate meanwhile; probe with
+    one active stream for per-stream numbers.
+    """
+    session = _admin_session(client_id, x_admin_token)
+    probe = AllocationProbe(frames)
+    try:
+        # The baseline snapshot walks every traced block: off the loop
+        await asyncio.get_running_loop().run_in_executor(None, probe.start)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    session["alloc_probe"] = probe
+    return {"client_id": client_id, "recording": True, "frames": frames}
+
+
+@app.get("/admin/allocations/{client_id}")
+async def get_allocation_probe(client_id: str, x_admin_token: str = Header(None)):
+    session = _admin_session(client_id, x_admin_token)
+    probe = session.get("alloc_probe")
+    if probe is None:
+        raise HTTPException(status_code=404, detail="No allocation probe for this stream")
+    return probe.report()
+
+
+
+# ---------------- Admin: hot reload / drain ----------------
+@app.post("/admin/model/reload", status_code=202)
+async def reload_model(weights: str = None, x_admin_token: str = Header(None)):
+    """
+    Load new weights (default: the current best.pt; otherwise a file under the
+    model directory) and warm them up in the background, then swap them in.
+    Live streams keep their tracker and PPE state; frames already in flight
+    finish on the old model.
+
+    The swap is per process: behind gunicorn only the worker that received
+    this request reloads. Roll the workers (or call this on each) to update
+    them all.
+    """
+    _check_admin(x_admin_token)
+    if ppe_registry.reload_state == "reloading":
+        raise HTTPException(status_code=409, detail="A reload is already in progress")
+    if weights:
+        try:
+            weights = resolve_weights(weights)
+        except (ValueError, FileNotFoundError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    loop = asyncio.get_running_loop()
+    # Not awaited: poll GET /admin/model for the outcome
+    app.state.model_reload = loop.run_in_executor(None, reload_ppe_model, weights)
+    return {"status": "reloading", "weights": weights, "from_version": ppe_registry.version}
+
+
+@app.get("/admin/model")
+async def model_status(x_admin_token: str = Header(None)):
+    _check_admin(x_admin_token)
+    return {"ppe": ppe_registry.status(), "two_stage": two_stage_registry.status()}
+
+
+@app.post("/admin/drain")
+async def start_drain(x_admin_token: str = Header(None)):
+    """
+    Rolling deploy: refuse new start_stream requests and fail /ready so the
+    load balancer moves new cameras elsewhere, while live streams run on.
+    Poll GET /admin/drain until active_streams reaches 0, then stop the instance.
+    """
+    _check_admin(x_admin_token)
+    draining.set()
+    logger.info(f"Drain started with {_active_streams()} active streams")
+    return {"draining": True, "active_streams": _active_streams()}
+
+
+@app.get("/admin/drain")
+async def drain_status(x_admin_token: str = Header(None)):
+    _check_admin(x_admin_token)
+    return {"draining": draining.is_set(), "active_streams": _active_streams()}
+
+
+@app.delete("/admin/drain")
+async def stop_drain(x_admin_token: str = Header(None)):
+    _check_admin(x_admin_token)
+    draining.clear()
+    return {"draining": False, "active_streams": _active_streams()}
 
 
 
@@ -57,3 +393,16 @@ async def upload_ai_search_video(
     return {"message": "Video uploaded successfully", "s3_url": url}
 
 
+
+# ------------------- Entry point -------------------
+if __name__ == "__main__":
+    import sys
+
+    if "--import-profile" in sys.argv:
+        # Import-time report for this service: python app.py --import-profile [--top N]
+        from src.utils.import_profile import main as import_profile
+        argv = [arg for arg in sys.argv[1:] if arg != "--import-profile"]
+        sys.exit(import_profile(["app"] + argv))
+
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
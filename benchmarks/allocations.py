@@ -0,0 +1,91 @@
+"""
+Per-frame allocation comparison of the frame-buffer chain, before and after
+the per-stream buffer pool, measured with the same tracemalloc probe the
+/admin/allocations endpoint uses. No model is loaded: only the buffer
+handling around inference is exercised.
+
+    python -m benchmarks.allocations --resolution 720p --frames 200
+"""
+import os
+import sys
+import json
+import base64
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.local_models.ppe_code.buffers import BufferPool
+from src.utils.profiler import AllocationProbe
+
+RESOLUTIONS = {"480p": (480, 854), "720p": (720, 1280), "1080p": (1080, 1920)}
+
+
+def legacy_frame(decoded, _pool):
+    """cvtColor -> PIL -> orig_img.copy() -> JPEG/b64 -> decode -> JPEG/b64 again."""
+    from PIL import Image
+
+    resized = cv2.resize(decoded, (720, int(720 * decoded.shape[0] / decoded.shape[1])))
+    rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+    image = Image.fromarray(rgb)
+    orig_img = np.asarray(image)[..., ::-1].copy()      # ultralytics' BGR view of the PIL input
+    canvas = orig_img.copy()
+    _, buf = cv2.imencode(".jpg", canvas)
+    b64 = base64.b64encode(buf).decode("utf-8")
+    annotated = cv2.imdecode(np.frombuffer(base64.b64decode(b64), np.uint8), cv2.IMREAD_COLOR)
+    _, buf = cv2.imencode(".jpg", annotated)
+    return base64.b64encode(buf).decode("utf-8")
+
+
+def pooled_frame(decoded, pool):
+    """Decode-time resize into a reused buffer -> pooled canvas -> one JPEG/b64."""
+    h = int(720 * decoded.shape[0] / decoded.shape[1])
+    resized = pool.get("decode", (h, 720, 3))
+    cv2.resize(decoded, (720, h), dst=resized)
+    canvas = pool.copy_into("canvas", resized)
+    _, buf = cv2.imencode(".jpg", canvas)
+    return base64.b64encode(buf).decode("utf-8")
+
+
+def measure(chain, frames, resolution):
+    h, w = RESOLUTIONS[resolution]
+    rng = np.random.default_rng(0)
+    decoded = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+    pool = BufferPool()
+    chain(decoded, pool)    # first frame allocates the pool; not part of the steady state
+
+    probe = AllocationProbe(frames, top=5)
+    probe.start()
+    for i in range(frames):
+        probe.frame_start()
+        chain(decoded, pool)
+        probe.frame_end(i + 1)
+    probe.stop()
+    report = probe.report()
+    report.pop("per_frame")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-frame allocations before/after the buffer pool")
+    parser.add_argument("--resolution", default="720p", choices=sorted(RESOLUTIONS))
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    results = {
+        "legacy": measure(legacy_frame, args.frames, args.resolution),
+        "pooled": measure(pooled_frame, args.frames, args.resolution),
+    }
+    for name, r in results.items():
+        print(f"[alloc] {name:7s} peak/frame p50 {r['peak_kb']['p50']} KB, "
+              f"p95 {r['peak_kb']['p95']} KB, net {r['net_kb_mean']} KB")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
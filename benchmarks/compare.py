@@ -0,0 +1,88 @@
+"""
+Regression gate for the micro-benchmarks.
+
+    pytest benchmarks/micro --benchmark-json=micro.json
+    python -m benchmarks.compare micro.json                  # fail if >10% slower
+    python -m benchmarks.compare micro.json --threshold 5
+    python -m benchmarks.compare micro.json --update         # accept as new baseline
+
+Baselines are per-machine: record them on the same instance type the
+comparison runs on (the CI runner or the inference node class).
+"""
+import os
+import sys
+import json
+import argparse
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+
+
+def load_results(path, stat):
+    """{benchmark fullname: seconds} from a pytest-benchmark JSON file."""
+    with open(path) as f:
+        data = json.load(f)
+    return {b["fullname"]: b["stats"][stat] for b in data.get("benchmarks", [])}
+
+
+def compare(current, baseline, threshold):
+    """Return (rows, regressions); a row is (name, baseline_s, current_s, change_pct)."""
+    rows, regressions = [], []
+    for name in sorted(set(current) | set(baseline)):
+        old, new = baseline.get(name), current.get(name)
+        if old is None or new is None:
+            rows.append((name, old, new, None))
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        rows.append((name, old, new, change))
+        if change > threshold:
+            regressions.append((name, old, new, change))
+    return rows, regressions
+
+
+def _fmt(seconds):
+    return "-" if seconds is None else f"{seconds * 1e6:10.1f}us"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare micro-benchmark results against a stored baseline")
+    parser.add_argument("results", help="pytest-benchmark JSON (--benchmark-json)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=10.0, help="Max allowed slowdown in percent")
+    parser.add_argument("--stat", default="median", choices=("min", "median", "mean"))
+    parser.add_argument("--update", action="store_true", help="Write results as the new baseline")
+    args = parser.parse_args(argv)
+
+    current = load_results(args.results, args.stat)
+
+    if args.update:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({"stat": args.stat, "results": current}, f, indent=2, sort_keys=True)
+        print(f"[compare] Baseline updated: {len(current)} benchmarks -> {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"[compare] No baseline at {args.baseline}; record one with --update")
+        return 2
+
+    with open(args.baseline) as f:
+        stored = json.load(f)
+    if stored.get("stat", args.stat) != args.stat:
+        print(f"[compare] Baseline was recorded with stat={stored['stat']}, not {args.stat}")
+        return 2
+
+    rows, regressions = compare(current, stored["results"], args.threshold)
+    for name, old, new, change in rows:
+        marker = "REGRESSION" if change is not None and change > args.threshold else ""
+        pct = "   new/gone" if change is None else f"{change:+10.1f}%"
+        print(f"{_fmt(old)} {_fmt(new)} {pct}  {name} {marker}")
+
+    if regressions:
+        print(f"[compare] {len(regressions)} benchmark(s) regressed by more than {args.threshold}%")
+        return 1
+    print(f"[compare] OK: no benchmark regressed by more than {args.threshold}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+End-to-end load benchmark.
+
+Replays local video files as N simulated cameras through the real
+run_ppe_detection -> ppe_detection -> PPELogic path, with S3 / Postgres
+stubbed out and simulated WebSocket clients of configurable slowness.
+
+    python -m benchmarks.e2e --videos clip1.mp4 clip2.mp4 --cameras 8 \\
+        --duration 60 --ws-delay 0.005 --out bench_results.json
+
+Writes a JSON report (per-stage latency percentiles, glass-to-WebSocket and
+glass-to-alert latency, sustained FPS per stream, RSS over time) that can be
+diffed between releases.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.harness import (
+    FakeWebSocket,
+    LoopThread,
+    RssSampler,
+    fake_upload_to_s3,
+    install_fake_db,
+    percentiles,
+    recording_stream_metrics,
+)
+
+
+# ---------------- Timed capture ----------------
+_thread_client = {}     # detection thread ident -> client_id
+_captures = {}          # client_id -> TimedCapture
+
+
+def make_timed_capture(cv2, real_capture, loop_video, realtime):
+
+    class TimedCapture:
+        """cv2.VideoCapture wrapper that timestamps every delivered frame."""
+
+        def __init__(self, source, *args):
+            self.source = source
+            self._args = args
+            self._cap = real_capture(source, *args)
+            self.read_times = []
+            self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 25.0
+            self._next_due = time.perf_counter()
+            client_id = _thread_client.get(threading.get_ident())
+            if client_id is not None:
+                _captures[client_id] = self
+
+        def isOpened(self):
+            return self._cap.isOpened()
+
+        def get(self, prop):
+            return self._cap.get(prop)
+
+        def set(self, prop, value):
+            return self._cap.set(prop, value)
+
+        def read(self, *args, **kwargs):
+            if realtime:
+                wait = self._next_due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                self._next_due = max(self._next_due, time.perf_counter() - 1.0) + 1.0 / self.fps
+
+            ret, frame = self._cap.read(*args, **kwargs)
+            if not ret and loop_video:
+                self._cap.release()
+                self._cap = real_capture(self.source, *self._args)
+                ret, frame = self._cap.read(*args, **kwargs)
+            if ret:
+                self.read_times.append(time.perf_counter())
+            return ret, frame
+
+        def grab(self):
+            return self._cap.grab()
+
+        def release(self):
+            self._cap.release()
+
+    return TimedCapture
+
+
+# ---------------- Runner ----------------
+def run(args):
+    install_fake_db()
+
+    import cv2
+    import src.websocket.ppe_w_local1 as pipeline
+    from src.models.ppe_local import ppe_registry
+
+    # Stub sinks (inherited by the forked storage workers)
+    pipeline.upload_to_s3 = lambda frame, frame_num: fake_upload_to_s3(frame, frame_num, args.s3_latency)
+    pipeline.insert_ppe_frames_bulk = lambda rows: len(rows)
+    pipeline.insert_compliance_rollups = lambda rows: len(rows)
+    import src.store_s3.ppe_store as ppe_store
+    ppe_store.upload_clip_to_s3 = lambda path, camera_id, alert_id: f"https://bench.invalid/ppe-clips/{alert_id}.mp4"
+
+    stage_samples = {}
+    pipeline.StreamMetrics = recording_stream_metrics(pipeline.StreamMetrics, stage_samples)
+    cv2.VideoCapture = make_timed_capture(cv2, cv2.VideoCapture, not args.no_loop, args.realtime)
+
+    # Cold start
+    t0 = time.perf_counter()
+    ppe_registry.load()
+    cold_start = time.perf_counter() - t0
+
+    deliveries = {}   # client_id -> {"ws": [...], "alert": [...]}
+
+    def on_message(client_id, payload, received_at):
+        cap = _captures.get(client_id)
+        frame_num = payload.get("frame_num")
+        if cap is None or not frame_num or frame_num > len(cap.read_times):
+            return
+        latency = received_at - cap.read_times[frame_num - 1]
+        bucket = deliveries.setdefault(client_id, {"ws": [], "alert": []})
+        if payload.get("type") == "ppe_alert":
+            if payload.get("event") == "fired":
+                bucket["alert"].append(latency)
+        else:
+            bucket["ws"].append(latency)
+
+    loop_thread = LoopThread()
+    loop_thread.start()
+    loop = loop_thread.loop
+
+    sessions = {}
+    executor = ThreadPoolExecutor(max_workers=args.cameras)
+    storage_executor = ThreadPoolExecutor(max_workers=2)
+    sockets = {}
+
+    def detection(client_id, *rest):
+        _thread_client[threading.get_ident()] = client_id
+        try:
+            return pipeline.run_ppe_detection(client_id, *rest)
+        finally:
+            _thread_client.pop(threading.get_ident(), None)
+
+    rss = RssSampler(args.rss_interval)
+    rss.start()
+
+    futures = []
+    started = time.perf_counter()
+    for i in range(args.cameras):
+        client_id = f"bench-{i}"
+        video = args.videos[i % len(args.videos)]
+        ws = FakeWebSocket(client_id, args.ws_delay, args.ws_jitter, on_message)
+        sockets[client_id] = ws
+        sessions[client_id] = {"ws": ws, "streaming": True, "inference_tasks": [], "config": dict(args.stream_config)}
+        futures.append(executor.submit(
+            detection, client_id, video, i, 0, 0, sessions, loop, storage_executor
+        ))
+
+    deadline = started + args.duration
+    while time.perf_counter() < deadline and not all(f.done() for f in futures):
+        time.sleep(0.2)
+    for session in sessions.values():
+        session["streaming"] = False
+    for f in futures:
+        f.result()
+    elapsed = time.perf_counter() - started
+
+    rss.stop()
+    time.sleep(0.5)   # let in-flight sends drain
+    loop_thread.stop()
+    executor.shutdown(wait=True)
+    storage_executor.shutdown(wait=True)
+
+    # ---------------- Report ----------------
+    streams = {}
+    for i in range(args.cameras):
+        client_id = f"bench-{i}"
+        cap = _captures.get(client_id)
+        frames = len(cap.read_times) if cap else 0
+        bucket = deliveries.get(client_id, {"ws": [], "alert": []})
+        streams[client_id] = {
+            "video": os.path.basename(args.videos[i % len(args.videos)]),
+            "frames": frames,
+            "fps": round(frames / elapsed, 2) if elapsed else 0.0,
+            "ws_messages": sockets[client_id].messages,
+            "ws_bytes": sockets[client_id].bytes,
+            "stages": {stage: percentiles(v) for stage, v in stage_samples.get(str(i), {}).items() if v},
+            "glass_to_ws": percentiles(bucket["ws"]),
+            "glass_to_alert": percentiles(bucket["alert"]),
+        }
+
+    all_stage = {}
+    for per_stream in stage_samples.values():
+        for stage, values in per_stream.items():
+            all_stage.setdefault(stage, []).extend(values)
+
+    rss_series = rss.samples
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cameras": args.cameras,
+            "duration_s": round(elapsed, 2),
+            "realtime": args.realtime,
+            "ws_delay_s": args.ws_delay,
+            "ws_jitter_s": args.ws_jitter,
+            "stream_config": args.stream_config,
+        },
+        "model": dict(ppe_registry.status(), benchmark_cold_start_seconds=round(cold_start, 3)),
+        "aggregate": {
+            "frames": sum(s["frames"] for s in streams.values()),
+            "fps_total": round(sum(s["fps"] for s in streams.values()), 2),
+            "fps_min_stream": min((s["fps"] for s in streams.values()), default=0.0),
+            "stages": {stage: percentiles(v) for stage, v in all_stage.items() if v},
+            "glass_to_ws": percentiles([x for b in deliveries.values() for x in b["ws"]]),
+            "glass_to_alert": percentiles([x for b in deliveries.values() for x in b["alert"]]),
+        },
+        "rss": {
+            "start_mb": rss_series[0][1] if rss_series else None,
+            "end_mb": rss_series[-1][1] if rss_series else None,
+            "growth_mb": round(rss_series[-1][1] - rss_series[0][1], 1) if rss_series else None,
+            "series": rss_series,
+        },
+        "streams": streams,
+    }
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end PPE pipeline load benchmark")
+    parser.add_argument("--videos", nargs="+", required=True, help="Local video files to replay")
+    parser.add_argument("--cameras", type=int, default=4, help="Number of simulated cameras")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to run")
+    parser.add_argument("--realtime", action="store_true", help="Pace reads at the video's FPS")
+    parser.add_argument("--no-loop", action="store_true", help="Stop a camera at end of file instead of looping")
+    parser.add_argument("--ws-delay", type=float, default=0.0, help="Simulated client send latency (s)")
+    parser.add_argument("--ws-jitter", type=float, default=0.0, help="Extra random send latency (s)")
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="Simulated S3 upload latency (s)")
+    parser.add_argument("--stream-config", type=json.loads, default={}, help="start_stream options as JSON")
+    parser.add_argument("--rss-interval", type=float, default=1.0)
+    parser.add_argument("--out", default="bench_results.json")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    agg = report["aggregate"]
+    print(f"[bench] {agg['frames']} frames, {agg['fps_total']} FPS total, "
+          f"glass->ws p95 {agg['glass_to_ws'].get('p95_ms')} ms, "
+          f"RSS growth {report['rss']['growth_mb']} MB -> {args.out}")
@@ -0,0 +1,202 @@
+"""
+Shared pieces for the benchmarks: stub sinks, simulated WebSocket clients,
+sample recorders and percentile summaries. Nothing here talks to AWS or
+Postgres.
+"""
+import os
+import time
+import json
+import random
+import asyncio
+import resource
+import threading
+
+
+# ---------------- Stats ----------------
+def percentiles(samples, points=(50, 90, 95, 99)):
+    """Summary dict for a list of seconds; values reported in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    data = sorted(samples)
+    n = len(data)
+    out = {
+        "count": n,
+        "mean_ms": round(sum(data) / n * 1000, 3),
+        "max_ms": round(data[-1] * 1000, 3),
+    }
+    for p in points:
+        idx = min(n - 1, max(0, int(round(p / 100.0 * n)) - 1))
+        out[f"p{p}_ms"] = round(data[idx] * 1000, 3)
+    return out
+
+
+def rss_mb():
+    """Current resident set size in MB (falls back to peak RSS off Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RssSampler(threading.Thread):
+    """Samples RSS every `interval` seconds until stop() is called."""
+
+    def __init__(self, interval=1.0):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+        self._start = time.perf_counter()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append((round(time.perf_counter() - self._start, 2), round(rss_mb(), 1)))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=self.interval * 2)
+        self.samples.append((round(time.perf_counter() - self._start, 2), round(rss_mb(), 1)))
+
+
+# ---------------- Sample recording ----------------
+class SampleRecorder:
+    """Stands in for a prometheus child: forwards observe() and keeps the raw sample."""
+
+    def __init__(self, child, samples):
+        self._child = child
+        self.samples = samples
+
+    def observe(self, value):
+        self.samples.append(value)
+        self._child.observe(value)
+
+
+def recording_stream_metrics(base_cls, registry):
+    """
+    Subclass of StreamMetrics whose stage children also keep raw samples in
+    registry[stream][stage], so the benchmark can report real percentiles.
+    """
+    from src.utils.metrics import STAGES
+
+    class RecordingStreamMetrics(base_cls):
+        def __init__(self, stream, session=None):
+            super().__init__(stream, session)
+            stages = registry.setdefault(self.stream, {})
+            for stage in STAGES:
+                setattr(self, stage, SampleRecorder(getattr(self, stage), stages.setdefault(stage, [])))
+
+    return RecordingStreamMetrics
+
+
+# ---------------- Stub sinks ----------------
+class FakeCursor:
+    def __init__(self):
+        self.rows = 0
+        self.rowcount = 0
+        self._next_id = 0
+
+    def execute(self, query, params=None):
+        self.rows += 1
+        self.rowcount = 1
+        self._next_id += 1
+
+    def executemany(self, query, seq):
+        for params in seq:
+            self.execute(query, params)
+
+    def fetchone(self):
+        return (self._next_id,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cursor_obj = FakeCursor()
+
+    def cursor(self):
+        return self.cursor_obj
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    """Drop-in for psycopg2.pool.SimpleConnectionPool that never connects."""
+
+    def __init__(self, minconn=1, maxconn=1, **kwargs):
+        self.conn = FakeConnection()
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn):
+        pass
+
+
+def install_fake_db():
+    """Must run before the first query (ppe_query creates its pool lazily)."""
+    import psycopg2.pool
+    psycopg2.pool.SimpleConnectionPool = FakePool
+
+
+def fake_upload_to_s3(frame, frame_num, latency=0.0):
+    if latency:
+        time.sleep(latency)
+    return f"https://bench.invalid/ppe-results/frame_{frame_num}.jpg"
+
+
+# ---------------- Simulated WebSocket client ----------------
+class FakeWebSocket:
+    """
+    Async send_text() with configurable per-message slowness. Parses each
+    payload and hands it to on_message(client_id, payload, received_at).
+    """
+
+    def __init__(self, client_id, delay=0.0, jitter=0.0, on_message=None):
+        self.client_id = client_id
+        self.delay = delay
+        self.jitter = jitter
+        self.on_message = on_message
+        self.messages = 0
+        self.bytes = 0
+
+    async def send_text(self, text):
+        if self.delay or self.jitter:
+            await asyncio.sleep(self.delay + random.uniform(0, self.jitter))
+        self.messages += 1
+        self.bytes += len(text)
+        if self.on_message:
+            self.on_message(self.client_id, json.loads(text), time.perf_counter())
+
+    async def send_json(self, data):
+        await self.send_text(json.dumps(data))
+
+    async def send_bytes(self, data):
+        if self.delay or self.jitter:
+            await asyncio.sleep(self.delay + random.uniform(0, self.jitter))
+        self.messages += 1
+        self.bytes += len(data)
+
+
+class LoopThread(threading.Thread):
+    """An asyncio loop on a background thread, standing in for uvicorn's loop."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.loop = asyncio.new_event_loop()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join(timeout=5)
@@ -0,0 +1,63 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+RESOLUTIONS = ["480p", "720p", "1080p"]
+
+
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_jpeg_encode(benchmark, make_frame, resolution):
+    frame = make_frame(resolution)
+    benchmark(cv2.imencode, ".jpg", frame)
+
+
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_jpeg_decode(benchmark, make_frame, resolution):
+    _, buffer = cv2.imencode(".jpg", make_frame(resolution))
+    benchmark(cv2.imdecode, buffer, cv2.IMREAD_COLOR)
+
+
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_base64_encode(benchmark, make_frame, resolution):
+    _, buffer = cv2.imencode(".jpg", make_frame(resolution))
+    benchmark(lambda: base64.b64encode(buffer).decode("utf-8"))
+
+
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_base64_decode(benchmark, make_frame, resolution):
+    _, buffer = cv2.imencode(".jpg", make_frame(resolution))
+    encoded = base64.b64encode(buffer).decode("utf-8")
+    benchmark(lambda: np.frombuffer(base64.b64decode(encoded), np.uint8))
+
+
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_annotated_roundtrip(benchmark, make_frame, resolution):
+    """The predict_fn -> ppe_detection -> run_ppe_detection JPEG/base64 chain for one frame."""
+    frame = make_frame(resolution)
+
+    def run():
+        _, buf = cv2.imencode(".jpg", frame)
+        b64 = base64.b64encode(buf).decode("utf-8")
+        decoded = cv2.imdecode(np.frombuffer(base64.b64decode(b64), np.uint8), cv2.IMREAD_COLOR)
+        _, buf = cv2.imencode(".jpg", decoded)
+        return base64.b64encode(buf).decode("utf-8")
+
+    benchmark(run)
+
+
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_annotated_pooled(benchmark, make_frame, resolution):
+    """The same frame after the buffer-pool change: pooled canvas copy, one JPEG + base64."""
+    from src.local_models.ppe_code.buffers import BufferPool
+
+    frame = make_frame(resolution)
+    pool = BufferPool()
+
+    def run():
+        canvas = pool.copy_into("canvas", frame)
+        _, buf = cv2.imencode(".jpg", canvas)
+        return base64.b64encode(buf).decode("utf-8")
+
+    benchmark(run)
@@ -0,0 +1,30 @@
+import pytest
+
+from src.local_models.ppe_code.ppe_logic import PPELogic
+
+
+@pytest.mark.parametrize("n_persons,n_items", [
+    (0, 0), (0, 1000), (1, 6), (10, 60), (50, 300), (100, 600), (200, 1000),
+])
+@pytest.mark.parametrize("decision_cache", [True, False], ids=["cache", "nocache"])
+def bench_process_frame(benchmark, make_result, n_persons, n_items, decision_cache):
+    logic = PPELogic(decision_cache=None if decision_cache else False)
+    result = make_result(n_persons, n_items)
+    state = {"frame": 0}
+
+    def run():
+        state["frame"] += 1
+        return logic.process_frame(result, frame_num=state["frame"])
+
+    benchmark(run)
+
+
+@pytest.mark.parametrize("n_persons", [10, 100, 500])
+def bench_associate(benchmark, make_result, n_persons):
+    """PPE-to-person matching alone, three items per person."""
+    from src.local_models.ppe_code.association import associate
+    from src.local_models.ppe_code.ppe_logic import box_arrays
+
+    cls, _, xyxy, _ = box_arrays(make_result(n_persons, n_persons * 3).boxes)
+    person = cls == 5
+    benchmark(associate, xyxy[person], cls[~person], xyxy[~person])
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from src.database.ppe_query import insert_ppe_frame
+
+
+def _payload(detections, frame_b64=""):
+    return {
+        "frame_num": 20,
+        "user_id": 10,
+        "camera_id": 10,
+        "org_id": 10,
+        "time_stamp": "2026-01-01 00:00:00 UTC",
+        "detections": detections,
+        "annotated_frame": frame_b64,
+        "alert": None,
+    }
+
+
+@pytest.mark.parametrize("n_persons", [0, 10, 50, 200])
+def bench_insert_ppe_frame(benchmark, make_detections, n_persons):
+    payload = _payload(make_detections(n_persons))
+    benchmark(insert_ppe_frame, payload, "https://bench.invalid/frame.jpg")
+
+
+@pytest.mark.parametrize("n_persons", [0, 10, 50, 200])
+def bench_payload_json_dumps(benchmark, make_detections, n_persons):
+    # ~100 KB stands in for a base64 720p JPEG
+    payload = _payload(make_detections(n_persons), "A" * 100_000)
+    benchmark(json.dumps, payload)
+
+
+@pytest.mark.parametrize("n_persons", [10, 200])
+def bench_payload_safe_copy(benchmark, make_detections, n_persons):
+    """json.loads(json.dumps(payload)) done before queueing every stored frame."""
+    payload = _payload(make_detections(n_persons), "A" * 100_000)
+    benchmark(lambda: json.loads(json.dumps(payload)))
+
+
+@pytest.mark.parametrize("fmt", ["json", "msgpack"])
+@pytest.mark.parametrize("n_persons", [10, 200])
+def bench_payload_compact(benchmark, make_detections, n_persons, fmt):
+    """Steady-state compact encoding (delta frame) of the same metadata, no image."""
+    from src.utils.detection_codec import DetectionEncoder
+
+    payload = _payload(make_detections(n_persons))
+    encoder = DetectionEncoder(fmt, keyframe_interval=1_000_000)
+    encoder.encode(payload)
+    benchmark(lambda: encoder.pack(encoder.encode(payload)))
@@ -0,0 +1,107 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from benchmarks.harness import install_fake_db
+
+# ppe_query builds its pool on first query; swap in the fake before any bench runs one
+install_fake_db()
+
+PPE_NAMES = {
+    0: "boots", 1: "helmet", 2: "no boots", 3: "no helmet",
+    4: "no vest", 5: "person", 6: "vest",
+}
+
+RESOLUTIONS = {"480p": (480, 854), "720p": (720, 1280), "1080p": (1080, 1920)}
+
+
+# ---------------- Synthetic ultralytics Results ----------------
+class FakeBox:
+    __slots__ = ("cls", "conf", "xyxy", "id")
+
+    def __init__(self, cls_id, conf, xyxy, track_id=None):
+        self.cls = np.array([cls_id], dtype=np.float32)
+        self.conf = np.array([conf], dtype=np.float32)
+        self.xyxy = np.array([xyxy], dtype=np.float32)
+        self.id = np.array([track_id], dtype=np.float32) if track_id is not None else None
+
+
+class FakeResult:
+    """Just enough of ultralytics.engine.results.Results for PPELogic.process_frame."""
+
+    def __init__(self, orig_img, boxes):
+        self.orig_img = orig_img
+        self.boxes = boxes
+        self.names = PPE_NAMES
+
+
+def synthetic_result(n_persons, n_items, shape=(720, 1280), seed=0):
+    """n_persons tracked people with n_items PPE boxes spread over them (or the frame)."""
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    boxes = []
+    persons = []
+    for pid in range(n_persons):
+        pw, ph = rng.integers(30, 120), rng.integers(80, 300)
+        x1, y1 = rng.integers(0, w - pw), rng.integers(0, h - ph)
+        persons.append((x1, y1, x1 + pw, y1 + ph))
+        boxes.append(FakeBox(5, float(rng.uniform(0.6, 0.99)), (x1, y1, x1 + pw, y1 + ph), pid + 1))
+
+    item_classes = (0, 1, 2, 3, 4, 6)
+    for i in range(n_items):
+        cls_id = item_classes[i % len(item_classes)]
+        if persons:
+            px1, py1, px2, py2 = persons[i % len(persons)]
+            iw, ih = max(4, (px2 - px1) // 3), max(4, (py2 - py1) // 6)
+            x1 = int(rng.integers(px1 + 1, max(px1 + 2, px2 - iw - 1)))
+            y1 = int(rng.integers(py1 + 1, max(py1 + 2, py2 - ih - 1)))
+        else:
+            iw, ih = 20, 20
+            x1, y1 = int(rng.integers(0, w - iw)), int(rng.integers(0, h - ih))
+        boxes.append(FakeBox(cls_id, float(rng.uniform(0.5, 0.99)), (x1, y1, x1 + iw, y1 + ih)))
+
+    img = rng.integers(0, 255, size=(h, w, 3), dtype=np.uint8)
+    return FakeResult(img, boxes)
+
+
+def synthetic_frame(resolution, seed=0):
+    """Smooth-ish image so JPEG sizes resemble camera frames rather than noise."""
+    h, w = RESOLUTIONS[resolution]
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, size=(h // 16, w // 16, 3), dtype=np.uint8)
+    import cv2
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def synthetic_detections(n_persons, seed=0):
+    rng = np.random.default_rng(seed)
+    out = []
+    for pid in range(n_persons):
+        x1, y1 = int(rng.integers(0, 1100)), int(rng.integers(0, 500))
+        out.append({
+            "person_id": pid + 1,
+            "avg_scores": {"helmet": 0.9, "no helmet": 0.1, "vest": 0.8, "no vest": 0.2,
+                           "boots": 0.7, "no boots": 0.3, "person": 1.0},
+            "ppe_status": {"boots": "yes", "helmet": "yes", "vest": "yes"},
+            "bbox": [x1, y1, x1 + 80, y1 + 200],
+        })
+    return out
+
+
+@pytest.fixture
+def make_result():
+    return synthetic_result
+
+
+@pytest.fixture
+def make_frame():
+    return synthetic_frame
+
+
+@pytest.fixture
+def make_detections():
+    return synthetic_detections
@@ -0,0 +1,148 @@
+"""
+Replay benchmark: speed and behavior on a recorded camera.
+
+Plays a recording (python -m src.utils.frame_replay, or "record": true on a
+live stream) through the real run_ppe_detection path with S3 / Postgres
+stubbed out, writes the per-frame detection log and, given a baseline log,
+checks that detections and alerts are unchanged:
+
+    python -m benchmarks.replay /tmp/ppe_recordings/Cam424-20260101-120000 \\
+        --log before.jsonl
+    # ... change the code ...
+    python -m benchmarks.replay /tmp/ppe_recordings/Cam424-20260101-120000 \\
+        --log after.jsonl --compare before.jsonl
+
+Frames are fed as fast as they are processed unless --realtime is given;
+alerts and rollups run on the recorded timestamps either way. Track IDs are
+numbered per stream, so two runs on the same build, weights and device give
+identical logs (GPU kernels may still differ across devices / drivers).
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.harness import (
+    FakeWebSocket,
+    LoopThread,
+    fake_upload_to_s3,
+    install_fake_db,
+    percentiles,
+    recording_stream_metrics,
+)
+
+
+def run(args):
+    install_fake_db()
+    os.environ.setdefault("PPE_ALERT_DB", "0")
+
+    import src.websocket.ppe_w_local1 as pipeline
+    from src.models.ppe_local import ppe_registry
+    from src.utils.frame_replay import ReplaySource, compare_logs
+
+    pipeline.upload_to_s3 = lambda frame, frame_num: fake_upload_to_s3(frame, frame_num, 0.0)
+    pipeline.insert_ppe_frames_bulk = lambda rows: len(rows)
+    pipeline.insert_compliance_rollups = lambda rows: len(rows)
+    import src.store_s3.ppe_store as ppe_store
+    ppe_store.upload_clip_to_s3 = lambda path, camera_id, alert_id: f"https://bench.invalid/ppe-clips/{alert_id}.mp4"
+
+    stage_samples = {}
+    pipeline.StreamMetrics = recording_stream_metrics(pipeline.StreamMetrics, stage_samples)
+
+    recording = os.path.abspath(args.recording)
+    source = ReplaySource(recording)
+    frames_recorded = len(source)
+    meta = source.meta
+    source.release()
+
+    ppe_registry.load()
+
+    url = f"replay://{recording}"
+    if args.realtime:
+        url += f"?realtime=1&speed={args.speed}"
+    config = dict(args.stream_config, detection_log=args.log, clock="source")
+
+    loop_thread = LoopThread()
+    loop_thread.start()
+    client_id = "replay-0"
+    ws = FakeWebSocket(client_id, 0.0, 0.0, lambda *a: None)
+    sessions = {client_id: {"ws": ws, "streaming": True, "inference_tasks": [], "config": config}}
+    storage_executor = ThreadPoolExecutor(max_workers=1)
+
+    started = time.perf_counter()
+    worker = threading.Thread(
+        target=pipeline.run_ppe_detection,
+        args=(client_id, url, args.camera_id, 0, 0, sessions, loop_thread.loop, storage_executor),
+    )
+    worker.start()
+    worker.join()
+    elapsed = time.perf_counter() - started
+
+    time.sleep(0.2)   # let in-flight sends drain
+    loop_thread.stop()
+    storage_executor.shutdown(wait=True)
+
+    with open(args.log) as f:
+        # The last line may hold the stream-stopped alert events (frame_num null)
+        frames = sum(1 for line in f if json.loads(line)["frame_num"] is not None)
+    stages = {}
+    for per_stream in stage_samples.values():
+        for stage, values in per_stream.items():
+            stages.setdefault(stage, []).extend(values)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "recording": recording,
+            "recording_source": meta.get("source"),
+            "frames_recorded": frames_recorded,
+            "realtime": args.realtime,
+            "stream_config": args.stream_config,
+        },
+        "model": ppe_registry.status(),
+        "frames": frames,
+        "duration_s": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed else 0.0,
+        "stages": {stage: percentiles(v) for stage, v in stages.items() if v},
+        "log": os.path.abspath(args.log),
+    }
+    if args.compare:
+        report["comparison"] = compare_logs(args.compare, args.log)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded camera through the PPE pipeline")
+    parser.add_argument("recording", help="Recording directory (src.utils.frame_replay)")
+    parser.add_argument("--log", default="replay_detections.jsonl", help="Detection log to write")
+    parser.add_argument("--compare", help="Baseline detection log to diff against")
+    parser.add_argument("--realtime", action="store_true", help="Pace frames by their recorded timestamps")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed with --realtime")
+    parser.add_argument("--camera-id", type=int, default=0, help="Camera whose stored rules apply")
+    parser.add_argument("--stream-config", type=json.loads, default={}, help="start_stream options as JSON")
+    parser.add_argument("--out", default="replay_results.json")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"[replay] {report['frames']} frames in {report['duration_s']} s, {report['fps']} FPS -> {args.out}")
+    comparison = report.get("comparison")
+    if comparison is not None:
+        if comparison["identical"]:
+            print(f"[replay] identical to {args.compare} ({comparison['frames_compared']} frames)")
+        else:
+            print(f"[replay] {comparison['differing_frames']} frames differ from {args.compare}, "
+                  f"first at frame {comparison['first_difference']}; extra frames {comparison['extra_frames']}")
+            sys.exit(1)
@@ -0,0 +1,30 @@
+# Multi-worker deployment:
+#   gunicorn app:app -c gunicorn.conf.py
+#
+# The master loads the PPE weights once and then forks the workers, so every
+# worker shares the same read-only weight pages (copy-on-write) instead of
+# paying the load and memory cost again. CUDA contexts do not survive fork,
+# so on GPU hosts each worker loads lazily in its own lifespan instead.
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# The app itself is imported after fork (per-worker DB pools / boto3 clients);
+# only the model module is imported and loaded in the master.
+preload_app = False
+
+
+def on_starting(server):
+    import torch
+    from src.models.ppe_local import ppe_registry
+
+    if torch.cuda.is_available():
+        server.log.info("CUDA available; workers will load the PPE model after fork")
+        return
+
+    # Warm-up starts thread pools / ORT sessions, which must not be inherited
+    # across fork; each worker warms the shared weights in its lifespan.
+    ppe_registry.load(freeze=True, warmup=False)
+    server.log.info(f"PPE model preloaded in master: {ppe_registry.status()}")
@@ -0,0 +1,374 @@
+import os
+import json
+import time
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+import urllib.request
+from urllib.parse import urlparse
+
+logger = logging.getLogger("alerts")
+logger.setLevel(logging.INFO)
+
+PPE_ITEMS = ("helmet", "vest", "boots")
+
+DEFAULT_ALERT_CONFIG = {
+    "fire_after": 3.0,      # seconds a violation must persist before an alert fires
+    "clear_after": 5.0,     # seconds of compliance before an active alert clears
+    "lost_after": 2.0,      # seconds a track may be missing before its alert is orphaned
+    "dedup_window": 10.0,   # seconds an orphaned alert can be adopted by a new track ID
+    "dedup_iou": 0.3,       # bbox IoU for a new track to adopt an orphaned alert
+}
+
+# URLs a start_stream may name as its "alert_webhook" (comma separated; empty = none).
+# The server POSTs to that URL, so a client must never be able to pick an arbitrary host.
+STREAM_WEBHOOKS = frozenset(u.strip() for u in os.getenv("PPE_STREAM_WEBHOOKS", "").split(",") if u.strip())
+
+
+def validate_alert_config(cfg):
+    """Raise ValueError for alert options AlertTracker cannot use; returns them normalized."""
+    if cfg is not None and not isinstance(cfg, dict):
+        raise ValueError("alerts must be an object")
+    opts = dict(DEFAULT_ALERT_CONFIG)
+    opts.update({k: v for k, v in (cfg or {}).items() if k in DEFAULT_ALERT_CONFIG})
+    try:
+        opts = {k: float(v) for k, v in opts.items()}
+    except (TypeError, ValueError):
+        raise ValueError("alert values must be numbers")
+    if min(opts.values()) < 0 or opts["dedup_iou"] > 1.0:
+        raise ValueError("alert timings must be non-negative and dedup_iou within [0, 1]")
+    return opts
+
+
+def _iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+# -------------------------------------------------------------------------------
+# Hysteresis + de-duplication (one per stream)
+# -------------------------------------------------------------------------------
+
+class AlertTracker:
+    """
+    Turns per-frame PPE status into alert events.
+
+    A violation must hold for fire_after seconds before an alert fires and
+    compliance must hold for clear_after seconds before it clears, so a single
+    noisy frame never toggles anything. When ByteTrack hands a person a new
+    ID, an alert orphaned by the old ID nearby is adopted instead of firing a
+    duplicate.
+    """
+
+    def __init__(self, camera_id, user_id=None, org_id=None, config=None):
+        self.camera_id = camera_id
+        self.user_id = user_id
+        self.org_id = org_id
+        self.config = dict(DEFAULT_ALERT_CONFIG)
+        if isinstance(config, dict):
+            self.config.update({k: v for k, v in config.items() if k in DEFAULT_ALERT_CONFIG})
+
+        self.tracks = {}     # pid -> per-track state
+        self.orphans = []    # alerts whose track disappeared, adoptable by a new ID
+
+    def _event(self, kind, alert, now, **extra):
+        event = {
+            "type": "ppe_alert",
+            "event": kind,
+            "alert_id": alert["alert_id"],
+            "camera_id": self.camera_id,
+            "user_id": self.user_id,
+            "org_id": self.org_id,
+            "person_id": alert["person_id"],
+            "missing": list(alert["missing"]),
+            "bbox": alert["bbox"],
+            "started_at": alert["started_at"],
+            "time": now,
+        }
+        event.update(extra)
+        return event
+
+    def _adopt_orphan(self, missing, bbox, now):
+        best, best_iou = None, self.config["dedup_iou"]
+        for orphan in self.orphans:
+            if now - orphan["lost_at"] > self.config["dedup_window"]:
+                continue
+            if not (set(missing) & set(orphan["missing"])):
+                continue
+            iou = _iou(bbox, orphan["bbox"])
+            if iou >= best_iou:
+                best, best_iou = orphan, iou
+        if best is not None:
+            self.orphans.remove(best)
+        return best
+
+    def update(self, detections, now, frame_num=None):
+        """Feed one frame's detections; returns the list of alert events it produced."""
+        cfg = self.config
+        events = []
+        seen = set()
+
+        for det in detections:
+            pid = det["person_id"]
+            if pid == -1:
+                continue
+            seen.add(pid)
+            status = det["ppe_status"]
+            missing = tuple(item for item in PPE_ITEMS if status.get(item) == "no")
+            bbox = det["bbox"]
+
+            t = self.tracks.get(pid)
+            if t is None:
+                t = self.tracks[pid] = {
+                    "violation_since": None, "compliant_since": None, "alert": None,
+                }
+            t["last_seen"] = now
+            t["bbox"] = bbox
+
+            if missing:
+                t["compliant_since"] = None
+                if t["violation_since"] is None:
+                    t["violation_since"] = now
+                alert = t["alert"]
+
+                if alert is None and now - t["violation_since"] >= cfg["fire_after"]:
+                    orphan = self._adopt_orphan(missing, bbox, now)
+                    if orphan is not None:
+                        # Same person, new track ID: continue the existing alert silently
+                        alert = orphan
+                        alert["person_id"] = pid
+                        logger.info(f"[{self.camera_id}] Alert {alert['alert_id']} moved to track {pid}")
+                    else:
+                        alert = {
+                            "alert_id": uuid.uuid4().hex,
+                            "person_id": pid,
+                            "started_at": t["violation_since"],
+                        }
+                        alert["missing"] = missing
+                        alert["bbox"] = bbox
+                        events.append(self._event("fired", alert, now, ppe_status=status, frame_num=frame_num))
+                    t["alert"] = alert
+
+                if alert is not None:
+                    alert["bbox"] = bbox
+                    if set(missing) != set(alert["missing"]):
+                        alert["missing"] = missing
+                        events.append(self._event("updated", alert, now, ppe_status=status, frame_num=frame_num))
+            else:
+                t["violation_since"] = None
+                if t["alert"] is not None:
+                    if t["compliant_since"] is None:
+                        t["compliant_since"] = now
+                    elif now - t["compliant_since"] >= cfg["clear_after"]:
+                        events.append(self._event("cleared", t["alert"], now, frame_num=frame_num))
+                        t["alert"] = None
+                        t["compliant_since"] = None
+
+        # Tracks that disappeared: orphan their alert for possible adoption
+        for pid in [p for p, t in self.tracks.items() if p not in seen and now - t["last_seen"] > cfg["lost_after"]]:
+            t = self.tracks.pop(pid)
+            if t["alert"] is not None:
+                orphan = t["alert"]
+                orphan["lost_at"] = now
+                orphan["bbox"] = t["bbox"]
+                self.orphans.append(orphan)
+
+        # Orphans nobody adopted are closed
+        expired = [o for o in self.orphans if now - o["lost_at"] > cfg["dedup_window"]]
+        for orphan in expired:
+            self.orphans.remove(orphan)
+            events.append(self._event("cleared", orphan, now, reason="lost", frame_num=frame_num))
+
+        return events
+
+    def close(self, now):
+        """Clear every open alert (stream stopped)."""
+        events = []
+        for t in self.tracks.values():
+            if t["alert"] is not None:
+                events.append(self._event("cleared", t["alert"], now, reason="stream_stopped"))
+        for orphan in self.orphans:
+            events.append(self._event("cleared", orphan, now, reason="stream_stopped"))
+        self.tracks.clear()
+        self.orphans = []
+        return events
+
+
+# -------------------------------------------------------------------------------
+# Fan-out: each sink owns a bounded queue and a worker thread
+# -------------------------------------------------------------------------------
+
+class QueueSink:
+    """Non-blocking offer(); a slow or failing sink only ever fills its own queue."""
+
+    def __init__(self, name, maxsize=1000):
+        self.name = name
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name=f"alert-sink-{name}", daemon=True)
+        self._thread.start()
+
+    def offer(self, event, raised=None):
+        """raised: time.monotonic() when the event was published (delivery latency is measured from it)."""
+        try:
+            self.queue.put_nowait((event, time.monotonic() if raised is None else raised))
+        except queue.Full:
+            self.dropped += 1
+            _count_drop(self.name)
+            logger.warning(f"[{self.name}] Alert queue full; dropped {event['event']} {event['alert_id']}")
+
+    def deliver(self, event):
+        raise NotImplementedError
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            event, raised = item
+            try:
+                self.deliver(event)
+                _observe_delivery(self.name, raised)
+            except Exception as e:
+                logger.error(f"[{self.name}] Failed to deliver alert {event['alert_id']}: {e}")
+
+    def close(self, timeout=5):
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=timeout)
+
+
+class WebSocketSink(QueueSink):
+    """
+    Sends alert events as their own messages to every current viewer of the
+    stream (the live subscriber dict, so viewers joining later get alerts too).
+    """
+
+    def __init__(self, subscribers, name="websocket", maxsize=200, send_timeout=5.0):
+        self.subscribers = subscribers
+        self.send_timeout = send_timeout
+        super().__init__(name, maxsize)
+
+    def deliver(self, event):
+        # Each viewer gets the event under its own user / org IDs (shared pipelines stamp the first viewer's)
+        texts = {}
+        futures = []
+        for sub in list(self.subscribers.values()):
+            if sub.ws is None or not sub.render["alerts"]:
+                continue
+            ids = (sub.user_id, sub.camera_id, sub.org_id)
+            if ids not in texts:
+                texts[ids] = json.dumps(dict(event, user_id=sub.user_id, camera_id=sub.camera_id, org_id=sub.org_id))
+            futures.append(asyncio.run_coroutine_threadsafe(sub.ws.send_text(texts[ids]), sub.loop))
+        for future in futures:
+            future.result(timeout=self.send_timeout)
+
+
+class DatabaseSink(QueueSink):
+    """Writes fired alerts to ppe_alerts and closes them on clear."""
+
+    def __init__(self, name="database", maxsize=5000):
+        super().__init__(name, maxsize)
+
+    def deliver(self, event):
+        from src.database.ppe_query import insert_ppe_alert, close_ppe_alert
+
+        if event["event"] == "fired":
+            insert_ppe_alert(event)
+        elif event["event"] == "cleared":
+            close_ppe_alert(event["alert_id"], event["time"], event.get("reason"))
+
+
+class WebhookSink(QueueSink):
+    """POSTs each alert event as JSON, retrying with backoff."""
+
+    def __init__(self, url, name="webhook", maxsize=1000, timeout=5.0, retries=3):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        super().__init__(name, maxsize)
+
+    def deliver(self, event):
+        body = json.dumps(event).encode("utf-8")
+        for attempt in range(self.retries):
+            try:
+                req = urllib.request.Request(
+                    self.url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+                )
+                with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                    resp.read()
+                return
+            except Exception:
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+
+
+def validate_webhook(url):
+    """Raise ValueError unless url is an http(s) URL listed in PPE_STREAM_WEBHOOKS."""
+    if url is None:
+        return None
+    if not isinstance(url, str) or urlparse(url.strip()).scheme not in ("http", "https"):
+        raise ValueError("alert_webhook must be an http(s) URL")
+    if url.strip() not in STREAM_WEBHOOKS:
+        raise ValueError("alert_webhook is not in this server's PPE_STREAM_WEBHOOKS allow-list")
+    return url.strip()
+
+
+class AlertDispatcher:
+    """Fans each alert event out to every sink without blocking the caller."""
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+
+    def publish(self, event):
+        # event["time"] may be a recording's source time: latency uses the monotonic clock
+        raised = time.monotonic()
+        for sink in self.sinks:
+            sink.offer(event, raised)
+
+
+def _observe_delivery(sink_name, raised):
+    from src.utils.metrics import ALERT_DELIVERY
+    ALERT_DELIVERY.labels(sink_name).observe(max(0.0, time.monotonic() - raised))
+
+
+def _count_drop(sink_name):
+    from src.utils.metrics import ALERTS_DROPPED
+    ALERTS_DROPPED.labels(sink_name).inc()
+
+
+# -------------------------------------------------------------------------------
+# Process-wide sinks
+# -------------------------------------------------------------------------------
+
+_shared_sinks = None
+_shared_lock = threading.Lock()
+
+
+def shared_sinks():
+    """
+    DB sink plus one webhook sink per URL in PPE_ALERT_WEBHOOKS (comma
+    separated), created once per process and shared by every stream.
+    """
+    global _shared_sinks
+    with _shared_lock:
+        if _shared_sinks is None:
+            sinks = []
+            if os.getenv("PPE_ALERT_DB", "1") == "1":
+                sinks.append(DatabaseSink())
+            for i, url in enumerate(u.strip() for u in os.getenv("PPE_ALERT_WEBHOOKS", "").split(",")):
+                if url:
+                    sinks.append(WebhookSink(url, name=f"webhook-{i}"))
+            _shared_sinks = sinks
+        return list(_shared_sinks)
@@ -0,0 +1,124 @@
+import os
+import uuid
+
+from src.local_models.ppe_code.ppe_rules import PPE_ITEMS
+
+# ---------- Defaults ----------
+DEFAULT_ROLLUP = {
+    "bucket": 60,           # seconds per rollup row
+    # A frame stands for the time since the previous one, capped here so a
+    # stall or reconnect is not credited as seconds of (non-)compliance
+    "max_gap": float(os.getenv("PPE_ROLLUP_MAX_GAP", 2.0)),
+}
+
+
+# -------------------------------------------------------------------------------
+# Per-camera compliance rollups
+#
+# Every analyzed frame is folded into the bucket (minute) it falls in:
+#   persons                      distinct track ids seen
+#   person_seconds               time persons were in view
+#   <item>_ok / _missing_seconds time persons were judged wearing / missing it
+#   alerts                       alerts fired
+# Only items the camera's rules check contribute; out-of-zone persons count
+# as seen but not as (non-)compliant. Closed buckets are drained as rows for
+# the ppe_compliance_minute table, keyed by (camera_id, minute, run_id) so a
+# replayed flush overwrites instead of double counting.
+# -------------------------------------------------------------------------------
+
+class _Bucket:
+    __slots__ = ("start", "frames", "persons", "person_seconds", "ok", "missing", "alerts")
+
+    def __init__(self, start):
+        self.start = start
+        self.frames = 0
+        self.persons = set()
+        self.person_seconds = 0.0
+        self.ok = dict.fromkeys(PPE_ITEMS, 0.0)
+        self.missing = dict.fromkeys(PPE_ITEMS, 0.0)
+        self.alerts = 0
+
+
+class ComplianceRollup:
+    """Accumulates one stream's per-minute rollups in memory (detection thread only)."""
+
+    def __init__(self, camera_id, user_id, org_id, frame_interval=1 / 30, cfg=None):
+        self.camera_id = camera_id
+        self.user_id = user_id
+        self.org_id = org_id
+        self.run_id = uuid.uuid4().hex[:12]
+        self.cfg = dict(DEFAULT_ROLLUP, **(cfg or {}))
+        self.frame_interval = frame_interval
+        self._buckets = {}          # bucket start (epoch s) -> _Bucket
+        self._current = None
+        self._last = None
+        self._drained = float("-inf")   # buckets before this have been emitted
+
+    def _bucket(self, now):
+        # A sample from an already drained minute (clock stepped back, late alert) goes to
+        # the oldest open one: re-creating a drained bucket would reissue its row key
+        start = int(max(now, self._drained) // self.cfg["bucket"]) * self.cfg["bucket"]
+        bucket = self._buckets.get(start)
+        if bucket is None:
+            bucket = self._buckets[start] = _Bucket(start)
+        return bucket
+
+    def update(self, detections, now):
+        """Fold one analyzed frame's detections (ppe_status per person) in."""
+        dt = self.frame_interval if self._last is None else now - self._last
+        if not 0 < dt <= self.cfg["max_gap"]:
+            dt = self.frame_interval
+        self._last = now
+
+        bucket = self._current
+        if bucket is None or not bucket.start <= max(now, self._drained) < bucket.start + self.cfg["bucket"]:
+            bucket = self._current = self._bucket(now)
+        bucket.frames += 1
+        for det in detections:
+            if det["person_id"] != -1:
+                bucket.persons.add(det["person_id"])
+            bucket.person_seconds += dt
+            for item, value in det.get("ppe_status", {}).items():
+                if value == "yes":
+                    bucket.ok[item] += dt
+                elif value == "no":
+                    bucket.missing[item] += dt
+
+    def count_alerts(self, events):
+        for event in events or ():
+            if event["event"] == "fired":
+                self._bucket(event["time"]).alerts += 1
+
+    def drain(self, now=None, final=False):
+        """Rows for buckets that have closed (all of them when final)."""
+        if not self._buckets:
+            return []
+        if final:
+            cutoff = float("inf")
+        else:
+            now = now if now is not None else (self._last or 0.0)
+            cutoff = int(now // self.cfg["bucket"]) * self.cfg["bucket"]
+            self._drained = max(self._drained, cutoff)
+        done = [start for start in self._buckets if start < cutoff]
+        rows = [self._row(self._buckets.pop(start)) for start in sorted(done)]
+        if self._current is not None and self._current.start not in self._buckets:
+            self._current = None
+        return rows
+
+    def _row(self, bucket):
+        row = {
+            "kind": "rollup",
+            "camera_id": self.camera_id,
+            "user_id": self.user_id,
+            "org_id": self.org_id,
+            "minute": bucket.start,
+            "run_id": self.run_id,
+            "frames": bucket.frames,
+            "persons": len(bucket.persons),
+            "person_seconds": round(bucket.person_seconds, 3),
+            "alerts": bucket.alerts,
+        }
+        for item in PPE_ITEMS:
+            row[f"{item}_ok_seconds"] = round(bucket.ok[item], 3)
+            row[f"{item}_missing_seconds"] = round(bucket.missing[item], 3)
+        return row
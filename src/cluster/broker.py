@@ -0,0 +1,142 @@
+import os
+import json
+import queue
+import logging
+import threading
+
+logger = logging.getLogger("cluster")
+logger.setLevel(logging.INFO)
+
+BROKER_URL = os.getenv("PPE_BROKER_URL", "memory://")
+
+# ---------- Channels ----------
+NODES_CHANNEL = "ppe:nodes"             # node heartbeats / leave notices
+
+
+def node_channel(node_id):
+    """Commands (start / stop) for one inference node."""
+    return f"ppe:node:{node_id}"
+
+
+def results_channel(gateway_id):
+    """Frames, alerts and job status flowing back to one gateway."""
+    return f"ppe:results:{gateway_id}"
+
+
+# -------------------------------------------------------------------------------
+# Broker interface
+# -------------------------------------------------------------------------------
+
+class Subscription:
+    def get(self, timeout=None):
+        """Next message dict, or None if nothing arrived within timeout."""
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class Broker:
+    """
+    Fire-and-forget pub/sub between the gateway and the inference nodes.
+    Messages are JSON-serialisable dicts; a message published while nobody is
+    subscribed is lost, which the gateway's heartbeat failover covers.
+    """
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+
+# ---------- In-process (tests, single-host) ----------
+class _QueueSubscription(Subscription):
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+
+class InProcessBroker(Broker):
+    """Queues in one process; messages go through JSON so behaviour matches Redis."""
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._subs = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        data = json.dumps(message)
+        with self._lock:
+            subs = list(self._subs.get(channel, ()))
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(json.loads(data))
+            except queue.Full:
+                logger.warning(f"Subscriber queue full on {channel}; message dropped")
+
+    def subscribe(self, channel):
+        sub = _QueueSubscription(self, channel, self.maxsize)
+        with self._lock:
+            self._subs.setdefault(channel, set()).add(sub)
+        return sub
+
+    def _unsubscribe(self, sub):
+        with self._lock:
+            self._subs.get(sub.channel, set()).discard(sub)
+
+
+# ---------- Redis ----------
+class _RedisSubscription(Subscription):
+    def __init__(self, client, channel):
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(channel)
+
+    def get(self, timeout=None):
+        message = self.pubsub.get_message(timeout=timeout or 0)
+        if message is None:
+            return None
+        return json.loads(message["data"])
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisBroker(Broker):
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message))
+
+    def subscribe(self, channel):
+        return _RedisSubscription(self.client, channel)
+
+
+_memory_broker = None
+_memory_lock = threading.Lock()
+
+
+def get_broker(url=None):
+    """memory:// -> process-wide InProcessBroker; redis://... -> RedisBroker."""
+    global _memory_broker
+    url = url or BROKER_URL
+    if url.startswith("memory://"):
+        with _memory_lock:
+            if _memory_broker is None:
+                _memory_broker = InProcessBroker()
+            return _memory_broker
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    raise ValueError(f"Unsupported broker URL: {url}")
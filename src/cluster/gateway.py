@@ -0,0 +1,217 @@
+import os
+import time
+import uuid
+import base64
+import asyncio
+import logging
+import threading
+
+from src.cluster.broker import NODES_CHANNEL, node_channel, results_channel
+from src.cluster.hash_ring import HashRing
+
+logger = logging.getLogger("cluster")
+logger.setLevel(logging.INFO)
+
+HEARTBEAT_INTERVAL = float(os.getenv("PPE_HEARTBEAT_INTERVAL", 1.0))
+# A node missing heartbeats this long is declared dead and its cameras restarted elsewhere
+NODE_TIMEOUT = float(os.getenv("PPE_NODE_TIMEOUT", 3.0))
+
+
+class Gateway:
+    """
+    Owns the client WebSockets and places stream jobs on inference nodes.
+
+    Placement is a consistent hash of the stream name over the live nodes.
+    Nodes announce themselves with heartbeats on NODES_CHANNEL; a join or
+    leave rebalances only the jobs whose owner changed, and a node that goes
+    quiet for NODE_TIMEOUT has its jobs restarted on the surviving nodes.
+    Every (re)start bumps the job's epoch so late messages from a previous
+    placement are ignored.
+    """
+
+    def __init__(self, broker, gateway_id=None):
+        self.broker = broker
+        self.gateway_id = gateway_id or os.getenv("PPE_GATEWAY_ID") or f"gw-{uuid.uuid4().hex[:8]}"
+        self.ring = HashRing()
+        self.nodes = {}         # node_id -> {"last_seen", "streams", "capacity"}
+        self.jobs = {}          # job_id -> {"job", "node", "epoch", "ws", "loop"}
+        self._lock = threading.RLock()
+        self._running = False
+        self._threads = []
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        self._running = True
+        self._nodes_sub = self.broker.subscribe(NODES_CHANNEL)
+        self._results_sub = self.broker.subscribe(results_channel(self.gateway_id))
+        for target, name in ((self._membership_loop, "gateway-membership"), (self._results_loop, "gateway-results")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info(f"Gateway {self.gateway_id} started")
+
+    def stop(self):
+        self._running = False
+        with self._lock:
+            for job_id in list(self.jobs):
+                self.stop_job(job_id)
+        for t in self._threads:
+            t.join(timeout=HEARTBEAT_INTERVAL * 2)
+        self._nodes_sub.close()
+        self._results_sub.close()
+
+    # ---------- Jobs ----------
+    def start_job(self, job_id, job, ws, loop):
+        """job: stream_name, region, camera_id, user_id, org_id, config."""
+        with self._lock:
+            if job_id in self.jobs:
+                self.stop_job(job_id)
+            self.jobs[job_id] = {"job": job, "node": None, "epoch": 0, "ws": ws, "loop": loop}
+            self._place(job_id)
+            if self.jobs[job_id]["node"] is None:
+                logger.warning(f"[{job_id}] No inference nodes available; job queued")
+                self._notify(self.jobs[job_id], {"status": "queued"})
+
+    def stop_job(self, job_id):
+        with self._lock:
+            entry = self.jobs.pop(job_id, None)
+            if entry and entry["node"]:
+                self.broker.publish(node_channel(entry["node"]), {
+                    "type": "stop", "job_id": job_id, "epoch": entry["epoch"]
+                })
+
+    def update_rules(self, job_id, rules):
+        """Push new PPE rules to the job's node; False if the job is unknown."""
+        with self._lock:
+            entry = self.jobs.get(job_id)
+            if entry is None:
+                return False
+            entry["job"]["config"] = dict(entry["job"].get("config") or {}, rules=rules)
+            if entry["node"]:
+                self.broker.publish(node_channel(entry["node"]), {
+                    "type": "rules", "job_id": job_id, "epoch": entry["epoch"], "rules": rules
+                })
+            return True
+
+    def _place(self, job_id):
+        entry = self.jobs[job_id]
+        node = self.ring.get(str(entry["job"]["stream_name"]))
+        if node == entry["node"]:
+            return
+        previous = entry["node"]
+        if previous and previous in self.nodes:
+            self.broker.publish(node_channel(previous), {
+                "type": "stop", "job_id": job_id, "epoch": entry["epoch"]
+            })
+
+        entry["node"] = node
+        entry["epoch"] += 1
+        if node is None:
+            logger.warning(f"[{job_id}] No inference nodes available; job queued")
+            self._notify(entry, {"status": "queued"})
+            return
+
+        self.broker.publish(node_channel(node), {
+            "type": "start",
+            "job_id": job_id,
+            "epoch": entry["epoch"],
+            "gateway": self.gateway_id,
+            "job": entry["job"],
+        })
+        logger.info(f"[{job_id}] Placed on {node} (epoch {entry['epoch']}, previous {previous})")
+        self._notify(entry, {"status": "placed", "node": node})
+
+    def _rebalance(self):
+        with self._lock:
+            for job_id in list(self.jobs):
+                self._place(job_id)
+
+    # ---------- Membership ----------
+    def _membership_loop(self):
+        while self._running:
+            msg = self._nodes_sub.get(timeout=HEARTBEAT_INTERVAL)
+            if msg:
+                self._on_node_message(msg)
+            self._expire_nodes()
+
+    def _on_node_message(self, msg):
+        node_id = msg.get("node_id")
+        if not node_id:
+            return
+        with self._lock:
+            if msg.get("type") == "leave":
+                self._drop_node(node_id, "left")
+                return
+            joined = node_id not in self.nodes
+            self.nodes[node_id] = {
+                "last_seen": time.monotonic(),
+                "streams": msg.get("streams", 0),
+                "capacity": msg.get("capacity"),
+            }
+            if joined:
+                logger.info(f"Node {node_id} joined")
+                self.ring.add(node_id)
+                self._rebalance()
+
+    def _expire_nodes(self):
+        now = time.monotonic()
+        with self._lock:
+            for node_id, info in list(self.nodes.items()):
+                if now - info["last_seen"] > NODE_TIMEOUT:
+                    self._drop_node(node_id, f"missed heartbeats for {NODE_TIMEOUT}s")
+
+    def _drop_node(self, node_id, reason):
+        if node_id not in self.nodes:
+            return
+        logger.warning(f"Node {node_id} removed ({reason}); failing over its streams")
+        del self.nodes[node_id]
+        self.ring.remove(node_id)
+        for entry in self.jobs.values():
+            if entry["node"] == node_id:
+                entry["node"] = None    # no stop message: the node is gone
+        self._rebalance()
+
+    # ---------- Results ----------
+    def _results_loop(self):
+        while self._running:
+            msg = self._results_sub.get(timeout=HEARTBEAT_INTERVAL)
+            if not msg:
+                continue
+            job_id = msg.get("job_id")
+            with self._lock:
+                entry = self.jobs.get(job_id)
+                if entry is None or msg.get("epoch") != entry["epoch"]:
+                    continue    # stale placement
+                if msg.get("type") == "ended":
+                    del self.jobs[job_id]
+            if msg.get("type") == "frame":
+                self._send(entry, base64.b64decode(msg["bytes"]) if "bytes" in msg else msg["text"])
+            elif msg.get("type") == "ended":
+                logger.info(f"[{job_id}] Stream ended on {msg.get('node_id')}")
+                self._notify(entry, {"status": "ended", "node": msg.get("node_id")})
+
+    def _notify(self, entry, status):
+        job = entry["job"]
+        status.update(type="stream_status", camera_id=job.get("camera_id"))
+        try:
+            asyncio.run_coroutine_threadsafe(entry["ws"].send_json(status), entry["loop"])
+        except RuntimeError:
+            pass    # loop closed; client already gone
+
+    def _send(self, entry, data):
+        ws = entry["ws"]
+        try:
+            send = ws.send_bytes(data) if isinstance(data, bytes) else ws.send_text(data)
+            asyncio.run_coroutine_threadsafe(send, entry["loop"])
+        except RuntimeError:
+            pass
+
+    def status(self):
+        with self._lock:
+            return {
+                "gateway_id": self.gateway_id,
+                "nodes": {n: dict(info, last_seen_ago=round(time.monotonic() - info["last_seen"], 2))
+                          for n, info in self.nodes.items()},
+                "jobs": {j: {"node": e["node"], "epoch": e["epoch"], "stream_name": e["job"]["stream_name"]}
+                         for j, e in self.jobs.items()},
+            }
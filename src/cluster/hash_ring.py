@@ -0,0 +1,53 @@
+import bisect
+import hashlib
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes. Adding or removing a node only
+    moves the keys that land on its arcs, so a rebalance restarts roughly
+    1/N of the streams instead of all of them.
+    """
+
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self._points = []       # sorted hashes
+        self._owners = {}       # hash -> node_id
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node_id):
+        if node_id in self.nodes:
+            return
+        self.nodes.add(node_id)
+        for i in range(self.replicas):
+            point = _hash(f"{node_id}#{i}")
+            self._owners[point] = node_id
+            bisect.insort(self._points, point)
+
+    def remove(self, node_id):
+        if node_id not in self.nodes:
+            return
+        self.nodes.discard(node_id)
+        for i in range(self.replicas):
+            point = _hash(f"{node_id}#{i}")
+            if self._owners.get(point) == node_id:
+                del self._owners[point]
+                idx = bisect.bisect_left(self._points, point)
+                if idx < len(self._points) and self._points[idx] == point:
+                    self._points.pop(idx)
+
+    def get(self, key):
+        """Node that owns key, or None when the ring is empty."""
+        if not self._points:
+            return None
+        idx = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[idx]]
+
+    def __len__(self):
+        return len(self.nodes)
@@ -0,0 +1,206 @@
+"""
+Inference node: runs stream jobs handed out by a gateway.
+
+    PPE_BROKER_URL=redis://redis:6379/0 python -m src.cluster.node --node-id gpu-a
+"""
+import os
+import sys
+import json
+import base64
+import time
+import uuid
+import signal
+import asyncio
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from src.cluster.broker import NODES_CHANNEL, get_broker, node_channel, results_channel
+from src.cluster.gateway import HEARTBEAT_INTERVAL
+
+logger = logging.getLogger("cluster")
+logger.setLevel(logging.INFO)
+
+NODE_CAPACITY = int(os.getenv("PPE_NODE_CAPACITY", 10))
+
+
+class BrokerWebSocket:
+    """Stands in for the client WebSocket inside run_ppe_detection; frames go back via the broker."""
+
+    def __init__(self, broker, gateway_id, job_id, epoch):
+        self.broker = broker
+        self.channel = results_channel(gateway_id)
+        self.job_id = job_id
+        self.epoch = epoch
+
+    async def send_text(self, text):
+        self.broker.publish(self.channel, {"type": "frame", "job_id": self.job_id, "epoch": self.epoch, "text": text})
+
+    async def send_bytes(self, data):
+        # Broker messages are JSON; binary frames ride as base64
+        self.broker.publish(self.channel, {"type": "frame", "job_id": self.job_id, "epoch": self.epoch,
+                                           "bytes": base64.b64encode(data).decode("ascii")})
+
+    async def send_json(self, data):
+        await self.send_text(json.dumps(data))
+
+
+class InferenceNode:
+    def __init__(self, broker, node_id=None, capacity=NODE_CAPACITY):
+        self.broker = broker
+        self.node_id = node_id or os.getenv("PPE_NODE_ID") or f"node-{uuid.uuid4().hex[:8]}"
+        self.capacity = capacity
+        self.sessions = {}          # "<job_id>:<epoch>" -> session dict (same shape as app.ppe_sessions)
+        self._running = False
+        self._threads = []
+
+    # ---------- Lifecycle ----------
+    def start(self, load_model=True):
+        from src.websocket.ppe_w_local1 import run_ppe_detection
+        from src.models.ppe_local import ppe_registry
+
+        self._detect = run_ppe_detection
+        if load_model:
+            # Join the ring only once streams can actually run here
+            ppe_registry.load()
+
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.capacity, thread_name_prefix=f"{self.node_id}-detect")
+        self.storage_executor = ThreadPoolExecutor(max_workers=max(1, self.capacity // 2))
+        self._commands = self.broker.subscribe(node_channel(self.node_id))
+
+        self._running = True
+        for target, name in ((self.loop.run_forever, "node-loop"),
+                             (self._command_loop, "node-commands"),
+                             (self._heartbeat_loop, "node-heartbeat")):
+            t = threading.Thread(target=target, name=f"{self.node_id}-{name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info(f"Node {self.node_id} started (capacity {self.capacity})")
+
+    def stop(self):
+        """Graceful leave: the gateway moves this node's streams immediately."""
+        if not self._running:
+            return
+        self._running = False
+        self.broker.publish(NODES_CHANNEL, {"type": "leave", "node_id": self.node_id})
+        for session in list(self.sessions.values()):
+            session["streaming"] = False
+        self.executor.shutdown(wait=True)
+        self.storage_executor.shutdown(wait=False)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._commands.close()
+        logger.info(f"Node {self.node_id} stopped")
+
+    # ---------- Heartbeats ----------
+    def _heartbeat_loop(self):
+        while self._running:
+            streams = sum(1 for s in list(self.sessions.values()) if s["streaming"])
+            self.broker.publish(NODES_CHANNEL, {
+                "type": "heartbeat",
+                "node_id": self.node_id,
+                "capacity": self.capacity,
+                "streams": streams,
+                "ts": time.time(),
+            })
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    # ---------- Commands ----------
+    def _command_loop(self):
+        while self._running:
+            msg = self._commands.get(timeout=HEARTBEAT_INTERVAL)
+            if not msg:
+                continue
+            try:
+                if msg["type"] == "start":
+                    self._start_job(msg)
+                elif msg["type"] == "stop":
+                    self._stop_job(msg["job_id"], msg.get("epoch"))
+                elif msg["type"] == "rules":
+                    self._update_rules(msg)
+            except Exception:
+                logger.exception(f"Node {self.node_id} failed to handle {msg.get('type')} for {msg.get('job_id')}")
+
+    def _start_job(self, msg):
+        job_id, epoch, job = msg["job_id"], msg["epoch"], msg["job"]
+        self._stop_job(job_id)      # a restart replaces any older epoch on this node
+        key = f"{job_id}:{epoch}"
+        ws = BrokerWebSocket(self.broker, msg["gateway"], job_id, epoch)
+        self.sessions[key] = {
+            "ws": ws,
+            "streaming": True,
+            "inference_tasks": [],
+            "config": job.get("config") or {},
+            "stream_name": job["stream_name"],
+            "region": job.get("region", "ap-south-1"),
+        }
+        future = self.executor.submit(self._run_job, key, job, ws)
+        self.sessions[key]["inference_tasks"].append(future)
+        logger.info(f"[{job_id}] Started epoch {epoch} on {self.node_id}")
+
+    def _stop_job(self, job_id, epoch=None):
+        for key, session in list(self.sessions.items()):
+            session_job, session_epoch = key.rsplit(":", 1)
+            if session_job == job_id and (epoch is None or int(session_epoch) == epoch):
+                session["streaming"] = False
+
+    def _update_rules(self, msg):
+        from src.local_models.ppe_code.ppe_rules import compile_rules
+
+        session = self.sessions.get(f"{msg['job_id']}:{msg['epoch']}")
+        if session is not None:
+            session["rules_update"] = compile_rules(msg.get("rules"))
+
+    def _run_job(self, key, job, ws):
+        from src.utils.kvs_stream import get_kvs_hls_url
+
+        error = None
+        try:
+            stream_name = job["stream_name"]
+            # Resolved here so every restart gets a fresh HLS session URL
+            url = stream_name if stream_name.startswith("https") else get_kvs_hls_url(stream_name, job.get("region", "ap-south-1"))
+            if not url:
+                error = f"no HLS URL for {stream_name}"
+                return
+            self._detect(key, url, job["camera_id"], job["user_id"], job["org_id"],
+                         self.sessions, self.loop, self.storage_executor)
+        except Exception as e:
+            error = str(e)
+            logger.exception(f"[{key}] Job failed on {self.node_id}")
+        finally:
+            self.sessions.pop(key, None)
+            self.broker.publish(ws.channel, {
+                "type": "ended", "job_id": ws.job_id, "epoch": ws.epoch,
+                "node_id": self.node_id, "error": error,
+            })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PPE inference node")
+    parser.add_argument("--node-id", default=None)
+    parser.add_argument("--broker", default=None, help="Broker URL (default PPE_BROKER_URL)")
+    parser.add_argument("--capacity", type=int, default=NODE_CAPACITY, help="Max concurrent streams")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("PPE_NODE_METRICS_PORT", 0)))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    if args.metrics_port:
+        from prometheus_client import start_http_server
+        start_http_server(args.metrics_port)
+
+    node = InferenceNode(get_broker(args.broker), args.node_id, args.capacity)
+    node.start()
+
+    done = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: done.set())
+    signal.signal(signal.SIGINT, lambda *_: done.set())
+    done.wait()
+    node.stop()
+
+
+if __name__ == "__main__":
+    main()
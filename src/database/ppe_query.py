@@ -68,36 +68,44 @@
 
 import os
 import logging
-from psycopg2.pool import SimpleConnectionPool
-from dotenv import load_dotenv
+import threading
 import json
-import logging
 
 logger = logging.getLogger("detection")
-load_dotenv()
-
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "port": int(os.getenv("DB_PORT", 5432)),
-}
-
-try:
-    pool = SimpleConnectionPool(
-        minconn=1,
-        maxconn=20,
-        **DB_CONFIG
-    )
-    logger.info("✅ PostgreSQL connection pool created")
-except Exception as e:
-    logger.error(f"❌ Failed to create connection pool: {e}")
-    raise
 
+# Created on first query, not at import: startup never waits on (or fails
+# because of) Postgres, and processes that never touch the DB never connect.
+_pool = None
+_pool_lock = threading.Lock()
 
 
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from dotenv import load_dotenv
+                from psycopg2.pool import SimpleConnectionPool
 
+                load_dotenv()
+                db_config = {
+                    "host": os.getenv("DB_HOST"),
+                    "dbname": os.getenv("DB_NAME"),
+                    "user": os.getenv("DB_USER"),
+                    "password": os.getenv("DB_PASSWORD"),
+                    "port": int(os.getenv("DB_PORT", 5432)),
+                }
+                try:
+                    _pool = SimpleConnectionPool(
+                        minconn=1,
+                        maxconn=20,
+                        **db_config
+                    )
+                    logger.info("✅ PostgreSQL connection pool created")
+                except Exception as e:
+                    logger.error(f"❌ Failed to create connection pool: {e}")
+                    raise
+    return _pool
 
 
 logger = logging.getLogger("detection")
@@ -109,7 +117,7 @@ def insert_ppe_frame(data: dict, s3_url: str):
     """
     conn = None
     try:
-        conn = pool.getconn()
+        conn = get_pool().getconn()
         cursor = conn.cursor()
 
         insert_query = """
@@ -151,4 +159,308 @@ def insert_ppe_frame(data: dict, s3_url: str):
 
     finally:
         if conn:
-            pool.putconn(conn)
+            get_pool().putconn(conn)
+
+
+def insert_ppe_frames_bulk(rows):
+    """
+    Insert many (data, s3_url) frames with one statement and one commit.
+    Returns the number of rows inserted, or None if the batch failed (nothing committed).
+    """
+    from psycopg2.extras import execute_values
+
+    if not rows:
+        return 0
+    conn = None
+    try:
+        conn = get_pool().getconn()
+        cursor = conn.cursor()
+
+        insert_query = """
+            INSERT INTO ppe_detections (
+                s3_url, detections, user_id, org_id, camera_id, time_stamp, frame_num
+            )
+            VALUES %s;
+        """
+
+        execute_values(
+            cursor,
+            insert_query,
+            [
+                (
+                    s3_url,
+                    json.dumps(data['detections']),
+                    data['user_id'],
+                    data['org_id'],
+                    data['camera_id'],
+                    data['time_stamp'],
+                    data['frame_num']
+                )
+                for data, s3_url in rows
+            ],
+            page_size=len(rows)
+        )
+
+        conn.commit()
+        cursor.close()
+
+        logger.info(f"✅ {len(rows)} PPE frames stored in bulk")
+        return len(rows)
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"❌ Failed to bulk insert {len(rows)} PPE frames: {e}")
+        return None
+
+    finally:
+        if conn:
+            get_pool().putconn(conn)
+
+
+# Columns of ppe_compliance_minute (see schema.sql); items follow ppe_rules.PPE_ITEMS
+ROLLUP_ITEMS = ("boots", "helmet", "vest")
+ROLLUP_COLUMNS = (
+    "camera_id", "minute", "run_id", "user_id", "org_id", "frames", "persons", "person_seconds",
+    *(f"{item}_{kind}_seconds" for item in ROLLUP_ITEMS for kind in ("ok", "missing")),
+    "alerts",
+)
+ROLLUP_BUCKETS = ("minute", "hour", "day", "week", "month")
+
+
+def insert_compliance_rollups(rows):
+    """
+    Upsert per-minute rollup rows (ComplianceRollup.drain() dicts) in one statement.
+    A replayed row overwrites its earlier copy. Returns the row count, or None on failure.
+    """
+    from psycopg2.extras import execute_values
+
+    if not rows:
+        return 0
+    conn = None
+    try:
+        conn = get_pool().getconn()
+        cursor = conn.cursor()
+
+        updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in ROLLUP_COLUMNS[3:])
+        insert_query = f"""
+            INSERT INTO ppe_compliance_minute ({", ".join(ROLLUP_COLUMNS)})
+            VALUES %s
+            ON CONFLICT (camera_id, minute, run_id) DO UPDATE SET {updates};
+        """
+        template = "(" + ", ".join("to_timestamp(%s)" if col == "minute" else "%s" for col in ROLLUP_COLUMNS) + ")"
+
+        execute_values(
+            cursor,
+            insert_query,
+            [tuple(row[col] for col in ROLLUP_COLUMNS) for row in rows],
+            template=template,
+            page_size=len(rows)
+        )
+
+        conn.commit()
+        cursor.close()
+
+        logger.info(f"✅ {len(rows)} compliance rollups stored")
+        return len(rows)
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"❌ Failed to store {len(rows)} compliance rollups: {e}")
+        return None
+
+    finally:
+        if conn:
+            get_pool().putconn(conn)
+
+
+def query_compliance(start, end, camera_ids=None, org_id=None, bucket="hour"):
+    """
+    Compliance per camera per `bucket` (minute/hour/day/week/month) between
+    start and end (datetimes). peak_persons is the highest per-minute count of
+    distinct persons; compliance is ok / (ok + missing) person-seconds.
+    """
+    if bucket not in ROLLUP_BUCKETS:
+        raise ValueError(f"bucket must be one of {ROLLUP_BUCKETS}")
+
+    sums = list(ROLLUP_COLUMNS[5:])
+    filters, params = ["minute >= %s", "minute < %s"], [start, end]
+    if camera_ids:
+        filters.append("camera_id = ANY(%s)")
+        params.append(list(camera_ids))
+    if org_id is not None:
+        filters.append("org_id = %s")
+        params.append(org_id)
+
+    # Runs overlapping in one minute are summed first, then minutes rolled into buckets
+    query = f"""
+        WITH per_minute AS (
+            SELECT camera_id, minute, {", ".join(f"SUM({col}) AS {col}" for col in sums)}
+              FROM ppe_compliance_minute
+             WHERE {" AND ".join(filters)}
+             GROUP BY camera_id, minute
+        )
+        SELECT camera_id, date_trunc(%s, minute) AS bucket, MAX(persons) AS peak_persons,
+               {", ".join(f"SUM({col}) AS {col}" for col in sums if col != "persons")}
+          FROM per_minute
+         GROUP BY camera_id, bucket
+         ORDER BY camera_id, bucket;
+    """
+
+    conn = None
+    try:
+        conn = get_pool().getconn()
+        cursor = conn.cursor()
+        cursor.execute(query, params + [bucket])
+        names = [d[0] for d in cursor.description]
+        records = [dict(zip(names, row)) for row in cursor.fetchall()]
+        cursor.close()
+        conn.commit()
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"❌ Failed to query compliance rollups: {e}")
+        raise
+
+    finally:
+        if conn:
+            get_pool().putconn(conn)
+
+    results = []
+    for r in records:
+        items = {}
+        for item in ROLLUP_ITEMS:
+            ok = float(r[f"{item}_ok_seconds"] or 0)
+            missing = float(r[f"{item}_missing_seconds"] or 0)
+            items[item] = {
+                "ok_seconds": round(ok, 1),
+                "missing_seconds": round(missing, 1),
+                "compliance": round(ok / (ok + missing), 4) if ok + missing else None,
+            }
+        results.append({
+            "camera_id": r["camera_id"],
+            "bucket": r["bucket"].isoformat(),
+            "frames": int(r["frames"] or 0),
+            "peak_persons": int(r["peak_persons"] or 0),
+            "person_seconds": round(float(r["person_seconds"] or 0), 1),
+            "alerts": int(r["alerts"] or 0),
+            "items": items,
+        })
+    return results
+
+
+def insert_ppe_alert(event: dict):
+    """
+    Insert a fired PPE alert into ppe_alerts (keyed by the pipeline's alert_id).
+    """
+    conn = None
+    try:
+        conn = get_pool().getconn()
+        cursor = conn.cursor()
+
+        insert_query = """
+            INSERT INTO ppe_alerts (
+                alert_id, camera_id, user_id, org_id, person_id, missing,
+                ppe_status, bbox, started_at, fired_at
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, to_timestamp(%s), to_timestamp(%s))
+            ON CONFLICT (alert_id) DO NOTHING
+            RETURNING id;
+        """
+
+        cursor.execute(
+            insert_query,
+            (
+                event['alert_id'],
+                event['camera_id'],
+                event['user_id'],
+                event['org_id'],
+                event['person_id'],
+                json.dumps(event['missing']),
+                json.dumps(event.get('ppe_status')),
+                json.dumps(event['bbox']),
+                event['started_at'],
+                event['time']
+            )
+        )
+
+        row = cursor.fetchone()
+        conn.commit()
+        cursor.close()
+
+        logger.info(f"✅ PPE alert stored alert_id={event['alert_id']}")
+        return row[0] if row else None
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"❌ Failed to insert PPE alert: {e}")
+        raise
+
+    finally:
+        if conn:
+            get_pool().putconn(conn)
+
+
+def close_ppe_alert(alert_id: str, cleared_at: float, reason: str = None):
+    """
+    Mark a PPE alert as cleared.
+    """
+    conn = None
+    try:
+        conn = get_pool().getconn()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            UPDATE ppe_alerts
+               SET cleared_at = to_timestamp(%s), clear_reason = %s
+             WHERE alert_id = %s AND cleared_at IS NULL;
+            """,
+            (cleared_at, reason or "compliant", alert_id)
+        )
+
+        conn.commit()
+        cursor.close()
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"❌ Failed to close PPE alert {alert_id}: {e}")
+        raise
+
+    finally:
+        if conn:
+            get_pool().putconn(conn)
+
+
+def attach_alert_clip(alert_ids: list, clip_url: str):
+    """
+    Link an uploaded clip to one or more alerts. Returns the number of rows updated.
+    """
+    conn = None
+    try:
+        conn = get_pool().getconn()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "UPDATE ppe_alerts SET clip_url = %s WHERE alert_id = ANY(%s);",
+            (clip_url, list(alert_ids))
+        )
+        updated = cursor.rowcount
+
+        conn.commit()
+        cursor.close()
+        return updated
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"❌ Failed to attach clip to alerts {alert_ids}: {e}")
+        return 0
+
+    finally:
+        if conn:
+            get_pool().putconn(conn)
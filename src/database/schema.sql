@@ -0,0 +1,56 @@
+-- Tables used by src/database/ppe_query.py
+
+CREATE TABLE IF NOT EXISTS ppe_detections (
+    id          BIGSERIAL PRIMARY KEY,
+    s3_url      TEXT,
+    detections  JSONB,
+    user_id     INTEGER,
+    org_id      INTEGER,
+    camera_id   INTEGER,
+    time_stamp  TEXT,
+    frame_num   INTEGER
+);
+
+-- One row per debounced alert from src/alerts/alert_pipeline.py
+CREATE TABLE IF NOT EXISTS ppe_alerts (
+    id            BIGSERIAL PRIMARY KEY,
+    alert_id      TEXT NOT NULL UNIQUE,
+    camera_id     INTEGER,
+    user_id       INTEGER,
+    org_id        INTEGER,
+    person_id     INTEGER,
+    missing       JSONB,
+    ppe_status    JSONB,
+    bbox          JSONB,
+    started_at    TIMESTAMPTZ,
+    fired_at      TIMESTAMPTZ,
+    cleared_at    TIMESTAMPTZ,
+    clear_reason  TEXT,
+    clip_url      TEXT
+);
+
+CREATE INDEX IF NOT EXISTS ppe_alerts_camera_fired_idx ON ppe_alerts (camera_id, fired_at);
+
+-- Per-camera per-minute compliance rollups from src/analytics/rollups.py,
+-- computed from every analyzed frame. One row per pipeline run (run_id) and
+-- minute; dashboards SUM over run_id. Seconds are person-seconds.
+CREATE TABLE IF NOT EXISTS ppe_compliance_minute (
+    camera_id               INTEGER NOT NULL,
+    minute                  TIMESTAMPTZ NOT NULL,
+    run_id                  TEXT NOT NULL,
+    user_id                 INTEGER,
+    org_id                  INTEGER,
+    frames                  INTEGER NOT NULL DEFAULT 0,
+    persons                 INTEGER NOT NULL DEFAULT 0,
+    person_seconds          REAL NOT NULL DEFAULT 0,
+    boots_ok_seconds        REAL NOT NULL DEFAULT 0,
+    boots_missing_seconds   REAL NOT NULL DEFAULT 0,
+    helmet_ok_seconds       REAL NOT NULL DEFAULT 0,
+    helmet_missing_seconds  REAL NOT NULL DEFAULT 0,
+    vest_ok_seconds         REAL NOT NULL DEFAULT 0,
+    vest_missing_seconds    REAL NOT NULL DEFAULT 0,
+    alerts                  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (camera_id, minute, run_id)
+);
+
+CREATE INDEX IF NOT EXISTS ppe_compliance_minute_org_idx ON ppe_compliance_minute (org_id, minute);
@@ -1,8 +1,13 @@
+import os
 import asyncio
 import json
 import logging
+import threading
 from fastapi import WebSocket, WebSocketDisconnect
 from src.utils.kvs_stream import get_kvs_hls_url
+from src.utils.stream_supervisor import validate_supervisor
+from src.alerts.alert_pipeline import validate_alert_config, validate_webhook
+from src.websocket.stream_hub import Subscriber, validate_render
 
 logger = logging.getLogger("websockets")
 logger.setLevel(logging.INFO)
@@ -14,14 +19,177 @@ if not logger.handlers:
     logger.addHandler(ch)
 
 
-async def ppe_websocket_handler(executor, storage_executor, ws: WebSocket, client_id: str, sessions: dict, run_detection_fn, stream_type: str):
+# Raw-frame recording fills disks fast (shared with the storage spool): off unless the operator allows it
+RECORD_ALLOWED = os.getenv("PPE_RECORD_ALLOWED", "0") == "1"
+
+# Set by the admin drain endpoint: running streams continue, new start_stream requests are refused
+draining = threading.Event()
+
+
+async def reject_if_draining(ws: WebSocket, client_id: str, data: dict) -> bool:
+    if not draining.is_set():
+        return False
+    logger.info("[%s] Rejected start_stream: instance is draining", client_id)
+    try:
+        await ws.send_json({
+            "status": "error",
+            "code": "draining",
+            "message": "Instance is draining; reconnect to start the stream elsewhere",
+            "camera_id": data.get("camera_id"),
+            "client_id": client_id
+        })
+    except Exception:
+        logger.exception("[%s] Failed to send drain notice to client", client_id)
+    return True
+
+
+def stream_config(data: dict) -> dict:
+    """Per-camera inference options taken from a start_stream message."""
+    return {
+        "tiling": data.get("tiling"),
+        "pipeline": data.get("pipeline", "detector"),
+        "two_stage": data.get("two_stage"),
+        "decision_cache": data.get("decision_cache"),
+        "alerts": data.get("alerts"),
+        "alert_webhook": data.get("alert_webhook"),
+        "clips": data.get("clips"),
+        "snapshot_interval": data.get("snapshot_interval"),
+        "decode": data.get("decode"),
+        "render": data.get("render"),
+        "rules": data.get("rules"),
+        "association": data.get("association"),
+        "supervisor": data.get("supervisor"),
+        # On/off only: recordings go under PPE_RECORD_DIR, never a client-chosen path
+        "record": bool(data.get("record")),
+        "clock": data.get("clock"),
+    }
+
+
+async def resolve_stream_url(loop, stream_name, region):
+    """HLS URL for a KVS stream name (https URLs pass through); None if there is none."""
+    if stream_name.startswith("https"):
+        return stream_name
+    # boto3 calls plus up to three sleep() retries: never on the event loop
+    url = await loop.run_in_executor(None, get_kvs_hls_url, stream_name, region)
+    return url if url and url != "None" else None
+
+
+async def send_no_url(ws: WebSocket, client_id: str, camera_id, stream_name: str):
+    msg = f"no HLS URL on attempts: {stream_name}"
+    logger.warning("[%s] %s", client_id, msg)
+    try:
+        await ws.send_json({
+            "status": "error",
+            "message": msg,
+            "camera_id": camera_id,
+            "client_id": client_id
+        })
+    except Exception:
+        logger.exception("[%s] Failed to send error message to client", client_id)
+
+
+def validate_rules(reply: dict, data: dict):
+    """Compile the rules of an update_rules message; (compiled, None) or (None, error reply)."""
+    # numpy-backed; already loaded by the lifespan preload, kept off the startup import path
+    from src.local_models.ppe_code.ppe_rules import compile_rules
+
+    try:
+        return compile_rules(data.get("rules")), None
+    except (ValueError, TypeError, AttributeError) as e:
+        return None, dict(reply, status="error", message=f"Invalid rules: {e}")
+
+
+def option_validators():
+    """(start_stream key, validator) pairs; each validator raises ValueError or returns the normalized option."""
+    # numpy / torch-side modules, loaded by the lifespan preload
+    from src.local_models.ppe_code.association import validate_association
+    from src.local_models.ppe_code.ppe_logic import validate_decision_cache
+    from src.local_models.ppe_code.tiling import validate_tiling
+    from src.local_models.ppe_code.two_stage import validate_two_stage
+
+    return (
+        ("tiling", validate_tiling),
+        ("two_stage", validate_two_stage),
+        ("decision_cache", validate_decision_cache),
+        ("association", validate_association),
+        ("alerts", validate_alert_config),
+        ("supervisor", validate_supervisor),
+    )
+
+
+def validate_options(reply: dict, config: dict):
+    """Normalize config's analysis options in place; None, or the error reply for the first bad one."""
+    for key, validate in option_validators():
+        try:
+            config[key] = validate(config.get(key))
+        except ValueError as e:
+            return dict(reply, status="error", message=f"Invalid {key} options: {e}")
+    return None
+
+
+async def reject_invalid_config(ws: WebSocket, client_id: str, data: dict, config: dict):
+    """
+    Check a start_stream's options before anything is opened; sends the error
+    and returns True if they are invalid. Bad options would otherwise only
+    fail inside the detection thread (or, behind the hub, be logged there),
+    after the source and storage worker started.
+    """
+    reply = {"action": "start_stream", "camera_id": data.get("camera_id"), "client_id": client_id}
+    error = None
+    if config.get("rules") is not None:
+        _, error = validate_rules(reply, config)
+    if error is None and config.get("record") and not RECORD_ALLOWED:
+        error = dict(reply, status="error", message="Recording is disabled on this server (PPE_RECORD_ALLOWED)")
+    if error is None:
+        try:
+            validate_render(config.get("render"))
+        except ValueError as e:
+            error = dict(reply, status="error", message=f"Invalid render options: {e}")
+    if error is None:
+        try:
+            validate_webhook(config.get("alert_webhook"))
+        except ValueError as e:
+            error = dict(reply, status="error", message=f"Invalid alert_webhook: {e}")
+    if error is None:
+        error = validate_options(reply, config)
+    if error is None:
+        return False
+    logger.info("[%s] Rejected start_stream: %s", client_id, error["message"])
+    try:
+        await ws.send_json(error)
+    except Exception:
+        logger.exception("[%s] Failed to send config error to client", client_id)
+    return True
+
+
+async def update_rules(ws: WebSocket, client_id: str, data: dict, target):
+    """Hand validated rules to the running pipeline; it swaps them in at the next frame."""
+    reply = {"action": "update_rules", "camera_id": data.get("camera_id"), "client_id": client_id}
+    rules, error = validate_rules(reply, data)
+    if error is None and (target is None or not target.get("streaming")):
+        error = dict(reply, status="error", message="No running stream to update")
+    if error is None:
+        target["rules_update"] = rules
+        logger.info("[%s] PPE rules update queued", client_id)
+    try:
+        await ws.send_json(error or dict(reply, status="ok"))
+    except Exception:
+        logger.exception("[%s] Failed to acknowledge rules update", client_id)
+
+
+async def ppe_websocket_handler(executor, storage_executor, ws: WebSocket, client_id: str, sessions: dict, run_detection_fn, stream_type: str, hub=None):
+    """
+    With a StreamHub, viewers of the same stream and analysis config share one
+    detection pipeline; without one, every start_stream runs its own.
+    """
     await ws.accept()
     loop = asyncio.get_running_loop()  # get the loop inside the coroutine
 
     sessions[client_id] = {
         "ws": ws,
         "streaming": False,
-        "inference_tasks": []
+        "inference_tasks": [],
+        "config": {}
     }
     logger.info("[%s] %s WebSocket connected", client_id, stream_type)
 
@@ -45,33 +213,54 @@ async def ppe_websocket_handler(executor, storage_executor, ws: WebSocket, clien
             action = data.get("action")
 
             if action == "start_stream":
+                if await reject_if_draining(ws, client_id, data):
+                    continue
                 try:
                     stream_name = data["stream_name"]
                     user_id = data["user_id"]
                     camera_id = data["camera_id"]
                     org_id = data["org_id"]
                     region = data.get("region", "ap-south-1")
+                    config = stream_config(data)
+                    if await reject_invalid_config(ws, client_id, data, config):
+                        continue
+
+                    joining = hub is not None and hub.running(stream_name, config, org_id, camera_id)
+                    if joining:
+                        kvs_url = None      # the live pipeline already has its URL
+                    else:
+                        kvs_url = await resolve_stream_url(loop, stream_name, region)
 
-                    kvs_url = stream_name if stream_name.startswith("https") else get_kvs_hls_url(stream_name, region)
-                    
                     # --------- Handle missing/invalid KVS URL gracefully ----------
-                    if not kvs_url or kvs_url in ("None", "", None):
-                        msg = f"no HLS URL on attempts: {stream_name}"
-                        logger.warning("[%s] %s", client_id, msg)
-                        try:
-                            await ws.send_json({
-                                "status": "error",
-                                "message": msg,
-                                "camera_id": camera_id,
-                                "client_id": client_id
-                            })
-                        except Exception:
-                            logger.exception("[%s] Failed to send error message to client", client_id)
+                    if not joining and not kvs_url:
+                        await send_no_url(ws, client_id, camera_id, stream_name)
                         continue  # skip detection start
 
-                    client_args = (client_id, kvs_url, camera_id, user_id, org_id, sessions, loop, storage_executor)
-
+                    # Per-camera inference options, read by the detection thread
+                    sessions[client_id]["config"] = config
                     sessions[client_id]["streaming"] = True
+                    # The stream supervisor re-resolves the HLS URL from these on reconnect / expiry
+                    sessions[client_id]["stream_name"] = stream_name
+                    sessions[client_id]["region"] = region
+
+                    if hub is not None:
+                        subscriber = Subscriber(client_id, ws, loop, camera_id, user_id, org_id,
+                                                config.get("render"), sessions[client_id])
+                        run_id, started = hub.subscribe(subscriber, stream_name, kvs_url, config, loop)
+                        if run_id is None:
+                            # The pipeline stopped after running() was checked: start a fresh one
+                            kvs_url = await resolve_stream_url(loop, stream_name, region)
+                            if not kvs_url:
+                                sessions[client_id]["streaming"] = False
+                                await send_no_url(ws, client_id, camera_id, stream_name)
+                                continue
+                            run_id, started = hub.subscribe(subscriber, stream_name, kvs_url, config, loop)
+                        sessions[client_id]["pipeline_id"] = run_id
+                        logger.info("[%s] %s %s pipeline %s", client_id, stream_type,
+                                    "started" if started else "joined", run_id)
+                        continue
+
+                    client_args = (client_id, kvs_url, camera_id, user_id, org_id, sessions, loop, storage_executor)
 
                     # Run detection in a separate thread
                     future = loop.run_in_executor(executor, run_detection_fn, *client_args)
@@ -84,17 +273,109 @@ async def ppe_websocket_handler(executor, storage_executor, ws: WebSocket, clien
 
             elif action == "stop_stream":
                 sessions[client_id]["streaming"] = False
+                if hub is not None:
+                    hub.unsubscribe(client_id)
                 for task in sessions[client_id]["inference_tasks"]:
                     task.cancel()  # best effort; the detection function should check streaming flag
                 sessions[client_id]["inference_tasks"] = []
                 logger.info("[%s] %s inference tasks stopped", client_id, stream_type)
 
+            elif action == "update_rules":
+                # Behind a hub the rules apply to the shared pipeline, i.e. every viewer of the camera
+                target = hub.pipeline_for(client_id) if hub is not None else sessions[client_id]
+                await update_rules(ws, client_id, data, target)
+
     except Exception:
         logger.exception("[%s] Unexpected error in %s WebSocket", client_id, stream_type)
 
     finally:
         sessions[client_id]["streaming"] = False
+        if hub is not None:
+            hub.unsubscribe(client_id)
         for task in sessions[client_id].get("inference_tasks", []):
             task.cancel()
         sessions.pop(client_id, None)
-        logger.info("[%s] %s session cleaned up", client_id, stream_type)
\ No newline at end of file
+        logger.info("[%s] %s session cleaned up", client_id, stream_type)
+
+
+async def gateway_websocket_handler(gateway, ws: WebSocket, client_id: str, sessions: dict, stream_type: str):
+    """
+    Cluster mode: the WebSocket stays on this gateway while the stream job runs
+    on an inference node picked by the gateway. HLS URLs are resolved on the
+    node so a failover restart gets a fresh one.
+    """
+    await ws.accept()
+    loop = asyncio.get_running_loop()
+
+    sessions[client_id] = {
+        "ws": ws,
+        "streaming": False,
+        "inference_tasks": [],
+        "config": {}
+    }
+    logger.info("[%s] %s WebSocket connected (gateway %s)", client_id, stream_type, gateway.gateway_id)
+
+    try:
+        while True:
+            try:
+                msg = await ws.receive_text()
+                if not msg.strip():
+                    continue
+                data = json.loads(msg)
+            except json.JSONDecodeError:
+                logger.warning("[%s] Received invalid JSON: %s", client_id, msg)
+                continue
+            except WebSocketDisconnect:
+                logger.info("[%s] %s client disconnected", client_id, stream_type)
+                break
+
+            action = data.get("action")
+
+            if action == "start_stream":
+                if await reject_if_draining(ws, client_id, data):
+                    continue
+                try:
+                    config = stream_config(data)
+                    if await reject_invalid_config(ws, client_id, data, config):
+                        continue
+                    job = {
+                        "stream_name": data["stream_name"],
+                        "region": data.get("region", "ap-south-1"),
+                        "camera_id": data["camera_id"],
+                        "user_id": data["user_id"],
+                        "org_id": data["org_id"],
+                        "config": config,
+                    }
+                    sessions[client_id]["config"] = job["config"]
+                    sessions[client_id]["streaming"] = True
+                    # Broker publishes can block on the network; keep them off the loop
+                    await loop.run_in_executor(None, gateway.start_job, client_id, job, ws, loop)
+                    logger.info("[%s] %s stream dispatched to the cluster", client_id, stream_type)
+                except Exception:
+                    logger.exception("[%s] Failed to start %s stream", client_id, stream_type)
+
+            elif action == "stop_stream":
+                sessions[client_id]["streaming"] = False
+                await loop.run_in_executor(None, gateway.stop_job, client_id)
+                logger.info("[%s] %s stream stopped", client_id, stream_type)
+
+            elif action == "update_rules":
+                reply = {"action": "update_rules", "camera_id": data.get("camera_id"), "client_id": client_id}
+                _, error = validate_rules(reply, data)
+                if error is None:
+                    # The node compiles and applies them; the job keeps them for failover restarts
+                    found = await loop.run_in_executor(None, gateway.update_rules, client_id, data.get("rules"))
+                    if not found:
+                        error = dict(reply, status="error", message="No running stream to update")
+                try:
+                    await ws.send_json(error or dict(reply, status="ok"))
+                except Exception:
+                    logger.exception("[%s] Failed to acknowledge rules update", client_id)
+
+    except Exception:
+        logger.exception("[%s] Unexpected error in %s WebSocket", client_id, stream_type)
+
+    finally:
+        await loop.run_in_executor(None, gateway.stop_job, client_id)
+        sessions.pop(client_id, None)
+        logger.info("[%s] %s session cleaned up", client_id, stream_type)
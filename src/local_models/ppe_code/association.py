@@ -0,0 +1,191 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:         # greedy assignment instead
+    linear_sum_assignment = None
+
+from .ppe_rules import CLASS_NAMES
+
+# ---------- Defaults ----------
+DEFAULT_ASSOCIATION = {
+    "cell": 96,             # grid cell (px) for candidate lookup
+    "expand_x": 0.1,        # person box widened by this fraction per side, for overhanging PPE
+    "expand_y": 0.15,       # ... and heightened by this fraction, top and bottom
+    "min_score": 0.25,      # pairs scoring below this are never assigned
+    "max_candidates": 6,    # best-scoring persons kept per PPE box (bounds the assignment size)
+}
+
+# Vertical band of the person box (0 = top, 1 = bottom) where each item is worn
+ANATOMY = {"helmet": (-0.15, 0.3), "vest": (0.1, 0.75), "boots": (0.7, 1.1)}
+PRIOR_FALLOFF = 0.15        # prior reaches 0 this far outside the band (fraction of person size)
+
+
+def _bands():
+    lo = np.zeros(len(CLASS_NAMES) + 1, dtype=np.float32)
+    hi = np.ones(len(CLASS_NAMES) + 1, dtype=np.float32)
+    for cid, name in enumerate(CLASS_NAMES):
+        band = ANATOMY.get(name.split()[-1])      # "no helmet" sits where a helmet would
+        if band is not None:
+            lo[cid], hi[cid] = band
+    return lo, hi
+
+
+BAND_LO, BAND_HI = _bands()     # last slot: classes outside the table, whole body
+
+
+def normalize_association(cfg):
+    opts = dict(DEFAULT_ASSOCIATION)
+    if isinstance(cfg, dict):
+        opts.update({k: v for k, v in cfg.items() if k in DEFAULT_ASSOCIATION})
+    return opts
+
+
+def validate_association(cfg):
+    """Raise ValueError for association options associate() cannot use; returns them normalized."""
+    if cfg is not None and not isinstance(cfg, dict):
+        raise ValueError("association must be an object")
+    opts = normalize_association(cfg)
+    try:
+        opts["cell"] = int(opts["cell"])
+        opts["max_candidates"] = int(opts["max_candidates"])
+        for key in ("expand_x", "expand_y", "min_score"):
+            opts[key] = float(opts[key])
+    except (TypeError, ValueError):
+        raise ValueError("association values must be numbers")
+    if opts["cell"] < 8 or opts["max_candidates"] < 1:
+        raise ValueError("cell must be at least 8 and max_candidates at least 1")
+    if opts["expand_x"] < 0 or opts["expand_y"] < 0 or not 0.0 <= opts["min_score"] <= 1.0:
+        raise ValueError("expand_x and expand_y must be non-negative and min_score within [0, 1]")
+    return opts
+
+
+# -------------------------------------------------------------------------------
+# Candidate lookup: uniform grid over the (expanded) person boxes
+# -------------------------------------------------------------------------------
+
+def _candidate_pairs(expanded, centers, cell):
+    """(ppe_index, person_index) pairs whose PPE centre lies in a grid cell the person covers."""
+    cells = np.floor(expanded / cell).astype(np.intp)
+    grid = {}
+    for j, (gx1, gy1, gx2, gy2) in enumerate(cells):
+        for gx in range(gx1, gx2 + 1):
+            for gy in range(gy1, gy2 + 1):
+                grid.setdefault((gx, gy), []).append(j)
+
+    ppe_rows, person_rows = [], []
+    keys = np.floor(centers / cell).astype(np.intp)
+    for i, (gx, gy) in enumerate(keys):
+        members = grid.get((gx, gy))
+        if members:
+            ppe_rows.extend([i] * len(members))
+            person_rows.extend(members)
+    return np.array(ppe_rows, dtype=np.intp), np.array(person_rows, dtype=np.intp)
+
+
+# -------------------------------------------------------------------------------
+# Pair scoring: IoA against the expanded person box x anatomical prior
+# -------------------------------------------------------------------------------
+
+def _score_pairs(persons, expanded, ppe_cls, ppe, pi, pj):
+    b = ppe[pi]
+    e = expanded[pj]
+    p = persons[pj]
+
+    iw = np.clip(np.minimum(b[:, 2], e[:, 2]) - np.maximum(b[:, 0], e[:, 0]), 0, None)
+    ih = np.clip(np.minimum(b[:, 3], e[:, 3]) - np.maximum(b[:, 1], e[:, 1]), 0, None)
+    area = np.maximum((b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]), 1.0)
+    ioa = iw * ih / area
+
+    pw = np.maximum(p[:, 2] - p[:, 0], 1.0)
+    ph = np.maximum(p[:, 3] - p[:, 1], 1.0)
+    u = ((b[:, 0] + b[:, 2]) / 2 - p[:, 0]) / pw
+    v = ((b[:, 1] + b[:, 3]) / 2 - p[:, 1]) / ph
+
+    cls = np.minimum(ppe_cls[pi], len(BAND_LO) - 1)
+    off_v = np.maximum(np.maximum(BAND_LO[cls] - v, v - BAND_HI[cls]), 0)
+    off_u = np.maximum(np.maximum(-u, u - 1.0), 0)
+    prior = np.clip(1.0 - off_v / PRIOR_FALLOFF, 0, 1) * np.clip(1.0 - off_u / PRIOR_FALLOFF, 0, 1)
+    return ioa * prior
+
+
+def _top_k(pi, score, k):
+    """Keep the k best-scoring candidates of each PPE box."""
+    order = np.lexsort((-score, pi))
+    pi_sorted = pi[order]
+    starts = np.searchsorted(pi_sorted, pi_sorted, side="left")
+    rank = np.arange(len(order)) - starts
+    return order[rank < k]
+
+
+# -------------------------------------------------------------------------------
+# One-to-one assignment per class
+# -------------------------------------------------------------------------------
+
+def _assign(rows, cols, score, owner, best):
+    # Uncontested pairs (the box's only candidate, the person's only box) need no solver
+    _, r_inv, r_count = np.unique(rows, return_inverse=True, return_counts=True)
+    _, c_inv, c_count = np.unique(cols, return_inverse=True, return_counts=True)
+    alone = (r_count[r_inv] == 1) & (c_count[c_inv] == 1)
+    owner[rows[alone]] = cols[alone]
+    best[rows[alone]] = score[alone]
+    rows, cols, score = rows[~alone], cols[~alone], score[~alone]
+    if len(rows) == 0:
+        return
+
+    if linear_sum_assignment is not None:
+        urows, r = np.unique(rows, return_inverse=True)
+        ucols, c = np.unique(cols, return_inverse=True)
+        matrix = np.zeros((len(urows), len(ucols)), dtype=np.float32)
+        matrix[r, c] = score
+        ri, ci = linear_sum_assignment(matrix, maximize=True)
+        ok = matrix[ri, ci] > 0
+        owner[urows[ri[ok]]] = ucols[ci[ok]]
+        best[urows[ri[ok]]] = matrix[ri[ok], ci[ok]]
+        return
+
+    taken = set()
+    for k in np.argsort(-score, kind="stable"):
+        i, j = rows[k], cols[k]
+        if owner[i] == -1 and j not in taken:
+            owner[i], best[i] = j, score[k]
+            taken.add(j)
+
+
+def associate(persons, ppe_cls, ppe, cfg=None):
+    """
+    Match PPE boxes to person boxes.
+
+    persons: (P, 4) xyxy; ppe_cls: (M,) class ids; ppe: (M, 4) xyxy.
+    Returns (owner, score): owner[m] is the person row wearing PPE box m or
+    -1, score[m] its match score. Each person gets at most one box per class.
+    """
+    cfg = cfg or DEFAULT_ASSOCIATION
+    persons = np.asarray(persons, dtype=np.float32).reshape(-1, 4)
+    ppe = np.asarray(ppe, dtype=np.float32).reshape(-1, 4)
+    ppe_cls = np.asarray(ppe_cls, dtype=np.intp).reshape(-1)
+    owner = np.full(len(ppe), -1, dtype=np.intp)
+    best = np.zeros(len(ppe), dtype=np.float32)
+    if len(persons) == 0 or len(ppe) == 0:
+        return owner, best
+
+    pw = (persons[:, 2] - persons[:, 0])[:, None] * cfg["expand_x"]
+    ph = (persons[:, 3] - persons[:, 1])[:, None] * cfg["expand_y"]
+    expanded = persons + np.hstack([-pw, -ph, pw, ph])
+    centers = np.stack([(ppe[:, 0] + ppe[:, 2]) / 2, (ppe[:, 1] + ppe[:, 3]) / 2], axis=1)
+
+    pi, pj = _candidate_pairs(expanded, centers, max(int(cfg["cell"]), 8))
+    if len(pi) == 0:
+        return owner, best
+
+    score = _score_pairs(persons, expanded, ppe_cls, ppe, pi, pj)
+    keep = score >= cfg["min_score"]
+    pi, pj, score = pi[keep], pj[keep], score[keep]
+    keep = _top_k(pi, score, int(cfg["max_candidates"]))
+    pi, pj, score = pi[keep], pj[keep], score[keep]
+
+    pair_cls = ppe_cls[pi]
+    for cid in np.unique(pair_cls):
+        sel = pair_cls == cid
+        _assign(pi[sel], pj[sel], score[sel], owner, best)
+    return owner, best
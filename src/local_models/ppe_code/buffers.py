@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class BufferPool:
+    """
+    Per-stream scratch arrays keyed by (name, shape, dtype).
+
+    Each name holds one array; asking for a new shape under the same name
+    replaces it, so a stream whose resolution changes does not accumulate
+    stale buffers. A buffer is only valid until the next request for the
+    same name, i.e. for the rest of the current frame.
+    """
+
+    def __init__(self):
+        self._buffers = {}      # name -> ndarray
+        self.allocations = 0
+        self.reuses = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        buf = self._buffers.get(name)
+        if buf is not None and buf.shape == shape and buf.dtype == dtype:
+            self.reuses += 1
+            return buf
+
+        buf = np.empty(shape, dtype=dtype)
+        self._buffers[name] = buf
+        self.allocations += 1
+        return buf
+
+    def copy_into(self, name, src):
+        """Pooled copy of src (replaces src.copy() on the per-frame path)."""
+        buf = self.get(name, src.shape, src.dtype)
+        np.copyto(buf, src)
+        return buf
+
+    def stats(self):
+        return {
+            "buffers": len(self._buffers),
+            "bytes": sum(b.nbytes for b in self._buffers.values()),
+            "allocations": self.allocations,
+            "reuses": self.reuses,
+        }
@@ -76,10 +76,10 @@ import os
 import io
 import json
 import base64
-import torch
+import time
+import inspect
+import logging
 import cv2
-from PIL import Image
-from ultralytics import YOLO
 
 
 import sys, os
@@ -88,35 +88,185 @@ import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
 from .ppe_logic import PPELogic
+from .tiling import normalize_tiling, tiled_predict
+from .two_stage import TwoStagePPELogic, PERSON_CLASS_ID, load_two_stage
+from .warmup import DEFAULT_WARMUP, compile_model, warmup_shapes
+from .buffers import BufferPool
 
 FRAME_WARMUP_RUNS = 3
 REQUIREMENTS_PATH = "/opt/ml/model/code/requirements.txt"
 MODEL_ENV_NAME = os.environ.get("SAGEMAKER_MODEL_NAME", "ppe_model")
+TRACKER_CFG = "bytetrack.yaml"
 
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"[INFO] Inference will run on: {DEVICE}")
+logger = logging.getLogger("inference")
+logger.setLevel(logging.INFO)
+
+# torch / ultralytics are imported lazily so importing this module stays cheap
+# (storage workers and the web process import it without loading a model).
+_device = None
+
+
+def get_device():
+    """Resolve the inference device once, on first use."""
+    global _device
+    if _device is None:
+        import torch
+        _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        logger.info(f"Inference will run on: {_device}")
+    return _device
 
 
 # ---------- Load model ----------
-def model_fn(model_dir):
-    model_path = os.path.join(model_dir, "best.pt")
+def model_fn(model_dir, weights=None):
+    from ultralytics import YOLO
+
+    model_path = weights or os.path.join(model_dir, "best.pt")
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"Model weights not found at {model_path}")
 
-    model = YOLO(model_path).to(DEVICE)
+    device = get_device()
+    model = YOLO(model_path).to(device)
     model.eval()
+    return model
+
 
-    # Warmup
-    if DEVICE.type == "cuda":
-        for _ in range(FRAME_WARMUP_RUNS):
-            dummy = torch.zeros((1, 3, 640, 640), dtype=torch.float32, device=DEVICE)
-            _ = model(dummy, verbose=False, device=DEVICE)
+def warmup_fn(model, cfg=None):
+    """
+    Compile (PPE_COMPILE) and warm the detector on every configured shape,
+    then push one frame through the full stream path (tracker, PPELogic,
+    encode) so a new stream's first frame costs the same as its hundredth.
+    Runs on CPU and GPU alike; returns the model to serve.
+    """
+    import numpy as np
+
+    cfg = dict(DEFAULT_WARMUP, **(cfg or {}))
+    device = get_device()
+    model = compile_model(model, cfg["compile"], cfg, device)
+    warmup_shapes(model, device, cfg)
 
-    # Attach PPELogic
-    model.ppe_logic = PPELogic(model_path)
+    frame = np.zeros(cfg["frame"] + (3,), dtype=np.uint8)
+    state = StreamState()
+    for _ in range(2):
+        predict_fn(frame, model, state)
     return model
 
 
+def two_stage_model_fn(model_dir):
+    """Person detector + PPE attribute classifier for pipeline="two_stage"."""
+    return load_two_stage(model_dir, get_device())
+
+
+# ---------- Per-stream state ----------
+PIPELINES = ("detector", "two_stage")
+
+
+def new_tracker(frame_rate=30):
+    """Standalone ByteTrack instance (same config model.track() would use)."""
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+
+    try:
+        from ultralytics.utils import YAML
+        cfg = YAML.load(check_yaml(TRACKER_CFG))
+    except ImportError:
+        from ultralytics.utils import yaml_load
+        cfg = yaml_load(check_yaml(TRACKER_CFG))
+
+    # ultralytics < 8.4.x scales track_buffer by frame_rate / 30 itself; later
+    # releases dropped the frame_rate argument, so the scaling is done here
+    if "frame_rate" in inspect.signature(BYTETracker.__init__).parameters:
+        return BYTETracker(args=IterableSimpleNamespace(**cfg), frame_rate=frame_rate)
+    cfg["track_buffer"] = max(1, int(frame_rate / 30.0 * cfg["track_buffer"]))
+    return BYTETracker(args=IterableSimpleNamespace(**cfg))
+
+
+TRACK_ID_PRUNE = 256    # id map size that triggers dropping finished tracks
+
+
+class StreamState:
+    """
+    Everything one camera stream carries between frames: frame counter,
+    ByteTrack instance, PPELogic buffers, a scratch BufferPool and its
+    inference options. Each stream owns its own state so IDs never leak
+    between cameras: ByteTrack's IDs come from a process-wide counter, so
+    they are remapped to per-stream IDs 1, 2, 3... in order of appearance,
+    which also makes them repeatable when a recording is replayed.
+
+    pipeline="detector" runs the 7-class model + box association,
+    pipeline="two_stage" runs person detection + crop classification.
+    """
+
+    def __init__(self, tiling=None, frame_rate=30, pipeline="detector", two_stage=None, decision_cache=None, rules=None, association=None):
+        self.frame_counter = 0
+        self.frame_rate = frame_rate
+        self.tracker = None
+        self.track_ids = {}      # ByteTrack id -> stream-local id
+        self.next_track_id = 1
+        self.metrics = None  # optional src.utils.metrics.StreamMetrics
+        self.pool = BufferPool()
+        self.pipeline = pipeline if pipeline in PIPELINES else "detector"
+        if self.pipeline == "two_stage":
+            self.ppe_logic = TwoStagePPELogic(two_stage, rules=rules)
+            self.tiling = None
+        else:
+            self.ppe_logic = PPELogic(decision_cache=decision_cache, rules=rules, association=association)
+            self.tiling = normalize_tiling(tiling)
+        self.ppe_logic.pool = self.pool
+
+    def reset_tracks(self):
+        """Start tracking afresh: new ByteTrack (built on the next frame), empty PPE history."""
+        self.tracker = None
+        self.track_ids.clear()   # numbering continues, so old and new IDs never collide
+        self.ppe_logic.reset_tracks()
+
+    def local_track_ids(self, raw_ids):
+        """Map ByteTrack ids to stream-local ones, numbering new tracks as they appear."""
+        ids = self.track_ids
+        if len(ids) > TRACK_ID_PRUNE:
+            # Forget tracks ByteTrack no longer holds (removed tracks never come back)
+            live = {t.track_id for t in self.tracker.tracked_stracks + self.tracker.lost_stracks}
+            self.track_ids = ids = {k: v for k, v in ids.items() if k in live}
+        out = []
+        for raw in raw_ids:
+            local = ids.get(raw)
+            if local is None:
+                local = ids[raw] = self.next_track_id
+                self.next_track_id += 1
+            out.append(local)
+        return out
+
+
+_default_state = None
+
+
+def _get_default_state():
+    global _default_state
+    if _default_state is None:
+        _default_state = StreamState()
+    return _default_state
+
+
+def _update_tracker(state, result):
+    """Feed detections into the stream's ByteTrack (mirrors ultralytics' track callback)."""
+    import torch
+
+    if state.tracker is None:
+        state.tracker = new_tracker(state.frame_rate)
+
+    det = result.boxes.cpu().numpy()
+    tracks = state.tracker.update(det, result.orig_img)
+    if len(tracks) == 0:
+        return result
+
+    # Column 4 is the track id
+    tracks[:, 4] = state.local_track_ids(tracks[:, 4].astype(int).tolist())
+    idx = tracks[:, -1].astype(int)
+    result = result[idx]
+    result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+    return result
+
+
 # ---------- Input parser ----------
 def input_fn(request_body, content_type="application/json"):
     if content_type != "application/json":
@@ -126,40 +276,106 @@ def input_fn(request_body, content_type="application/json"):
     if "image" not in data:
         raise ValueError("JSON must contain 'image' field with base64 string")
 
+    from PIL import Image
+
     image_bytes = base64.b64decode(data["image"])
     return Image.open(io.BytesIO(image_bytes)).convert("RGB")
 
 
 # ---------- Prediction ----------
-frame_counter = 0  # global frame counter
+def predict_fn(input_data, model, state=None, encode=True):
+    """
+    input_data: PIL image (RGB) or BGR ndarray. With encode=False the
+    annotated frame is returned as the stream's pooled BGR array instead of
+    a base64 JPEG; it is only valid until the stream's next frame.
+    """
+    state = state or _get_default_state()
+    state.frame_counter += 1
+    frame_counter = state.frame_counter
+    device = get_device()
+
+    if state.pipeline == "two_stage":
+        return _predict_two_stage(input_data, model, state, encode)
+
+    m = state.metrics
+
+    # Coarse full-frame pass
+    results = model.predict(
+        source=input_data,
+        conf=0.1,
+        stream=False,
+        verbose=False,
+        device=device
+    )
+    result = results[0]
+    if m is not None:
+        m.observe_speed(result.speed)
+
+    # Optional sliced pass around people for small/distant PPE
+    if state.tiling:
+        t0 = time.perf_counter()
+        result = tiled_predict(model, result, state.tiling, device)
+        if m is not None:
+            m.inference.observe(time.perf_counter() - t0)
+
+    # ByteTrack for persistent IDs
+    t0 = time.perf_counter()
+    result = _update_tracker(state, result)
+    t1 = time.perf_counter()
+
+    # Apply PPE logic to get annotated frame + person info
+    frame, detections_json,alert= state.ppe_logic.process_frame(result, frame_num=frame_counter)
+    if m is not None:
+        t2 = time.perf_counter()
+        m.tracker.observe(t1 - t0)
+        m.ppe_logic.observe(t2 - t1)
 
-def predict_fn(input_data, model):
-    global frame_counter
-    frame_counter += 1
+    return _wrap_output(frame_counter, frame, detections_json, alert, m, encode)
 
-    # Use YOLO tracking for persistent IDs
-    results = model.track(
+
+def _predict_two_stage(input_data, models, state, encode=True):
+    """Person detector -> ByteTrack -> batched crop classification for stale tracks."""
+    results = models.detector.predict(
         source=input_data,
         conf=0.1,
-        tracker="bytetrack.yaml",
-        batch=32,
-        persist=True,
+        classes=[PERSON_CLASS_ID],
         stream=False,
         verbose=False,
-        device=DEVICE
+        device=models.device
     )
+    m = state.metrics
+    if m is not None:
+        m.observe_speed(results[0].speed)
+
+    t0 = time.perf_counter()
+    result = _update_tracker(state, results[0])
+    t1 = time.perf_counter()
+
+    frame, detections_json, alert = state.ppe_logic.process_frame(
+        result, frame_num=state.frame_counter, models=models
+    )
+    if m is not None:
+        t2 = time.perf_counter()
+        m.tracker.observe(t1 - t0)
+        m.ppe_logic.observe(t2 - t1)
+
+    return _wrap_output(state.frame_counter, frame, detections_json, alert, m, encode)
 
-    # Apply PPE logic to get annotated frame + person info
-    frame, detections_json,alert= model.ppe_logic.process_frame(results[0], frame_num=frame_counter)
 
-    # Encode annotated frame as base64
-    _, buffer = cv2.imencode(".jpg", frame)
-    annotated_b64 = base64.b64encode(buffer).decode("utf-8")
+def _wrap_output(frame_counter, frame, detections_json, alert, m=None, encode=True):
+    # Encode annotated frame as base64 (request/response callers only)
+    annotated = frame
+    if encode:
+        t0 = time.perf_counter()
+        _, buffer = cv2.imencode(".jpg", frame)
+        annotated = base64.b64encode(buffer).decode("utf-8")
+        if m is not None:
+            m.add_encode(time.perf_counter() - t0)
 
     # Wrap output by frame
     output = {
         "frame": frame_counter,
-        "annotated_frame": annotated_b64,
+        "annotated_frame": annotated,
         "detections": detections_json,
         "alerts":alert
     }
@@ -179,12 +395,13 @@ def output_fn(prediction, accept="application/json"):
 
 if __name__ == "__main__":
     import numpy as np
+    from PIL import Image
     from src.utils.kvs_stream import get_kvs_hls_url
+    from src.utils.video_source import open_video_source
 
     print("[INFO] Running in local video test mode...")
 
     # ---------- Setup ----------
-    DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     FRAME_WARMUP_RUNS = 1
     model_dir = "."  # folder where best.pt is located
     model = model_fn(model_dir)
@@ -196,7 +413,7 @@ if __name__ == "__main__":
     # if not os.path.exists(video_path):
     #     raise FileNotFoundError(f"Video not found: {video_path}")
 
-    cap = cv2.VideoCapture(url)
+    cap = open_video_source(url)
     if not cap.isOpened():
         raise RuntimeError("Failed to open video file")
 
@@ -205,9 +422,9 @@ if __name__ == "__main__":
     out = None
     save_output = False # Set to False if you just want to view live without saving
 
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS) or 20.0
+    frame_width = cap.frame_width
+    frame_height = cap.frame_height
+    fps = cap.fps or 20.0
 
     if save_output:
         out = cv2.VideoWriter("annotated_video.mp4", fourcc, fps, (frame_width, frame_height))
@@ -113,32 +113,77 @@
 
 
 import cv2
+import numpy as np
 from collections import defaultdict, deque
 
+from .ppe_rules import PERSON, compile_rules
+from .association import associate, normalize_association
+
+# Decision cache for confidently compliant tracks
+DEFAULT_DECISION_CACHE = {
+    "enabled": True,
+    # (min confidence margin, frames between re-evaluations), checked in order
+    "intervals": ((0.8, 15), (0.5, 5)),
+    "move_ratio": 0.25,     # centre shift, as a fraction of bbox size, that forces re-evaluation
+    "scale_ratio": 1.3,     # bbox area growth/shrink factor that forces re-evaluation
+    "prune_after": 300,     # frames an unseen track keeps its cache entry
+}
+
+
+def validate_decision_cache(cfg):
+    """Raise ValueError for decision cache options PPELogic cannot use; returns them normalized."""
+    if cfg is None or cfg is False:
+        return cfg
+    if cfg is True:
+        return None
+    if not isinstance(cfg, dict):
+        raise ValueError("decision_cache must be true, false or an object")
+    opts = dict(DEFAULT_DECISION_CACHE)
+    opts.update({k: v for k, v in cfg.items() if k in DEFAULT_DECISION_CACHE})
+    try:
+        opts["enabled"] = bool(opts["enabled"])
+        opts["intervals"] = tuple((float(margin), int(frames)) for margin, frames in opts["intervals"])
+        opts["move_ratio"] = float(opts["move_ratio"])
+        opts["scale_ratio"] = float(opts["scale_ratio"])
+        opts["prune_after"] = int(opts["prune_after"])
+    except (TypeError, ValueError):
+        raise ValueError("intervals must be [margin, frames] pairs and the other values numbers")
+    if any(frames < 1 for _, frames in opts["intervals"]):
+        raise ValueError("interval frames must be at least 1")
+    if opts["move_ratio"] <= 0 or opts["scale_ratio"] < 1.0 or opts["prune_after"] < 1:
+        raise ValueError("move_ratio must be positive, scale_ratio at least 1 and prune_after at least 1")
+    return opts
+
+
+def box_arrays(boxes):
+    """(cls, conf, xyxy, ids) numpy arrays for ultralytics Boxes or a plain list of boxes."""
+    n = len(boxes)
+    if n == 0:
+        return (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32),
+                np.empty((0, 4), dtype=np.intp), np.empty(0, dtype=np.intp))
+    if hasattr(boxes, "data"):
+        boxes = boxes.cpu().numpy()
+        ids = boxes.id.astype(np.intp) if boxes.id is not None else np.full(n, -1, dtype=np.intp)
+        return boxes.cls.astype(np.intp), boxes.conf, boxes.xyxy.astype(np.intp), ids
+    cls = np.array([int(b.cls.item()) for b in boxes], dtype=np.intp)
+    conf = np.array([float(b.conf.item()) for b in boxes], dtype=np.float32)
+    xyxy = np.array([[int(v) for v in b.xyxy[0]] for b in boxes], dtype=np.intp)
+    ids = np.array([int(b.id.item()) if b.id is not None else -1 for b in boxes], dtype=np.intp)
+    return cls, conf, xyxy, ids
+
+
+def summary_text(comparisons):
+    return " ".join(f"{item[0].upper()}:{comparisons[item]}" for item in ("helmet", "vest", "boots") if item in comparisons)
+
+
 class PPELogic:
-    def __init__(self, model_path=None):
-
-        # Thresholds per class
-        self.class_thresholds = {
-            0: 0.4,  # boots
-            1: 0.5,  # helmet
-            2: 0.3,  # no boots
-            3: 0.3,  # no helmet
-            4: 0.2,  # no vest
-            5: 0.5,  # person
-            6: 0.5   # vest
-        }
+    def __init__(self, model_path=None, decision_cache=None, rules=None, association=None):
 
-        # Colors for drawing
-        self.class_colors = {
-            0: (255, 0, 0),
-            1: (0, 255, 255),
-            2: (0, 0, 255),
-            3: (255, 0, 255),
-            4: (0, 255, 0),
-            5: (0, 165, 255),
-            6: (128, 0, 128)
-        }
+        # Thresholds, colors, required PPE and zones (see ppe_rules.DEFAULT_RULES)
+        self.rules = compile_rules(rules)
+
+        # PPE-to-person matching (grid index + anatomical priors + one-to-one assignment)
+        self.association = normalize_association(association)
 
         # Rolling average buffer
         self.score_buffers = defaultdict(lambda: defaultdict(lambda: deque(maxlen=30)))
@@ -148,112 +193,252 @@ class PPELogic:
         # False → no alert sent or currently violating
         self.alert_sent = defaultdict(lambda: True)
 
+        # Per-track decision cache: pid -> {bbox, frame, avg_scores, ppe_status, summary, interval}
+        self.cache_config = dict(DEFAULT_DECISION_CACHE)
+        if isinstance(decision_cache, dict):
+            self.cache_config.update(decision_cache)
+        elif decision_cache is False:
+            self.cache_config["enabled"] = False
+        self.decision_cache = {}
+        self.cache_stats = {"hits": 0, "misses": 0, "revalidations": 0}
+
+        # Optional per-stream BufferPool (set by StreamState) for the annotation canvas
+        self.pool = None
+
+
+    # ------------------------- RULES -------------------------
+    def set_rules(self, rules):
+        """Swap in new rules between frames; cached decisions were made under the old ones."""
+        self.rules = compile_rules(rules)
+        self.decision_cache.clear()
+        return self.rules
+
+    def reset_tracks(self):
+        """Forget per-track history (after a long stream outage the tracker restarts its IDs)."""
+        self.score_buffers.clear()
+        self.alert_sent.clear()
+        self.decision_cache.clear()
+
+
+    # ------------------------- DECISION CACHE -------------------------
+    def _cached_decision(self, pid, bbox, frame_num):
+        """Return the cached decision for pid if it is still valid for this bbox, else None."""
+        if pid == -1 or not self.cache_config["enabled"]:
+            return None
+
+        entry = self.decision_cache.get(pid)
+        if entry is None:
+            self.cache_stats["misses"] += 1
+            return None
+
+        x1, y1, x2, y2 = bbox
+        cx1, cy1, cx2, cy2 = entry["bbox"]
+        w, h = max(cx2 - cx1, 1), max(cy2 - cy1, 1)
+        moved = (
+            abs((x1 + x2) - (cx1 + cx2)) / 2 > self.cache_config["move_ratio"] * w or
+            abs((y1 + y2) - (cy1 + cy2)) / 2 > self.cache_config["move_ratio"] * h
+        )
+        scale = max((x2 - x1) * (y2 - y1), 1) / (w * h)
+        rescaled = scale > self.cache_config["scale_ratio"] or scale < 1.0 / self.cache_config["scale_ratio"]
+
+        if moved or rescaled or frame_num - entry["frame"] >= entry["interval"]:
+            del self.decision_cache[pid]
+            self.cache_stats["revalidations"] += 1
+            return None
+
+        self.cache_stats["hits"] += 1
+        return entry
+
+    def _store_decision(self, pid, bbox, frame_num, avg_scores, comparisons, summary):
+        """Cache a compliant decision with a revalidation interval based on its margin."""
+        if pid == -1 or not self.cache_config["enabled"]:
+            return
+        if not all(v == "yes" for v in comparisons.values()):
+            self.decision_cache.pop(pid, None)
+            return
+
+        margin = min(
+            (avg_scores.get(item, 0) - avg_scores.get(f"no {item}", 0) for item in comparisons),
+            default=1.0
+        )
+        interval = 0
+        for min_margin, frames in self.cache_config["intervals"]:
+            if margin >= min_margin:
+                interval = frames
+                break
+        if interval <= 1:
+            return
+
+        self.decision_cache[pid] = {
+            "bbox": bbox,
+            "frame": frame_num,
+            "avg_scores": avg_scores,
+            "ppe_status": comparisons,
+            "summary": summary,
+            "interval": interval,
+        }
+
+    def _prune_cache(self, frame_num):
+        prune_after = self.cache_config["prune_after"]
+        for pid in [p for p, e in self.decision_cache.items() if frame_num - e["frame"] > prune_after]:
+            del self.decision_cache[pid]
+
+    def cache_metrics(self):
+        """Hit rate and revalidation counters for the decision cache."""
+        stats = dict(self.cache_stats)
+        lookups = stats["hits"] + stats["misses"] + stats["revalidations"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["cached_tracks"] = len(self.decision_cache)
+        return stats
+
+
+    def _canvas(self, img):
+        """Annotation canvas: a pooled copy of the frame, valid until the next frame."""
+        if self.pool is None:
+            return img.copy()
+        return self.pool.copy_into("canvas", img)
+
 
     def process_frame(self, result, frame_num=1):
-        frame = result.orig_img.copy()
+        frame = self._canvas(result.orig_img)
         detections_json = []
         alerts = []
+        rules = self.rules
+        colors = rules.colors
+
+        # ------------------------ THRESHOLDS (all boxes at once) ------------------------
+        cls, conf, xyxy, ids = box_arrays(result.boxes)
+        keep = rules.keep(cls, conf)
+        person_idx = np.flatnonzero(keep & (cls == PERSON))
+        ppe_idx = np.flatnonzero(keep & (cls != PERSON))
 
+        # ------------------------ PERSON DETECTION ------------------------
         persons = []
+        for i in person_idx:
+            x1, y1, x2, y2 = (int(v) for v in xyxy[i])
+            pid = int(ids[i])
+            persons.append((pid, (x1, y1, x2, y2)))
+
+            color = colors[PERSON]
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(frame, f"ID:{pid} person {conf[i]:.2f}", (x1, y1 - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        # ------------------------ PPE DETECTION ------------------------
         others = []
+        for i in ppe_idx:
+            cls_id = int(cls[i])
+            x1, y1, x2, y2 = (int(v) for v in xyxy[i])
+            others.append((cls_id, (x1, y1, x2, y2)))
 
-        # ------------------------ PERSON DETECTION ------------------------
-        for box in result.boxes:
-            cls_id = int(box.cls.item())
-            conf = float(box.conf.item())
+            color = colors[cls_id] if cls_id < len(colors) else (255, 255, 255)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(frame, f"{result.names[cls_id]} {conf[i]:.2f}", (x1, y1 - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        # ------------------------ ASSOCIATION ------------------------
+        # Every person competes for the PPE boxes, including cached and out-of-zone ones,
+        # so a neighbour's helmet is never credited to the wrong person
+        owner, _ = associate(xyxy[person_idx], cls[ppe_idx], xyxy[ppe_idx], self.association)
+        frame_classes = sorted({cls_id for cls_id, _ in others})
+        worn_by = defaultdict(set)
+        for (cls_id, _), row in zip(others, owner):
+            if row >= 0:
+                worn_by[row].add(cls_id)
 
-            if conf < self.class_thresholds.get(cls_id, 0.5):
+        # ------------------------ PPE LOGIC PER PERSON ------------------------
+        h, w = frame.shape[:2]
+        in_zone = rules.in_zone([bbox for _, bbox in persons], w, h)
+        fresh = []
+        for row, ((pid, (px1, py1, px2, py2)), applies) in enumerate(zip(persons, in_zone)):
+            bbox = [px1, py1, px2, py2]
+            if not applies:
+                # Outside every rule zone: reported, never checked or alerted on
+                detections_json.append({"person_id": pid, "avg_scores": {"person": 1.0}, "ppe_status": {}, "bbox": bbox})
+                self.update_alert(pid, {}, bbox, alerts)
                 continue
 
-            if cls_id == 5:  # person
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                pid = int(box.id.item()) if box.id is not None else -1
-                persons.append((pid, (x1, y1, x2, y2)))
+            # One sample per PPE class seen this frame: 1.0 if this person was matched to it.
+            # Recorded on cache hits too, so a revalidation averages what happened meanwhile
+            worn = worn_by.get(row, ())
+            for cls_id in frame_classes:
+                self.score_buffers[pid][cls_id].append(1.0 if cls_id in worn else 0.0)
+
+            # Stable compliant track: reuse the cached decision
+            cached = self._cached_decision(pid, (px1, py1, px2, py2), frame_num)
+            if cached is not None:
+                detections_json.append({
+                    "person_id": pid,
+                    "avg_scores": cached["avg_scores"],
+                    "ppe_status": cached["ppe_status"],
+                    "bbox": bbox
+                })
+                cv2.putText(frame, cached["summary"], (px1, py2 + 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+                self.update_alert(pid, cached["ppe_status"], bbox, alerts)
+                continue
 
-                label = f"ID:{pid} person {conf:.2f}"
-                color = self.class_colors.get(cls_id, (255, 255, 255))
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                cv2.putText(frame, label, (x1, y1 - 5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+            fresh.append((pid, bbox, len(detections_json)))
+            detections_json.append(None)    # filled below, keeping person order
 
-        # ------------------------ PPE DETECTION ------------------------
-        for box in result.boxes:
-            cls_id = int(box.cls.item())
-            conf = float(box.conf.item())
+        if fresh:
+            # Rolling averages for every fresh person, then one vectorized rule check
+            scores = np.zeros((len(fresh), len(colors)), dtype=np.float64)
+            for row, (pid, _, _) in enumerate(fresh):
+                for cid, buf in self.score_buffers[pid].items():
+                    if cid < scores.shape[1]:
+                        scores[row, cid] = sum(buf) / len(buf)
+            worn = rules.evaluate(scores)
 
-            if cls_id == 5 or conf < self.class_thresholds.get(cls_id, 0.5):
-                continue
+            for row, (pid, bbox, slot) in enumerate(fresh):
+                avg_scores = {}
+                for cid, buf in self.score_buffers[pid].items():
+                    avg_scores[result.names[cid]] = sum(buf) / len(buf)
+                avg_scores["person"] = 1.0
 
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            others.append((cls_id, (x1, y1, x2, y2)))
+                # PPE status for the required items only
+                comparisons = {item: "yes" if ok else "no" for item, ok in zip(rules.items, worn[row])}
 
-            label = f"{result.names[cls_id]} {conf:.2f}"
-            color = self.class_colors.get(cls_id, (255, 255, 255))
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-            cv2.putText(frame, label, (x1, y1 - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+                detections_json[slot] = {
+                    "person_id": pid,
+                    "avg_scores": avg_scores,
+                    "ppe_status": comparisons,
+                    "bbox": bbox
+                }
 
-        # ------------------------ PPE LOGIC PER PERSON ------------------------
-        for pid, (px1, py1, px2, py2) in persons:
-
-            scores = defaultdict(float)
-
-            # Assign PPE inside person box
-            for cls_id, (x1, y1, x2, y2) in others:
-                inside = (x1 > px1 and y1 > py1 and x2 < px2 and y2 < py2)
-                score = 1.0 if inside else 0.0
-                scores[cls_id] = score
-                self.score_buffers[pid][cls_id].append(score)
-
-            # Rolling averages
-            avg_scores = {}
-            for cid, buf in self.score_buffers[pid].items():
-                avg_scores[result.names[cid]] = sum(buf) / len(buf)
-
-            avg_scores["person"] = 1.0
-
-            # PPE status
-            comparisons = {
-                "boots":  "yes" if avg_scores.get("boots", 0)  > avg_scores.get("no boots", 0)  else "no",
-                "helmet": "yes" if avg_scores.get("helmet", 0) > avg_scores.get("no helmet", 0) else "no",
-                "vest":   "yes" if avg_scores.get("vest", 0)   > avg_scores.get("no vest", 0)   else "no"
-            }
-
-            detections_json.append({
-                "person_id": pid,
-                "avg_scores": avg_scores,
-                "ppe_status": comparisons,
-                "bbox": [px1, py1, px2, py2]
-            })
-
-            summary = f"H:{comparisons['helmet']} V:{comparisons['vest']} B:{comparisons['boots']}"
-            cv2.putText(frame, summary, (px1, py2 + 20),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-
-            # ------------------------- ALERT LOGIC -------------------------
-            helmet_ok = comparisons["helmet"] == "yes"
-            vest_ok   = comparisons["vest"]   == "yes"
-            boots_ok  = comparisons["boots"]  == "yes"
-
-            is_safe = helmet_ok and vest_ok and boots_ok
-            previous_alert_state = self.alert_sent[pid]
-
-            if not is_safe:
-                # ❗ Violation started AND alert not sent → SEND ALERT ONCE
-                if previous_alert_state:  
-                    alerts.append({
-                        "person_id": pid,
-                        "status": "violation",
-                        "ppe_status": comparisons,
-                        "bbox": [px1, py1, px2, py2]
-                    })
-
-                # Mark person as "in violation"
-                self.alert_sent[pid] = False
-
-            else:
-                # Person fully safe → reset alert
-                self.alert_sent[pid] = True
+                summary = summary_text(comparisons)
+                cv2.putText(frame, summary, (bbox[0], bbox[3] + 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+                self._store_decision(pid, tuple(bbox), frame_num, avg_scores, comparisons, summary)
+                self.update_alert(pid, comparisons, bbox, alerts)
+
+        if frame_num % 100 == 0:
+            self._prune_cache(frame_num)
 
         return frame, detections_json, alerts if alerts else None
 
+
+    # ------------------------- ALERT LOGIC -------------------------
+    def update_alert(self, pid, comparisons, bbox, alerts):
+        # Only the camera's required PPE is in comparisons
+        is_safe = all(v == "yes" for v in comparisons.values())
+        previous_alert_state = self.alert_sent[pid]
+
+        if not is_safe:
+            # ❗ Violation started AND alert not sent → SEND ALERT ONCE
+            if previous_alert_state:  
+                alerts.append({
+                    "person_id": pid,
+                    "status": "violation",
+                    "ppe_status": comparisons,
+                    "bbox": bbox
+                })
+
+            # Mark person as "in violation"
+            self.alert_sent[pid] = False
+
+        else:
+            # Person fully safe → reset alert
+            self.alert_sent[pid] = True
+
@@ -0,0 +1,156 @@
+import os
+import json
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger("inference")
+logger.setLevel(logging.INFO)
+
+# ---------- Detector classes ----------
+CLASS_NAMES = ("boots", "helmet", "no boots", "no helmet", "no vest", "person", "vest")
+CLASS_IDS = {name: cid for cid, name in enumerate(CLASS_NAMES)}
+PERSON = CLASS_IDS["person"]
+
+# PPE item -> (class that confirms it, class that denies it); payload order
+PPE_ITEMS = ("boots", "helmet", "vest")
+ITEM_CLASSES = {item: (CLASS_IDS[item], CLASS_IDS[f"no {item}"]) for item in PPE_ITEMS}
+
+# ---------- Defaults ----------
+DEFAULT_THRESHOLDS = {
+    "boots": 0.4, "helmet": 0.5, "no boots": 0.3, "no helmet": 0.3,
+    "no vest": 0.2, "person": 0.5, "vest": 0.5,
+}
+DEFAULT_COLORS = {
+    "boots": (255, 0, 0), "helmet": (0, 255, 255), "no boots": (0, 0, 255),
+    "no helmet": (255, 0, 255), "no vest": (0, 255, 0), "person": (0, 165, 255),
+    "vest": (128, 0, 128),
+}
+DEFAULT_RULES = {
+    "required": list(PPE_ITEMS),    # PPE a person must wear; the others are not checked or alerted on
+    "thresholds": {},               # class name -> min confidence, over DEFAULT_THRESHOLDS
+    "colors": {},                   # class name -> BGR, over DEFAULT_COLORS
+    "zones": None,                  # polygons [[x, y], ...] in 0..1 frame coords; None = whole frame
+}
+
+# Per-camera rules store: {"<camera_id>": {...}, "default": {...}}
+RULES_FILE = os.getenv("PPE_RULES_FILE")
+
+
+# -------------------------------------------------------------------------------
+# Compiled evaluator
+# -------------------------------------------------------------------------------
+
+class CompiledRules:
+    """
+    Rules flattened into arrays once, so the per-frame work is a few numpy
+    ops over all boxes / persons instead of dict lookups per box.
+    """
+
+    def __init__(self, required, thresholds, colors, zones, source):
+        self.items = tuple(item for item in PPE_ITEMS if item in required)
+        self.thresholds = thresholds                    # float32[n_classes], indexed by class id
+        self.colors = colors                            # BGR tuple per class id
+        self.zones = zones                              # list of float32 (K, 2) polygons
+        self.yes_ids = np.array([ITEM_CLASSES[i][0] for i in self.items], dtype=np.intp)
+        self.no_ids = np.array([ITEM_CLASSES[i][1] for i in self.items], dtype=np.intp)
+        self.source = source
+
+    def keep(self, cls, conf):
+        """Boxes over their class threshold; unknown classes use 0.5."""
+        known = cls < len(self.thresholds)
+        limit = np.where(known, self.thresholds[np.where(known, cls, 0)], 0.5)
+        return conf >= limit
+
+    def in_zone(self, boxes, width, height):
+        """Whether each (N, 4) box's foot point lies in a rule zone."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if not self.zones or len(boxes) == 0:
+            return np.ones(len(boxes), dtype=bool)
+        px = ((boxes[:, 0] + boxes[:, 2]) / 2 / max(width, 1))[:, None]
+        py = (boxes[:, 3] / max(height, 1))[:, None]
+        inside = np.zeros(len(boxes), dtype=bool)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for poly in self.zones:
+                x1, y1 = poly[:, 0], poly[:, 1]
+                x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+                crosses = ((y1 > py) != (y2 > py)) & (px < (x2 - x1) * (py - y1) / (y2 - y1) + x1)
+                inside |= crosses.sum(axis=1) % 2 == 1
+        return inside
+
+    def evaluate(self, scores):
+        """(P, n_classes) rolling scores -> (P, n_required) bool, True = item worn."""
+        return scores[:, self.yes_ids] > scores[:, self.no_ids]
+
+
+def compile_rules(cfg=None):
+    """Validate a rules dict (see DEFAULT_RULES) and compile it; raises ValueError."""
+    if isinstance(cfg, CompiledRules):
+        return cfg
+    rules = dict(DEFAULT_RULES)
+    if isinstance(cfg, dict):
+        rules.update({k: v for k, v in cfg.items() if k in DEFAULT_RULES})
+
+    required = rules["required"] or []
+    unknown = [item for item in required if item not in ITEM_CLASSES]
+    if unknown:
+        raise ValueError(f"Unknown PPE items {unknown}; expected some of {list(PPE_ITEMS)}")
+
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for name, value in (rules["thresholds"] or {}).items():
+        if name not in CLASS_IDS:
+            raise ValueError(f"Unknown class {name!r} in thresholds")
+        if not 0.0 <= float(value) <= 1.0:
+            raise ValueError(f"Threshold for {name!r} must be within [0, 1]")
+        thresholds[name] = float(value)
+
+    colors = dict(DEFAULT_COLORS)
+    for name, value in (rules["colors"] or {}).items():
+        if name not in CLASS_IDS or len(value) != 3:
+            raise ValueError(f"Bad color for {name!r}")
+        colors[name] = tuple(int(v) for v in value)
+
+    zones = []
+    for poly in rules["zones"] or []:
+        poly = np.asarray(poly, dtype=np.float32)
+        if poly.ndim != 2 or poly.shape[0] < 3 or poly.shape[1] != 2:
+            raise ValueError("Each zone must be a polygon of at least 3 [x, y] points")
+        zones.append(poly)
+
+    return CompiledRules(
+        required=required,
+        thresholds=np.array([thresholds[name] for name in CLASS_NAMES], dtype=np.float32),
+        colors=[colors[name] for name in CLASS_NAMES],
+        zones=zones,
+        source=rules,
+    )
+
+
+# -------------------------------------------------------------------------------
+# Per-camera rules store
+# -------------------------------------------------------------------------------
+
+_store = {"mtime": None, "rules": {}}
+_store_lock = threading.Lock()
+
+
+def load_camera_rules(camera_id):
+    """
+    Rules for camera_id from PPE_RULES_FILE, else None. Read when a stream
+    starts (the file is re-parsed only if it changed since); running streams
+    pick up new rules only through update_rules.
+    """
+    if not RULES_FILE:
+        return None
+    with _store_lock:
+        try:
+            mtime = os.path.getmtime(RULES_FILE)
+            if mtime != _store["mtime"]:
+                with open(RULES_FILE) as f:
+                    _store["rules"] = json.load(f)
+                _store["mtime"] = mtime
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read rules file {RULES_FILE}: {e}")
+        rules = _store["rules"]
+        return rules.get(str(camera_id), rules.get("default"))
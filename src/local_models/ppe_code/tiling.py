@@ -0,0 +1,161 @@
+import numpy as np
+
+# ---------- Defaults ----------
+PERSON_CLASS_ID = 5
+
+DEFAULT_TILING = {
+    "enabled": False,
+    "tile_size": 320,       # tile edge in frame pixels (upscaled to imgsz by the model)
+    "overlap": 0.2,         # fraction of tile_size shared by neighbouring tiles
+    "imgsz": 640,           # model input size for the tile batch
+    "person_conf": 0.3,     # coarse-pass person confidence that triggers tiling
+    "iou": 0.5,             # class-aware NMS IoU when merging
+    "max_tiles": 16,        # hard cap per frame
+}
+TILE_EDGE_MARGIN = 2        # px; tile boxes this close to an inner tile edge are dropped as truncated
+
+
+def normalize_tiling(cfg):
+    """Accept True/False or a partial dict from start_stream and fill defaults."""
+    if not cfg:
+        return None
+    tiling = dict(DEFAULT_TILING)
+    if isinstance(cfg, dict):
+        tiling.update({k: v for k, v in cfg.items() if k in DEFAULT_TILING})
+    tiling["enabled"] = bool(cfg.get("enabled", True)) if isinstance(cfg, dict) else True
+    return tiling if tiling["enabled"] else None
+
+
+def validate_tiling(cfg):
+    """Raise ValueError for tiling options tiled_predict cannot use; returns them normalized."""
+    if cfg is not None and not isinstance(cfg, (bool, dict)):
+        raise ValueError("tiling must be true, false or an object")
+    tiling = normalize_tiling(cfg)
+    if tiling is None:
+        return None
+    try:
+        for key in ("tile_size", "imgsz", "max_tiles"):
+            tiling[key] = int(tiling[key])
+        for key in ("overlap", "person_conf", "iou"):
+            tiling[key] = float(tiling[key])
+    except (TypeError, ValueError):
+        raise ValueError("tile_size, imgsz, max_tiles, overlap, person_conf and iou must be numbers")
+    if tiling["tile_size"] < 32 or tiling["imgsz"] < 32 or tiling["max_tiles"] < 1:
+        raise ValueError("tile_size and imgsz must be at least 32 and max_tiles at least 1")
+    if not 0.0 <= tiling["overlap"] < 1.0:
+        raise ValueError("overlap must be within [0, 1)")
+    if not (0.0 <= tiling["person_conf"] <= 1.0 and 0.0 < tiling["iou"] <= 1.0):
+        raise ValueError("person_conf must be within [0, 1] and iou within (0, 1]")
+    return tiling
+
+
+# ---------- Tile selection ----------
+def _axis_starts(length, tile, stride):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def person_tiles(person_boxes, width, height, tile_size, overlap, max_tiles):
+    """
+    Overlapping grid tiles that intersect at least one person box.
+
+    Only these tiles are re-run, so the extra cost follows the number of
+    people in view rather than the frame area.
+    """
+    if len(person_boxes) == 0:
+        return []
+
+    tile = int(min(tile_size, width, height))
+    stride = max(1, int(tile * (1.0 - overlap)))
+    xs = np.array(_axis_starts(width, tile, stride))
+    ys = np.array(_axis_starts(height, tile, stride))
+
+    tiles = []
+    for y0 in ys:
+        for x0 in xs:
+            x1, y1 = x0 + tile, y0 + tile
+            hit = (
+                (person_boxes[:, 0] < x1) & (person_boxes[:, 2] > x0) &
+                (person_boxes[:, 1] < y1) & (person_boxes[:, 3] > y0)
+            )
+            if hit.any():
+                tiles.append((int(x0), int(y0), int(x1), int(y1)))
+
+    if len(tiles) > max_tiles:
+        # Keep the tiles covering the most people
+        counts = [
+            int(((person_boxes[:, 0] < x1) & (person_boxes[:, 2] > x0) &
+                 (person_boxes[:, 1] < y1) & (person_boxes[:, 3] > y0)).sum())
+            for x0, y0, x1, y1 in tiles
+        ]
+        order = np.argsort(counts)[::-1][:max_tiles]
+        tiles = [tiles[i] for i in sorted(order)]
+
+    return tiles
+
+
+# ---------- Tiled pass ----------
+def tiled_predict(model, result, tiling, device):
+    """
+    Re-run the detector on person tiles of result.orig_img in one batch and
+    merge the tile's PPE detections into the coarse result with class-aware NMS.
+    """
+    import torch
+    from torchvision.ops import batched_nms
+
+    coarse = result.boxes.data
+    if len(coarse) == 0:
+        return result
+
+    cls = coarse[:, 5]
+    conf = coarse[:, 4]
+    persons = coarse[(cls == PERSON_CLASS_ID) & (conf >= tiling["person_conf"])][:, :4]
+    if len(persons) == 0:
+        return result
+
+    img = result.orig_img
+    h, w = img.shape[:2]
+    tiles = person_tiles(
+        persons.cpu().numpy(), w, h,
+        tiling["tile_size"], tiling["overlap"], tiling["max_tiles"]
+    )
+    if not tiles:
+        return result
+
+    crops = [img[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles]
+    tile_results = model.predict(
+        source=crops,
+        imgsz=tiling["imgsz"],
+        conf=0.1,
+        verbose=False,
+        device=device
+    )
+
+    # Persons come from the coarse pass only: a person larger than a tile shows up
+    # in each tile as a truncated box that NMS would keep as an extra person.
+    # Boxes cut by an inner tile edge are partial PPE items for the same reason.
+    margin = TILE_EDGE_MARGIN
+    merged = [coarse]
+    for (x0, y0, x1, y1), tile_result in zip(tiles, tile_results):
+        data = tile_result.boxes.data
+        if len(data) == 0:
+            continue
+        tw, th = x1 - x0, y1 - y0
+        cut = (
+            ((data[:, 0] <= margin) & (x0 > 0)) | ((data[:, 2] >= tw - margin) & (x1 < w)) |
+            ((data[:, 1] <= margin) & (y0 > 0)) | ((data[:, 3] >= th - margin) & (y1 < h))
+        )
+        data = data[(data[:, 5] != PERSON_CLASS_ID) & ~cut]
+        if len(data) == 0:
+            continue
+        data[:, [0, 2]] += x0
+        data[:, [1, 3]] += y0
+        merged.append(data.to(coarse.device))
+
+    merged = torch.cat(merged, dim=0)
+    keep = batched_nms(merged[:, :4], merged[:, 4], merged[:, 5].long(), tiling["iou"])
+    result.update(boxes=merged[keep])
+    return result
@@ -0,0 +1,226 @@
+import os
+import cv2
+import numpy as np
+
+from .ppe_logic import PPELogic, summary_text
+from .ppe_rules import PERSON
+
+# ---------- Config ----------
+# Stage 1: lightweight person detector (COCO "person" is class 0)
+PERSON_MODEL = os.environ.get("PPE_PERSON_MODEL", "yolov8n.pt")
+PERSON_CLASS_ID = int(os.environ.get("PPE_PERSON_CLASS", 0))
+
+# Stage 2: PPE attribute classifier on person crops. Expected to be a
+# TorchScript module taking (N, 3, H, W) RGB floats in [0, 1] and returning
+# (N, 3) logits in ATTRIBUTES order.
+ATTRIBUTE_MODEL = os.environ.get("PPE_ATTRIBUTE_MODEL", "ppe_attr.pt")
+ATTRIBUTES = ("helmet", "vest", "boots")
+CROP_SIZE = (128, 256)  # (w, h) fed to the classifier
+
+DEFAULT_TWO_STAGE = {
+    "person_conf": 0.4,
+    "recheck_interval": 30,    # frames between checks of a stable compliant track
+    "violation_interval": 5,   # frames between checks of a non-compliant track
+    "uncertain_low": 0.35,     # probabilities inside [low, high] are re-checked every frame
+    "uncertain_high": 0.65,
+    "max_batch": 32,
+    "forget_after": 90,        # frames a lost track keeps its cached status
+}
+
+
+class TwoStageModels:
+    """Person detector + crop attribute classifier loaded together."""
+
+    def __init__(self, detector, classifier, device):
+        self.detector = detector
+        self.classifier = classifier
+        self.device = device
+
+
+def load_two_stage(model_dir, device):
+    import torch
+    from ultralytics import YOLO
+
+    attr_path = ATTRIBUTE_MODEL if os.path.isabs(ATTRIBUTE_MODEL) else os.path.join(model_dir, ATTRIBUTE_MODEL)
+    if not os.path.exists(attr_path):
+        raise FileNotFoundError(f"PPE attribute classifier not found at {attr_path}")
+
+    detector = YOLO(PERSON_MODEL).to(device)
+    detector.eval()
+
+    classifier = torch.jit.load(attr_path, map_location=device)
+    classifier.eval()
+
+    return TwoStageModels(detector, classifier, device)
+
+
+def classify_crops(models, crops):
+    """Run the attribute classifier on a list of BGR crops; returns (N, 3) probabilities."""
+    import torch
+
+    w, h = CROP_SIZE
+    batch = np.empty((len(crops), h, w, 3), dtype=np.uint8)
+    for i, crop in enumerate(crops):
+        cv2.resize(crop, (w, h), dst=batch[i])
+
+    tensor = torch.from_numpy(batch[..., ::-1].copy()).to(models.device)
+    tensor = tensor.permute(0, 3, 1, 2).float().div_(255.0)
+    with torch.inference_mode():
+        logits = models.classifier(tensor)
+    return torch.sigmoid(logits).cpu().numpy()
+
+
+def normalize_two_stage(cfg):
+    opts = dict(DEFAULT_TWO_STAGE)
+    if isinstance(cfg, dict):
+        opts.update({k: v for k, v in cfg.items() if k in DEFAULT_TWO_STAGE})
+    return opts
+
+
+def validate_two_stage(cfg):
+    """Raise ValueError for two-stage options TwoStagePPELogic cannot use; returns them normalized."""
+    if cfg is not None and not isinstance(cfg, dict):
+        raise ValueError("two_stage must be an object")
+    opts = normalize_two_stage(cfg)
+    try:
+        for key in ("recheck_interval", "violation_interval", "max_batch", "forget_after"):
+            opts[key] = int(opts[key])
+        for key in ("person_conf", "uncertain_low", "uncertain_high"):
+            opts[key] = float(opts[key])
+    except (TypeError, ValueError):
+        raise ValueError("two_stage values must be numbers")
+    if min(opts["recheck_interval"], opts["violation_interval"], opts["max_batch"], opts["forget_after"]) < 1:
+        raise ValueError("recheck_interval, violation_interval, max_batch and forget_after must be at least 1")
+    if not 0.0 <= opts["uncertain_low"] <= opts["uncertain_high"] <= 1.0 or not 0.0 <= opts["person_conf"] <= 1.0:
+        raise ValueError("person_conf and uncertain_low <= uncertain_high must be within [0, 1]")
+    return opts
+
+
+# ---------- Per-track PPE logic ----------
+class TwoStagePPELogic(PPELogic):
+    """
+    PPE status straight from person-crop classification, no box association.
+    Crops are classified only for tracks that are new, uncertain or due for
+    a re-check, so stable compliant people cost one check every N frames.
+    """
+
+    def __init__(self, options=None, rules=None):
+        super().__init__(rules=rules)
+        self.options = normalize_two_stage(options)
+        self.track_status = {}   # pid -> {"probs": ndarray(3), "checked": frame_num, "seen": frame_num}
+
+    def reset_tracks(self):
+        super().reset_tracks()
+        self.track_status.clear()
+
+    def _needs_check(self, pid, frame_num):
+        entry = self.track_status.get(pid)
+        if entry is None or pid == -1:
+            return True
+
+        probs = entry["probs"]
+        opts = self.options
+        if ((probs > opts["uncertain_low"]) & (probs < opts["uncertain_high"])).any():
+            return True
+
+        age = frame_num - entry["checked"]
+        if (probs >= 0.5).all():
+            return age >= opts["recheck_interval"]
+        return age >= opts["violation_interval"]
+
+    def process_frame(self, result, frame_num=1, models=None):
+        frame = self._canvas(result.orig_img)
+        detections_json = []
+        alerts = []
+
+        # ------------------------ PERSONS ------------------------
+        persons = []
+        for box in result.boxes:
+            conf = float(box.conf.item())
+            if int(box.cls.item()) != PERSON_CLASS_ID or conf < self.options["person_conf"]:
+                continue
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            pid = int(box.id.item()) if box.id is not None else -1
+            persons.append((pid, conf, (x1, y1, x2, y2)))
+
+        # People outside the camera's rule zones are drawn but never classified
+        h, w = frame.shape[:2]
+        in_zone = self.rules.in_zone([bbox for _, _, bbox in persons], w, h)
+        outside = [p for p, applies in zip(persons, in_zone) if not applies]
+        persons = [p for p, applies in zip(persons, in_zone) if applies]
+
+        # ------------------------ BATCHED CROP CLASSIFICATION ------------------------
+        stale = [
+            (pid, bbox) for pid, _, bbox in persons
+            if self._needs_check(pid, frame_num)
+        ][:self.options["max_batch"]]
+
+        crops, crop_keys = [], []
+        for pid, (x1, y1, x2, y2) in stale:
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(w, x2), min(h, y2)
+            if x2 - x1 < 4 or y2 - y1 < 4:
+                continue
+            crops.append(result.orig_img[y1:y2, x1:x2])
+            crop_keys.append((pid, (x1, y1, x2, y2)))
+
+        # Untracked people (pid -1) are classified but never cached
+        fresh = {}
+        if crops and models is not None:
+            probs = classify_crops(models, crops)
+            for key, p in zip(crop_keys, probs):
+                fresh[key] = p
+                if key[0] != -1:
+                    self.track_status[key[0]] = {"probs": p, "checked": frame_num, "seen": frame_num}
+
+        # ------------------------ STATUS PER PERSON ------------------------
+        color = self.rules.colors[PERSON]
+        for pid, conf, (px1, py1, px2, py2) in outside:
+            detections_json.append({"person_id": pid, "avg_scores": {"person": 1.0}, "ppe_status": {}, "bbox": [px1, py1, px2, py2]})
+            cv2.rectangle(frame, (px1, py1), (px2, py2), color, 2)
+            cv2.putText(frame, f"ID:{pid} person {conf:.2f}", (px1, py1 - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+            self.update_alert(pid, {}, [px1, py1, px2, py2], alerts)
+
+        for pid, conf, (px1, py1, px2, py2) in persons:
+            entry = self.track_status.get(pid)
+            if entry is not None:
+                entry["seen"] = frame_num
+                probs = entry["probs"]
+            else:
+                probs = fresh.get((pid, (max(0, px1), max(0, py1), min(w, px2), min(h, py2))))
+            known = probs is not None
+
+            # Not classified yet (tiny crop, over max_batch, no classifier): status unknown,
+            # so the alert tracker and rollups skip the person rather than count "no"
+            avg_scores = {"person": 1.0}
+            comparisons = {}
+            for name, p in zip(ATTRIBUTES, probs if known else ()):
+                avg_scores[name] = float(p)
+                avg_scores[f"no {name}"] = float(1.0 - p)
+                if name in self.rules.items:
+                    comparisons[name] = "yes" if p >= 0.5 else "no"
+
+            detections_json.append({
+                "person_id": pid,
+                "avg_scores": avg_scores,
+                "ppe_status": comparisons,
+                "bbox": [px1, py1, px2, py2]
+            })
+
+            cv2.rectangle(frame, (px1, py1), (px2, py2), color, 2)
+            cv2.putText(frame, f"ID:{pid} person {conf:.2f}", (px1, py1 - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+            summary = summary_text(comparisons)
+            cv2.putText(frame, summary, (px1, py2 + 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+            if known:
+                self.update_alert(pid, comparisons, [px1, py1, px2, py2], alerts)
+
+        # Forget tracks that left the scene
+        forget_after = self.options["forget_after"]
+        for pid in [p for p, e in self.track_status.items() if frame_num - e["seen"] > forget_after]:
+            del self.track_status[pid]
+
+        return frame, detections_json, alerts if alerts else None
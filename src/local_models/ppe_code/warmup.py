@@ -0,0 +1,119 @@
+import os
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("inference")
+logger.setLevel(logging.INFO)
+
+
+def _int_list(value):
+    return [int(v) for v in str(value).split(",") if v.strip()]
+
+
+def _frame_shape(value):
+    w, h = (int(v) for v in str(value).lower().split("x"))
+    return h, w
+
+
+# ---------- Defaults ----------
+DEFAULT_WARMUP = {
+    # every imgsz the streams use; the first is the full-frame size and is warmed last,
+    # since ultralytics keeps the last imgsz for calls that do not pass one
+    "imgsz": _int_list(os.getenv("PPE_WARMUP_IMGSZ", "640")),
+    "batch": _int_list(os.getenv("PPE_WARMUP_BATCH", "1")),       # e.g. "1,16" when tiling batches tiles
+    "frame": _frame_shape(os.getenv("PPE_WARMUP_FRAME", "720x405")),   # decoded frame size fed to predict
+    "runs": int(os.getenv("PPE_WARMUP_RUNS", 3)),                 # passes per shape
+    "compile": os.getenv("PPE_COMPILE", "none"),                  # none | torch_compile | torchscript | onnx
+}
+
+COMPILE_MODES = ("none", "torch_compile", "torchscript", "onnx")
+
+
+# -------------------------------------------------------------------------------
+# Graph compilation
+# -------------------------------------------------------------------------------
+
+def _exported(model, fmt, suffix, **kwargs):
+    """Export next to the weights once; reuse the file while it is newer than the .pt."""
+    weights = getattr(model, "ckpt_path", None)
+    if weights:
+        target = os.path.splitext(weights)[0] + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(weights):
+            logger.info(f"Reusing exported model {target}")
+            return target
+    return model.export(format=fmt, **kwargs)
+
+
+def compile_model(model, mode, cfg, device=None):
+    """
+    Return a model for `mode`, or the original model if the backend cannot do it.
+
+    onnx        -> ONNX export with dynamic axes, run by onnxruntime with full
+                   graph optimizations (handles every imgsz / batch size)
+    torchscript -> traced at the first imgsz; inputs are letterboxed to that square
+    torch_compile -> torch.compile on the underlying nn.Module (eager fallback)
+
+    Every backend must get one frame through predict before it is returned.
+    torch.compile only compiles on that first call, and it swaps the module
+    on `model` in place, so a failure there restores the original module.
+    """
+    if mode in (None, "none"):
+        return model
+    if mode not in COMPILE_MODES:
+        logger.warning(f"Unknown compile mode {mode!r}; running eager")
+        return model
+
+    from ultralytics import YOLO
+
+    t0 = time.perf_counter()
+    original = model.model
+    frame = np.zeros(cfg["frame"] + (3,), dtype=np.uint8)
+    try:
+        if mode == "onnx":
+            path = _exported(model, "onnx", ".onnx", imgsz=max(cfg["imgsz"]), dynamic=True, simplify=True)
+            compiled = YOLO(path, task="detect")
+        elif mode == "torchscript":
+            path = _exported(model, "torchscript", ".torchscript", imgsz=cfg["imgsz"][0])
+            compiled = YOLO(path, task="detect")
+        else:
+            import torch
+            model.model = torch.compile(original, dynamic=True)
+            model.predictor = None      # rebuilt around the compiled module on the next predict
+            compiled = model
+        # Trial pass: surfaces lazy compilation and runtime errors here, not on the first live frame
+        compiled.predict(source=frame, imgsz=cfg["imgsz"][0], conf=0.1, verbose=False, device=device)
+    except Exception as e:
+        # The predictor built during the trial pass wraps the failed module too
+        model.model, model.predictor = original, None
+        logger.warning(f"{mode} compilation failed ({e}); running eager")
+        return model
+
+    logger.info(f"Model prepared with {mode} in {time.perf_counter() - t0:.2f}s")
+    return compiled
+
+
+# -------------------------------------------------------------------------------
+# Shape warm-up
+# -------------------------------------------------------------------------------
+
+def warmup_shapes(model, device, cfg):
+    """
+    Run predict over every configured (imgsz, batch) so lazy init, kernel
+    selection / graph compilation and allocator growth happen before the
+    first real frame. Returns {"<imgsz>x<batch>": [first_ms, last_ms]}.
+    """
+    frame = np.zeros(cfg["frame"] + (3,), dtype=np.uint8)
+    report = {}
+    for imgsz in reversed(cfg["imgsz"]):
+        for batch in cfg["batch"]:
+            source = frame if batch == 1 else [frame] * batch
+            times = []
+            for _ in range(max(1, cfg["runs"])):
+                t0 = time.perf_counter()
+                model.predict(source=source, imgsz=imgsz, conf=0.1, verbose=False, device=device)
+                times.append(round((time.perf_counter() - t0) * 1000, 1))
+            report[f"{imgsz}x{batch}"] = [times[0], times[-1]]
+            logger.info(f"Warm-up imgsz={imgsz} batch={batch}: first {times[0]} ms, last {times[-1]} ms")
+    return report
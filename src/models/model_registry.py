@@ -0,0 +1,171 @@
+import gc
+import time
+import logging
+import threading
+
+logger = logging.getLogger("model_registry")
+logger.setLevel(logging.INFO)
+
+
+# -------------------------------------------------------------------------------
+# Model Registry
+# -------------------------------------------------------------------------------
+
+class ModelRegistry:
+    """
+    Holds a single lazily-loaded model per process.
+
+    The model is loaded on the first call to get() (or explicitly from the
+    FastAPI lifespan / gunicorn master via load()), never at import time.
+    reload() builds a replacement next to the live model and swaps the
+    reference in one assignment: frames already inside predict keep the
+    model object they fetched, the next get() returns the new one.
+    """
+
+    def __init__(self, name, loader, warmup=None):
+        self.name = name
+        self._loader = loader
+        self._warmup = warmup           # model -> model to serve (compile + warm-up passes)
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._model = None
+        self.version = 0
+
+        self.state = "idle"            # idle -> loading -> [loaded ->] warming -> ready | failed
+        self.error = None
+        self.warmed = False
+        self.cold_start_seconds = None
+        self.warmup_seconds = None
+        self.loaded_at = None
+        self.reload_state = "idle"     # idle -> reloading -> idle | failed
+        self.reload_error = None
+
+    def get(self):
+        """Return the loaded model, loading it on first use."""
+        model = self._model
+        if model is not None:
+            return model
+
+        with self._lock:
+            if self._model is None:
+                self._load_locked()
+            return self._model
+
+    def load(self, freeze=False, warmup=True):
+        """
+        Load the model now (idempotent); warm it up unless warmup=False.
+
+        freeze=True moves everything allocated so far into the permanent GC
+        generation, so forked workers do not dirty the shared weight pages
+        when the collector walks them (fork-after-load sharing). A master
+        process loads with warmup=False and each worker warms after fork.
+        """
+        with self._lock:
+            if self._model is None:
+                self._load_locked(warmup)
+            elif warmup and not self.warmed:
+                self._warm_locked()
+            model = self._model
+        if freeze:
+            gc.freeze()
+        return model
+
+    def is_ready(self):
+        """Ready only once loaded and warmed: the first frame should cost what the rest do."""
+        return self._model is not None and self.warmed
+
+    def status(self):
+        return {
+            "model": self.name,
+            "state": self.state,
+            "cold_start_seconds": self.cold_start_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "loaded_at": self.loaded_at,
+            "error": self.error,
+            "version": self.version,
+            "reload_state": self.reload_state,
+            "reload_error": self.reload_error,
+        }
+
+    def reload(self, loader=None):
+        """
+        Load (and warm up) a new model in the calling thread, then swap it in.
+
+        loader replaces the registry's loader for this and later loads, so a
+        reload pointing at new weights also survives a later cold load. The
+        live model keeps serving throughout; if loading fails it stays in place.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            raise RuntimeError(f"[{self.name}] A reload is already in progress")
+        try:
+            self.reload_state = "reloading"
+            self.reload_error = None
+            start = time.perf_counter()
+            try:
+                model = (loader or self._loader)()
+                if self._warmup is not None:
+                    model = self._warmup(model)
+            except Exception as e:
+                self.reload_state = "failed"
+                self.reload_error = str(e)
+                logger.exception(f"[{self.name}] Model reload failed; keeping the current model")
+                raise
+
+            with self._lock:
+                old = self._model
+                self._model = model
+                if loader is not None:
+                    self._loader = loader
+                self.version += 1
+                self.state = "ready"
+                self.warmed = True
+                self.error = None
+                self.cold_start_seconds = round(time.perf_counter() - start, 3)
+                self.loaded_at = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
+            self.reload_state = "idle"
+            logger.info(f"[{self.name}] Reloaded in {self.cold_start_seconds}s (version {self.version})")
+
+            # Drop our reference; in-flight frames release theirs when they finish
+            del old
+            return model
+        finally:
+            self._reload_lock.release()
+
+    def _load_locked(self, warmup=True):
+        self.state = "loading"
+        self.error = None
+        start = time.perf_counter()
+        try:
+            self._model = self._loader()
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.exception(f"[{self.name}] Model load failed")
+            raise
+
+        self.cold_start_seconds = round(time.perf_counter() - start, 3)
+        self.loaded_at = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
+        self.version += 1
+        self.warmed = False
+        self.state = "loaded"
+        logger.info(f"[{self.name}] Model loaded in {self.cold_start_seconds}s")
+        if warmup:
+            self._warm_locked()
+
+    def _warm_locked(self):
+        if self._warmup is None:
+            self.warmed = True
+            self.state = "ready"
+            return
+        self.state = "warming"
+        start = time.perf_counter()
+        try:
+            self._model = self._warmup(self._model)
+        except Exception as e:
+            # The model still works, just cold; serve it rather than failing the worker
+            self.error = f"warm-up failed: {e}"
+            logger.exception(f"[{self.name}] Warm-up failed")
+        self.warmup_seconds = round(time.perf_counter() - start, 3)
+        self.warmed = True
+        self.state = "ready"
+        logger.info(f"[{self.name}] Warm-up finished in {self.warmup_seconds}s")
@@ -1,85 +1,104 @@
-import cv2
-import json
-import base64
-import boto3
-import numpy as np
-import logging
-from botocore.exceptions import BotoCoreError, ClientError
 import os
-from dotenv import load_dotenv
-
-import sys, os
+import sys
+import logging
 
 # Add <project_root>/src to Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
-from src.local_models.ppe_code.inference import model_fn, predict_fn
+from src.models.model_registry import ModelRegistry
 
-import os
+logger = logging.getLogger("detection")
+logger.setLevel(logging.INFO)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 model_dir = os.path.join(BASE_DIR, "..", "local_models", "ppe_code")
 model_dir = os.path.abspath(model_dir)
 
-model = model_fn(model_dir)
-#------------------------------------------------------------------------------- PPE Detection ------------------------------------------------------------------------------
 
-# Load environment variables from .env
-load_dotenv()
+# inference (cv2, numpy, the PPE logic) is imported by whichever thread first
+# loads a model, so importing this module is cheap and the web process can bind
+# its port before any of it is needed.
+def _load_ppe(weights=None):
+    from src.local_models.ppe_code.inference import model_fn
+    return model_fn(model_dir, weights)
 
-logger = logging.getLogger("detection")
-logger.setLevel(logging.INFO)
 
+def _warmup_ppe(model):
+    from src.local_models.ppe_code.inference import warmup_fn
+    return warmup_fn(model)
 
 
+def _load_two_stage():
+    from src.local_models.ppe_code.inference import two_stage_model_fn
+    return two_stage_model_fn(model_dir)
 
-# -------------------------------------------------------------------------------
-# PPE Detection
-# -------------------------------------------------------------------------------
 
-# Load environment variables
-load_dotenv()
+# Loaded once per process by the FastAPI lifespan (or on first use), never at import
+# Readiness flips only after warm-up (and PPE_COMPILE graph compilation) has run
+ppe_registry = ModelRegistry("ppe", _load_ppe, warmup=_warmup_ppe)
+# Only loaded when a camera asks for pipeline="two_stage"
+two_stage_registry = ModelRegistry("ppe_two_stage", _load_two_stage)
 
 
+def resolve_weights(weights):
+    """
+    Absolute path of a weights file inside model_dir (names are relative to it).
+    Anything outside is rejected: YOLO unpickles .pt files, so loading an
+    arbitrary path would run arbitrary code.
+    """
+    path = os.path.realpath(os.path.join(model_dir, weights))
+    if os.path.commonpath([path, os.path.realpath(model_dir)]) != os.path.realpath(model_dir):
+        raise ValueError(f"Weights must be a file under {model_dir}")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Model weights not found at {path}")
+    return path
 
-logger = logging.getLogger("detection")
-logger.setLevel(logging.INFO)
 
+def reload_ppe_model(weights=None):
+    """
+    Hot-swap the detector, optionally from a new weights file under model_dir;
+    blocks until swapped. Only this process's registry is swapped: behind
+    gunicorn each worker holds its own model, so a reload reaches just the
+    worker that handled the request.
+    """
+    if weights:
+        weights = resolve_weights(weights)
+    loader = (lambda: _load_ppe(weights)) if weights else None
+    return ppe_registry.reload(loader)
+
+
+# -------------------------------------------------------------------------------
+# PPE Detection
+# -------------------------------------------------------------------------------
+
+def ppe_detection(frame, state=None):
+    """
+    Run inference on a frame and return (result, error_message, annotated_frame, alerts) safely.
+
+    frame: BGR ndarray straight from the decoder (PIL images still work).
+    annotated_frame is the stream's pooled canvas, valid until its next frame.
+    """
+    from src.local_models.ppe_code.inference import predict_fn
 
-def ppe_detection(frame):
-    """Send a frame to SageMaker endpoint and return (result, error_message, annotated_frame) safely."""
     try:
 
-        result=predict_fn(frame,model)
+        registry = two_stage_registry if state is not None and state.pipeline == "two_stage" else ppe_registry
+        # No JPEG/base64 round trip: the caller encodes once for the client
+        result = predict_fn(frame, registry.get(), state, encode=False)
 
         # Extract fields
         frame_id = result.get("frame", -1)
         detections = result.get("detections", [])
-        annotated_b64 = result.get("annotated_frame", "")
-        alert=result.get("alerts","")
-
-        # Decode annotated frame
-        annotated_frame = None
-        if annotated_b64:
-            try:
-                annotated_bytes = base64.b64decode(annotated_b64)
-                annotated_array = np.frombuffer(annotated_bytes, np.uint8)
-                annotated_frame = cv2.imdecode(annotated_array, cv2.IMREAD_COLOR)
-                if annotated_frame is None:
-                    logger.warning("Failed to decode annotated frame from response")
-            except Exception as e:
-                msg = f"Error decoding annotated frame: {str(e)}"
-                logger.exception(msg)
-                # Still return result JSON even if image fails
-                return {"frame_id": frame_id, "detections": detections}, msg, None
+        annotated_frame = result.get("annotated_frame")
+        alert = result.get("alerts", "")
 
         # Success
-        return {"frame_id": frame_id, "detections": detections}, None, annotated_frame,alert
+        return {"frame_id": frame_id, "detections": detections}, None, annotated_frame, alert
 
     except Exception as e:
         msg = f"Unexpected error in ppe_detection: {str(e)}"
         logger.exception(msg)
-        return None, msg, None
+        return None, msg, None, None
 
 
 
@@ -0,0 +1,175 @@
+import os
+import time
+import queue
+import logging
+import tempfile
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("clip_recorder")
+logger.setLevel(logging.INFO)
+
+DEFAULT_CLIPS = {
+    "enabled": os.getenv("PPE_CLIPS", "1") == "1",
+    "pre_roll": 10.0,       # seconds kept in memory before an alert
+    "post_roll": 5.0,       # seconds recorded after the alert
+    "max_length": 60.0,     # cap when overlapping alerts keep extending a clip
+}
+
+
+def normalize_clips(cfg):
+    clips = dict(DEFAULT_CLIPS)
+    if isinstance(cfg, dict):
+        clips.update({k: v for k, v in cfg.items() if k in DEFAULT_CLIPS})
+        clips["enabled"] = bool(cfg.get("enabled", True))
+    elif cfg is False:
+        clips["enabled"] = False
+    return clips
+
+
+# -------------------------------------------------------------------------------
+# Per-stream pre-roll buffer
+# -------------------------------------------------------------------------------
+
+class ClipRecorder:
+    """
+    Keeps the last pre_roll seconds of already-encoded JPEG frames. When an
+    alert fires, the pre-roll plus post_roll seconds of following frames are
+    handed to the background clip writer, which encodes an MP4, uploads it
+    and links it to the alert row(s).
+    """
+
+    def __init__(self, camera_id, config=None):
+        self.camera_id = camera_id
+        self.config = normalize_clips(config)
+        self.ring = deque()      # (ts, jpeg ndarray)
+        self.pending = None      # clip currently collecting post-roll
+
+    @property
+    def enabled(self):
+        return self.config["enabled"]
+
+    def add_frame(self, jpeg, ts):
+        """jpeg is the cv2.imencode buffer the pipeline already produced (no copy)."""
+        if not self.enabled:
+            return
+
+        ring = self.ring
+        ring.append((ts, jpeg))
+        horizon = ts - self.config["pre_roll"]
+        while ring and ring[0][0] < horizon:
+            ring.popleft()
+
+        clip = self.pending
+        if clip is not None:
+            clip["frames"].append((ts, jpeg))
+            if ts >= clip["end_ts"]:
+                self.pending = None
+                clip_writer().submit(clip)
+
+    def trigger(self, alert_id, ts):
+        """Start (or extend) a clip for a fired alert."""
+        if not self.enabled:
+            return
+
+        clip = self.pending
+        if clip is not None:
+            clip["alert_ids"].append(alert_id)
+            clip["end_ts"] = min(ts + self.config["post_roll"], clip["start_ts"] + self.config["max_length"])
+            return
+
+        frames = list(self.ring)
+        self.pending = {
+            "camera_id": self.camera_id,
+            "alert_ids": [alert_id],
+            "start_ts": frames[0][0] if frames else ts,
+            "end_ts": ts + self.config["post_roll"],
+            "frames": frames,
+        }
+
+    def flush(self):
+        """Stream stopping: write whatever post-roll was collected."""
+        if self.pending is not None:
+            clip_writer().submit(self.pending)
+            self.pending = None
+        self.ring.clear()
+
+
+# -------------------------------------------------------------------------------
+# Background clip writer (one per process)
+# -------------------------------------------------------------------------------
+
+class ClipWriter:
+    """Encodes, uploads and links clips on its own thread with a bounded queue."""
+
+    def __init__(self, maxsize=16):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, name="clip-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, clip):
+        try:
+            self.queue.put_nowait(clip)
+        except queue.Full:
+            logger.warning(f"[{clip['camera_id']}] Clip queue full; clip for {clip['alert_ids']} dropped")
+
+    def _run(self):
+        while True:
+            clip = self.queue.get()
+            try:
+                self._write(clip)
+            except Exception as e:
+                logger.error(f"[{clip['camera_id']}] Failed to write clip for {clip['alert_ids']}: {e}")
+
+    def _write(self, clip):
+        from src.store_s3.ppe_store import upload_clip_to_s3
+        from src.database.ppe_query import attach_alert_clip
+
+        frames = clip["frames"]
+        if not frames:
+            return
+
+        first = cv2.imdecode(np.asarray(frames[0][1], dtype=np.uint8), cv2.IMREAD_COLOR)
+        h, w = first.shape[:2]
+        duration = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duration if duration > 0 else 10.0
+
+        fd, path = tempfile.mkstemp(suffix=".mp4", prefix="ppe_clip_")
+        os.close(fd)
+        try:
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+            for _, jpeg in frames:
+                img = cv2.imdecode(np.asarray(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if img is None:
+                    continue
+                if img.shape[:2] != (h, w):
+                    img = cv2.resize(img, (w, h))
+                writer.write(img)
+            writer.release()
+
+            url = upload_clip_to_s3(path, clip["camera_id"], clip["alert_ids"][0])
+        finally:
+            os.remove(path)
+
+        # The alert row is written by the DB alert sink; give it a moment if we raced it
+        for attempt in range(3):
+            if attach_alert_clip(clip["alert_ids"], url) >= len(clip["alert_ids"]):
+                break
+            time.sleep(2)
+
+        logger.info(f"[{clip['camera_id']}] Clip for {clip['alert_ids']} ({len(frames)} frames) -> {url}")
+
+
+_clip_writer = None
+_clip_writer_lock = threading.Lock()
+
+
+def clip_writer():
+    global _clip_writer
+    with _clip_writer_lock:
+        if _clip_writer is None:
+            _clip_writer = ClipWriter()
+        return _clip_writer
@@ -1,19 +1,28 @@
-import cv2
-import numpy as np
-import base64
 import time
-import boto3
 import logging
-from PIL import Image
+import threading
 
 S3_BUCKET = "ppe-detections"
-s3 = boto3.client("s3")
 
 logger = logging.getLogger("s3_utils_ppe")
 
+_s3 = None
+_s3_lock = threading.Lock()
+
+
+def get_s3():
+    """Shared S3 client, created on first upload (boto3 is slow to import and resolve credentials)."""
+    global _s3
+    if _s3 is None:
+        with _s3_lock:
+            if _s3 is None:
+                import boto3
+                _s3 = boto3.client("s3")
+    return _s3
+
 
 def upload_to_s3(frame, frame_num):
-    """Upload annotated frame to S3 and return its URL."""
+    """Upload an annotated frame (JPEG buffer or bytes) to S3 and return its URL."""
 
     # ---------------- Convert to NumPy array if needed ----------------
     if frame is None:
@@ -40,10 +49,10 @@ def upload_to_s3(frame, frame_num):
     try:
 
         key = f"ppe-results/frame_{frame_num}_{int(time.time())}.jpg"
-        s3.put_object(
+        get_s3().put_object(
             Bucket=S3_BUCKET,
             Key=key,
-            Body=frame.tobytes(),
+            Body=frame if isinstance(frame, bytes) else frame.tobytes(),
             ContentType="image/jpeg"
         )
 
@@ -54,3 +63,23 @@ def upload_to_s3(frame, frame_num):
     except Exception as e:
         logger.error(f"Frame {frame_num}: failed to upload to S3 -> {e}")
         raise
+
+
+def upload_clip_to_s3(path, camera_id, alert_id):
+    """Upload an alert clip (local MP4 file) to S3 and return its URL."""
+    try:
+        key = f"ppe-clips/{camera_id}/{alert_id}_{int(time.time())}.mp4"
+        get_s3().upload_file(
+            Filename=path,
+            Bucket=S3_BUCKET,
+            Key=key,
+            ExtraArgs={"ContentType": "video/mp4"}
+        )
+
+        url = f"https://{S3_BUCKET}.s3.amazonaws.com/{key}"
+        logger.info(f"Alert {alert_id}: clip uploaded to S3 at {url}")
+        return url
+
+    except Exception as e:
+        logger.error(f"Alert {alert_id}: failed to upload clip to S3 -> {e}")
+        raise
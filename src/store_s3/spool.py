@@ -0,0 +1,324 @@
+import os
+import json
+import mmap
+import time
+import uuid
+import zlib
+import fcntl
+import shutil
+import struct
+import logging
+
+logger = logging.getLogger("spool")
+logger.setLevel(logging.INFO)
+
+# ---------- Defaults ----------
+DEFAULT_SPOOL = {
+    "dir": os.getenv("PPE_SPOOL_DIR", "/tmp/ppe_spool"),
+    "segment_bytes": int(os.getenv("PPE_SPOOL_SEGMENT_MB", 64)) * 1024 * 1024,
+    "max_bytes": int(os.getenv("PPE_SPOOL_MAX_MB", 2048)) * 1024 * 1024,   # per stream
+    "batch": int(os.getenv("PPE_SPOOL_BATCH", 100)),        # records per bulk flush
+    "poll": float(os.getenv("PPE_SPOOL_POLL", 0.5)),        # seconds between empty reads
+    "max_backoff": float(os.getenv("PPE_SPOOL_MAX_BACKOFF", 30)),
+}
+
+# -------------------------------------------------------------------------------
+# On-disk format
+#
+# A spool is a directory of append-only segment files 000000000000.seg, ...
+# Each record is a fixed header, UTF-8 JSON metadata, then an opaque blob
+# (the JPEG). crc32 covers metadata + blob, so a record torn by a crash fails
+# the check and the reader treats it as the end of that segment.
+#
+# The writer never reopens an existing segment: after a restart it starts the
+# next number, so a torn tail is always in a sealed segment and gets skipped.
+# checkpoint.json holds the reader's (segment, offset); segments before it are
+# deleted. Delivery is at-least-once: a crash between a flush and its
+# checkpoint replays that batch.
+# -------------------------------------------------------------------------------
+
+HEADER = struct.Struct("<4sIII")        # magic, metadata length, blob length, crc32
+MAGIC = b"PPE1"
+SEGMENT_SUFFIX = ".seg"
+CHECKPOINT = "checkpoint.json"
+WRITER_LOCK = "writer.lock"
+READER_LOCK = "reader.lock"
+
+
+def new_spool_path(name, root=None):
+    """A fresh spool directory for one pipeline run, e.g. <root>/camera-12-1a2b3c4d."""
+    return os.path.join(root or DEFAULT_SPOOL["dir"], f"{name}-{uuid.uuid4().hex[:8]}")
+
+
+def _segment_path(path, seq):
+    return os.path.join(path, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+
+def _segments(path):
+    try:
+        names = os.listdir(path)
+    except FileNotFoundError:
+        return []
+    return sorted(int(n[:-len(SEGMENT_SUFFIX)]) for n in names if n.endswith(SEGMENT_SUFFIX))
+
+
+def spool_bytes(path):
+    total = 0
+    for seq in _segments(path):
+        try:
+            total += os.path.getsize(_segment_path(path, seq))
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def _try_lock(path):
+    """Exclusive advisory lock held for the life of the fd; None if someone else has it."""
+    fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _parse(data, offset):
+    """(meta, blob, end) for the record at offset, or None if it is missing or torn."""
+    if offset + HEADER.size > len(data):
+        return None
+    magic, meta_len, blob_len, crc = HEADER.unpack_from(data, offset)
+    start = offset + HEADER.size
+    end = start + meta_len + blob_len
+    if magic != MAGIC or end > len(data):
+        return None
+    body = data[start:end]
+    if zlib.crc32(body) != crc:
+        return None
+    return json.loads(bytes(body[:meta_len])), bytes(body[meta_len:]), end
+
+
+# -------------------------------------------------------------------------------
+# Writer (the detection thread)
+# -------------------------------------------------------------------------------
+
+class SpoolWriter:
+    """
+    Sequential appends into rolling segments. Memory use is one header per
+    record; disk use is capped at max_bytes, beyond which append() refuses
+    new records instead of blocking the frame loop.
+    """
+
+    def __init__(self, path, segment_bytes=None, max_bytes=None):
+        self.path = path
+        self.segment_bytes = segment_bytes or DEFAULT_SPOOL["segment_bytes"]
+        self.max_bytes = max_bytes or DEFAULT_SPOOL["max_bytes"]
+        os.makedirs(path, exist_ok=True)
+        self._lock_fd = _try_lock(os.path.join(path, WRITER_LOCK))
+        if self._lock_fd is None:
+            raise RuntimeError(f"Spool {path} already has a writer")
+
+        segments = _segments(path)
+        self.seq = segments[-1] + 1 if segments else 0
+        self.disk_bytes = spool_bytes(path)
+        self._fd = None
+        self._written = 0
+        self.appended = 0
+        self.dropped = 0
+
+    def _roll(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self.seq += 1
+        self._fd = os.open(_segment_path(self.path, self.seq), os.O_CREAT | os.O_WRONLY | os.O_APPEND, 0o644)
+        self._written = 0
+
+    def append(self, meta, blob=b""):
+        """Append one record; False if the spool is full."""
+        meta = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        blob = memoryview(blob).cast("B")
+        crc = zlib.crc32(blob, zlib.crc32(meta))
+        size = HEADER.size + len(meta) + len(blob)
+
+        if self.disk_bytes + size > self.max_bytes:
+            # The reader deletes drained segments; re-measure before refusing
+            self.disk_bytes = spool_bytes(self.path)
+            if self.disk_bytes + size > self.max_bytes:
+                self.dropped += 1
+                return False
+
+        if self._fd is None or (self._written and self._written + size > self.segment_bytes):
+            self._roll()
+        # One writev per record: no user-space copy of the blob
+        os.writev(self._fd, [HEADER.pack(MAGIC, len(meta), len(blob), crc), meta, blob])
+        self._written += size
+        self.disk_bytes += size
+        self.appended += 1
+        return True
+
+    def close(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+# -------------------------------------------------------------------------------
+# Reader (the storage worker process)
+# -------------------------------------------------------------------------------
+
+class SpoolReader:
+    """
+    Reads records in order from the checkpoint. read_batch() returns up to
+    `limit` records; commit() makes that batch permanent and deletes the
+    segments it finished. Calling read_batch() again without commit()
+    re-reads the same records (the retry path).
+    """
+
+    def __init__(self, path, lock_fd=None):
+        self.path = path
+        self._lock_fd = lock_fd if lock_fd is not None else _try_lock(os.path.join(path, READER_LOCK))
+        if self._lock_fd is None:
+            raise RuntimeError(f"Spool {path} already has a reader")
+        self.writer_lock_fd = None      # set when adopting an orphaned spool
+        self.position = self._load_checkpoint()
+        self._pending = self.position
+        self._map = None
+        self._map_seq = None
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.path, CHECKPOINT)) as f:
+                cp = json.load(f)
+            return cp["segment"], cp["offset"]
+        except (FileNotFoundError, ValueError, KeyError):
+            segments = _segments(self.path)
+            return (segments[0] if segments else 0), 0
+
+    def _mapped(self, seq):
+        """mmap of the segment's current contents (remapped when it has grown)."""
+        path = _segment_path(self.path, seq)
+        size = os.path.getsize(path)
+        if self._map is not None and self._map_seq == seq and len(self._map) == size:
+            return self._map
+        self._unmap()
+        if size == 0:
+            return b""
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        self._map_seq = seq
+        return self._map
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._map_seq = None
+
+    def read_batch(self, limit=None):
+        """[((segment, end_offset), meta, blob), ...] starting at the checkpoint."""
+        limit = limit or DEFAULT_SPOOL["batch"]
+        records = []
+        seq, offset = self.position
+        while len(records) < limit:
+            segments = _segments(self.path)
+            later = [s for s in segments if s > seq]
+            if seq not in segments:
+                if not later:
+                    break
+                seq, offset = later[0], 0
+                continue
+            try:
+                data = self._mapped(seq)
+            except FileNotFoundError:
+                continue
+            record = _parse(data, offset)
+            if record is None:
+                if not later:
+                    break       # caught up with the writer
+                # The writer has moved on, so this segment is sealed
+                if offset < len(data):
+                    logger.warning(f"[{self.path}] Skipping {len(data) - offset} torn bytes in segment {seq}")
+                seq, offset = later[0], 0
+                continue
+            meta, blob, offset = record
+            records.append(((seq, offset), meta, blob))
+        self._pending = (seq, offset)
+        return records
+
+    def commit(self):
+        """Checkpoint everything returned by the last read_batch()."""
+        seq, offset = self._pending
+        tmp = os.path.join(self.path, CHECKPOINT + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"segment": seq, "offset": offset, "time": time.time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, CHECKPOINT))
+        self.position = (seq, offset)
+
+        for old in _segments(self.path):
+            if old >= seq:
+                break
+            if self._map_seq == old:
+                self._unmap()
+            try:
+                os.remove(_segment_path(self.path, old))
+            except FileNotFoundError:
+                pass
+
+    def backlog_bytes(self):
+        seq, offset = self.position
+        total = 0
+        for s in _segments(self.path):
+            if s >= seq:
+                try:
+                    total += os.path.getsize(_segment_path(self.path, s))
+                except FileNotFoundError:
+                    pass
+        return max(0, total - offset)
+
+    def close(self):
+        self._unmap()
+        for fd in (self._lock_fd, self.writer_lock_fd):
+            if fd is not None:
+                os.close(fd)
+        self._lock_fd = self.writer_lock_fd = None
+
+
+def claim_orphans(root=None, exclude=()):
+    """
+    Readers for spools left behind by dead pipelines (no writer and no reader
+    holding their locks), e.g. after a crash or restart with a backlog.
+    """
+    root = root or DEFAULT_SPOOL["dir"]
+    try:
+        names = sorted(os.listdir(root))
+    except FileNotFoundError:
+        return []
+
+    excluded = {os.path.abspath(p) for p in exclude}
+    readers = []
+    for name in names:
+        path = os.path.join(root, name)
+        if not os.path.isdir(path) or os.path.abspath(path) in excluded:
+            continue
+        writer_fd = _try_lock(os.path.join(path, WRITER_LOCK))
+        if writer_fd is None:
+            continue
+        reader_fd = _try_lock(os.path.join(path, READER_LOCK))
+        if reader_fd is None:
+            os.close(writer_fd)
+            continue
+        reader = SpoolReader(path, lock_fd=reader_fd)
+        reader.writer_lock_fd = writer_fd       # keeps new writers out until removed
+        readers.append(reader)
+    return readers
+
+
+def remove_spool(path):
+    shutil.rmtree(path, ignore_errors=True)
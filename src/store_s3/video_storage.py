@@ -1,14 +1,35 @@
-import boto3
+import asyncio
 import logging
 from fastapi import UploadFile, HTTPException
-from boto3.s3.transfer import TransferConfig
+
+from src.store_s3.ppe_store import get_s3
 
 S3_BUCKET = "ai-search-video"
-s3 = boto3.client("s3")
 
 logger = logging.getLogger("s3_utils_ai_search")
 
 
+def _upload_fileobj(fileobj, key):
+    # boto3 import and client creation happen here too, on the worker thread
+    from boto3.s3.transfer import TransferConfig
+
+    # ✅ Enable multipart upload (5 MB threshold, 5 MB chunks)
+    config = TransferConfig(
+        multipart_threshold=5 * 1024 * 1024,
+        multipart_chunksize=5 * 1024 * 1024,
+        max_concurrency=10,
+        use_threads=True
+    )
+    # ✅ Use upload_fileobj (supports Config and parallel upload)
+    get_s3().upload_fileobj(
+        Fileobj=fileobj,
+        Bucket=S3_BUCKET,
+        Key=key,
+        ExtraArgs={"ContentType": "video/mp4"},
+        Config=config
+    )
+
+
 async def upload_video_to_s3(video_file: UploadFile):
     """
     Uploads a FastAPI UploadFile object to S3 under 'ai_search_videos/' folder
@@ -19,22 +40,9 @@ async def upload_video_to_s3(video_file: UploadFile):
         file_name = video_file.filename
         key = f"{folder_name}{file_name}"
 
-        # ✅ Enable multipart upload (5 MB threshold, 5 MB chunks)
-        config = TransferConfig(
-            multipart_threshold=5 * 1024 * 1024,
-            multipart_chunksize=5 * 1024 * 1024,
-            max_concurrency=10,
-            use_threads=True
-        )
-
-        # ✅ Use upload_fileobj (supports Config and parallel upload)
-        s3.upload_fileobj(
-            Fileobj=video_file.file,
-            Bucket=S3_BUCKET,
-            Key=key,
-            ExtraArgs={"ContentType": "video/mp4"},
-            Config=config
-        )
+        # Blocking multipart upload: run it on a worker thread, not the event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _upload_fileobj, video_file.file, key)
 
         url = f"https://{S3_BUCKET}.s3.amazonaws.com/{key}"
         logger.info(f"✅ Uploaded video to S3 at: {url}")
@@ -47,7 +55,6 @@ async def upload_video_to_s3(video_file: UploadFile):
 
 # For local test
 if __name__ == "__main__":
-    import asyncio
     from types import SimpleNamespace
 
     class DummyUploadFile:
@@ -0,0 +1,206 @@
+import json
+import logging
+
+try:
+    import msgpack
+except ImportError:         # binary output falls back to compact JSON
+    msgpack = None
+
+logger = logging.getLogger("detection_codec")
+logger.setLevel(logging.INFO)
+
+# -------------------------------------------------------------------------------
+# Compact detection encoding
+#
+# One message per frame, short keys:
+#   v    format version
+#   f    frame_num
+#   ts   time_stamp
+#   k    1 on keyframes
+#   cls  class table, code -> name (keyframes only)
+#   id   [user_id, camera_id, org_id] (keyframes only)
+#   tr   tracks: [person_id, flags, x1, y1, x2, y2, (code, score%, ...)?]
+#   a    alert, unchanged (only when set)
+#   img  annotated JPEG: raw bytes (msgpack) or base64 (json)
+#
+# flags: bits 0-2 are the PPE status (bit set = "yes"), bits 3-5 mark items the
+# camera's rules do not check (absent from ppe_status); FLAG_ABSOLUTE means the
+# box is absolute, otherwise it is a delta against the track's previous box;
+# FLAG_SCORES means the quantized avg_scores follow. Tracks missing from `tr`
+# have left the frame.
+# -------------------------------------------------------------------------------
+
+CODEC_VERSION = 1
+
+# Same ids as the detector classes (ppe_rules.CLASS_NAMES)
+CLASS_NAMES = ["boots", "helmet", "no boots", "no helmet", "no vest", "person", "vest"]
+
+STATUS_BITS = {"helmet": 1, "vest": 2, "boots": 4}
+SKIP_SHIFT = 3
+FLAG_ABSOLUTE = 0x40
+FLAG_SCORES = 0x80
+
+SCORE_SCALE = 100           # avg_scores sent as integer percent
+INT16_MIN, INT16_MAX = -32768, 32767
+
+# ---------- Defaults ----------
+CODEC_FORMATS = ("json", "msgpack")
+DEFAULT_KEYFRAME_INTERVAL = 30
+
+
+def _int16(v):
+    return max(INT16_MIN, min(INT16_MAX, int(round(v))))
+
+
+def status_bits(ppe_status):
+    bits = 0
+    for name, bit in STATUS_BITS.items():
+        value = ppe_status.get(name)
+        if value == "yes":
+            bits |= bit
+        elif value is None:
+            bits |= bit << SKIP_SHIFT
+    return bits
+
+
+class DetectionEncoder:
+    """
+    Per-viewer encoder. Deltas are taken against the last frame this viewer
+    was sent, so frame-rate caps and late joins need no special handling.
+    """
+
+    def __init__(self, fmt="json", keyframe_interval=DEFAULT_KEYFRAME_INTERVAL, ids=None):
+        if fmt == "msgpack" and msgpack is None:
+            logger.warning("msgpack not installed; sending compact JSON instead")
+            fmt = "json"
+        if fmt not in CODEC_FORMATS:
+            raise ValueError(f"Unknown codec format {fmt!r}")
+        self.fmt = fmt
+        self.binary = fmt == "msgpack"
+        self.keyframe_interval = max(1, int(keyframe_interval or DEFAULT_KEYFRAME_INTERVAL))
+        self.ids = list(ids) if ids is not None else None
+        self.classes = list(CLASS_NAMES)
+        self._codes = {name: code for code, name in enumerate(self.classes)}
+        self._prev = {}         # person_id -> (box, scores) last sent
+        self._since_key = None
+
+    def request_keyframe(self):
+        self._since_key = None
+
+    def _code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            # Classes outside the table are appended; the next keyframe carries them
+            code = self._codes[name] = len(self.classes)
+            self.classes.append(name)
+            self._since_key = None
+        return code
+
+    def encode(self, payload):
+        """Compact message (dict) for a {frame_num, time_stamp, detections, alert} payload."""
+        # Resolve class codes first: a new class forces this frame to be a keyframe
+        tracks = []
+        for det in payload.get("detections") or []:
+            scores = tuple(sorted(
+                (self._code(name), int(round(score * SCORE_SCALE)))
+                for name, score in det.get("avg_scores", {}).items()
+            ))
+            tracks.append((det["person_id"], status_bits(det.get("ppe_status", {})),
+                           tuple(_int16(v) for v in det["bbox"]), scores))
+        key = self._since_key is None or self._since_key + 1 >= self.keyframe_interval
+
+        message = {"v": CODEC_VERSION, "f": payload.get("frame_num"), "ts": payload.get("time_stamp"), "k": int(key)}
+        if key:
+            message["cls"] = self.classes
+            if self.ids is not None:
+                message["id"] = self.ids
+            self._prev = {}
+
+        prev, seen, out = self._prev, {}, []
+        for pid, flags, box, scores in tracks:
+            last = prev.get(pid) if pid != -1 else None
+            if last is None:
+                flags |= FLAG_ABSOLUTE
+                row = [pid, flags, *box]
+            else:
+                row = [pid, flags, *(_int16(b - a) for a, b in zip(last[0], box))]
+            if last is None or last[1] != scores:
+                row[1] |= FLAG_SCORES
+                row.extend(v for pair in scores for v in pair)
+            out.append(row)
+            if pid != -1:
+                seen[pid] = (box, scores)
+        message["tr"] = out
+        if payload.get("alert"):
+            message["a"] = payload["alert"]
+
+        self._prev = seen
+        self._since_key = 0 if key else self._since_key + 1
+        return message
+
+    def pack(self, message):
+        """bytes for msgpack (send as a binary frame), str for JSON."""
+        if self.binary:
+            return msgpack.packb(message, use_bin_type=True)
+        return json.dumps(message, separators=(",", ":"))
+
+
+class DetectionDecoder:
+    """Rebuilds the verbose payload from compact messages (clients, tests, replay)."""
+
+    def __init__(self):
+        self.classes = list(CLASS_NAMES)
+        self.ids = None
+        self._prev = {}         # person_id -> (box, avg_scores)
+
+    def decode(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            if msgpack is None:
+                raise RuntimeError("msgpack is required to decode binary frames")
+            message = msgpack.unpackb(data, raw=False)
+        elif isinstance(data, str):
+            message = json.loads(data)
+        else:
+            message = data
+
+        if message.get("k"):
+            self.classes = list(message.get("cls", self.classes))
+            self.ids = message.get("id", self.ids)
+            self._prev = {}
+
+        detections, seen = [], {}
+        for row in message.get("tr", []):
+            pid, flags = row[0], row[1]
+            values = row[2:6]
+            last = self._prev.get(pid)
+            if flags & FLAG_ABSOLUTE or last is None:
+                box = list(values)
+            else:
+                box = [a + d for a, d in zip(last[0], values)]
+            if flags & FLAG_SCORES:
+                pairs = row[6:]
+                scores = {self.classes[pairs[i]]: pairs[i + 1] / SCORE_SCALE for i in range(0, len(pairs), 2)}
+            else:
+                scores = dict(last[1]) if last is not None else {}
+            detections.append({
+                "person_id": pid,
+                "avg_scores": scores,
+                "ppe_status": {name: "yes" if flags & bit else "no"
+                               for name, bit in STATUS_BITS.items() if not flags & (bit << SKIP_SHIFT)},
+                "bbox": box,
+            })
+            if pid != -1:
+                seen[pid] = (box, scores)
+        self._prev = seen
+
+        payload = {
+            "frame_num": message.get("f"),
+            "time_stamp": message.get("ts"),
+            "detections": detections,
+            "alert": message.get("a"),
+        }
+        if self.ids is not None:
+            payload["user_id"], payload["camera_id"], payload["org_id"] = self.ids
+        if "img" in message:
+            payload["annotated_frame"] = message["img"]
+        return payload
@@ -0,0 +1,363 @@
+import os
+import sys
+import json
+import mmap
+import time
+import shutil
+import struct
+import logging
+import argparse
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from src.utils.video_source import _BufferRing, _scaled_size
+
+logger = logging.getLogger("frame_replay")
+logger.setLevel(logging.INFO)
+
+# ---------- Defaults ----------
+DEFAULT_RECORD = {
+    "dir": os.getenv("PPE_RECORD_DIR", "/tmp/ppe_recordings"),
+    "format": "raw",            # "raw" = exact decoded pixels; "jpeg" = ~10x smaller, not bit-exact to live
+    "quality": 95,              # jpeg format only
+    "max_mb": int(os.getenv("PPE_RECORD_MAX_MB", 2048)),     # ~2 min of 720p raw frames at 25 fps
+    # Stop before the disk (shared with the storage spool) drops below this
+    "min_free_mb": int(os.getenv("PPE_RECORD_MIN_FREE_MB", 4096)),
+}
+DISK_CHECK_FRAMES = 50          # free-space check interval
+
+# -------------------------------------------------------------------------------
+# Recording format
+#
+# A recording is a directory:
+#   meta.json    fps, frame size, format, source, frame count
+#   frames.bin   frames back to back (BGR uint8 rows, or JPEG files)
+#   index.bin    one INDEX record per frame: offset, length, height, width,
+#                source timestamp
+# Both files are append-only, so a recording cut short by a crash replays up
+# to its last complete index record. Replay mmaps frames.bin and copies each
+# frame into a reused buffer; nothing is decoded for the raw format.
+# -------------------------------------------------------------------------------
+
+RECORD_VERSION = 1
+INDEX = struct.Struct("<QIHHd")
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("height", "<u2"), ("width", "<u2"), ("ts", "<f8")])
+META = "meta.json"
+FRAMES = "frames.bin"
+INDEX_FILE = "index.bin"
+REPLAY_SCHEME = "replay://"
+
+# Event fields that differ between otherwise identical runs
+UNSTABLE_FIELDS = ("alert_id",)
+
+
+def _write_all(fd, data):
+    view = memoryview(data).cast("B")
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+class FrameRecorder:
+    """Appends decoded frames and their source timestamps to a recording directory."""
+
+    def __init__(self, path, fps=0.0, fmt=None, quality=None, max_mb=None, source=None, min_free_mb=None):
+        self.path = path
+        self.fmt = fmt or DEFAULT_RECORD["format"]
+        if self.fmt not in ("raw", "jpeg"):
+            raise ValueError(f"Unknown recording format {self.fmt!r}")
+        self.quality = int(quality or DEFAULT_RECORD["quality"])
+        self.max_bytes = int(max_mb or DEFAULT_RECORD["max_mb"]) * 1024 * 1024
+        min_free_mb = DEFAULT_RECORD["min_free_mb"] if min_free_mb is None else min_free_mb
+        self.min_free = int(min_free_mb) * 1024 * 1024
+        os.makedirs(path, exist_ok=True)
+        self._frames_fd = os.open(os.path.join(path, FRAMES), os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644)
+        self._index_fd = os.open(os.path.join(path, INDEX_FILE), os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644)
+        self.meta = {
+            "version": RECORD_VERSION, "format": self.fmt, "fps": fps, "source": source,
+            "started": time.time(), "frames": 0, "width": None, "height": None,
+        }
+        self.offset = 0
+        self.frames = 0
+        self.full = False
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp = os.path.join(self.path, META + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, os.path.join(self.path, META))
+
+    def write(self, frame, timestamp):
+        """Append one BGR frame; False once max_mb is reached (the recording stops there)."""
+        if self.full:
+            return False
+        if self.fmt == "jpeg":
+            ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                return True
+            data = buf
+        else:
+            data = np.ascontiguousarray(frame)
+        length = data.nbytes
+        if self.offset + length > self.max_bytes:
+            self.full = True
+            logger.warning(f"Recording {self.path} reached {self.max_bytes >> 20} MB; stopped at {self.frames} frames")
+            return False
+        if self.frames % DISK_CHECK_FRAMES == 0 and shutil.disk_usage(self.path).free < self.min_free + length:
+            self.full = True
+            logger.warning(f"Recording {self.path} stopped at {self.frames} frames: under {self.min_free >> 20} MB free")
+            return False
+
+        h, w = frame.shape[:2]
+        _write_all(self._frames_fd, data)
+        # Index record last: a frame is only replayed once its bytes are complete
+        os.write(self._index_fd, INDEX.pack(self.offset, length, h, w, float(timestamp)))
+        self.offset += length
+        self.frames += 1
+        if self.meta["width"] is None:
+            self.meta["width"], self.meta["height"] = w, h
+            self._write_meta()
+        return True
+
+    def close(self):
+        if self._frames_fd is None:
+            return
+        for fd in (self._frames_fd, self._index_fd):
+            os.fsync(fd)
+            os.close(fd)
+        self._frames_fd = self._index_fd = None
+        self.meta["frames"] = self.frames
+        self._write_meta()
+        logger.info(f"Recording {self.path} closed: {self.frames} frames, {self.offset >> 20} MB")
+
+
+def new_recording_path(name, root=None):
+    return os.path.join(root or DEFAULT_RECORD["dir"], f"{name}-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}")
+
+
+def start_recording(cfg, name, fps=0.0, source=None):
+    """
+    FrameRecorder for a stream's "record" config, or None when it is off.
+    cfg: True (defaults), a directory path, or a dict of DEFAULT_RECORD keys
+    plus an optional "path".
+    """
+    if not cfg:
+        return None
+    if isinstance(cfg, str):
+        cfg = {"path": cfg}
+    elif not isinstance(cfg, dict):
+        cfg = {}
+    opts = dict(DEFAULT_RECORD)
+    opts.update({k: v for k, v in cfg.items() if k in DEFAULT_RECORD})
+    path = cfg.get("path") or new_recording_path(name, opts["dir"])
+    recorder = FrameRecorder(path, fps=fps, fmt=opts["format"], quality=opts["quality"], max_mb=opts["max_mb"],
+                             source=source, min_free_mb=opts["min_free_mb"])
+    logger.info(f"[{name}] Recording frames to {path}")
+    return recorder
+
+
+# -------------------------------------------------------------------------------
+# Replay source
+# -------------------------------------------------------------------------------
+
+class ReplaySource:
+    """
+    Video source over a recording (same interface as video_source backends).
+    realtime=True paces frames by their recorded timestamps (divided by
+    speed); otherwise frames come as fast as they are read. timestamp is
+    the recorded source time, so clock-driven logic sees the original timing.
+    """
+
+    def __init__(self, path, realtime=False, speed=1.0, width=None, pool_size=3):
+        self.path = path
+        self.realtime = realtime
+        self.speed = max(float(speed or 1.0), 1e-6)
+        self.width = width
+        self.timestamp = None
+        self._ring = _BufferRing(pool_size)
+        self._map = None
+        self.position = 0
+
+        with open(os.path.join(path, META)) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, INDEX_FILE), "rb") as f:
+            raw = f.read()
+        # A torn trailing record (crash mid-write) is ignored
+        self.index = np.frombuffer(raw[:len(raw) - len(raw) % INDEX.size], dtype=INDEX_DTYPE)
+
+        size = os.path.getsize(os.path.join(path, FRAMES))
+        if len(self.index):
+            ends = self.index["offset"] + self.index["length"]
+            self.index = self.index[ends <= size]
+        if size:
+            with open(os.path.join(path, FRAMES), "rb") as f:
+                self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+        self.fps = float(self.meta.get("fps") or 0.0)
+        w, h = self.meta.get("width") or 0, self.meta.get("height") or 0
+        self.frame_width, self.frame_height = _scaled_size(w, h, width) if w else (w, h)
+        self._wall_start = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def isOpened(self):
+        return self._map is not None and self.position < len(self.index)
+
+    def read(self):
+        if not self.isOpened():
+            return False, None
+        rec = self.index[self.position]
+        self.position += 1
+
+        ts = float(rec["ts"])
+        if self.realtime:
+            if self._wall_start is None:
+                self._wall_start = (time.perf_counter(), ts)
+            due = self._wall_start[0] + (ts - self._wall_start[1]) / self.speed
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+        start, length = int(rec["offset"]), int(rec["length"])
+        h, w = int(rec["height"]), int(rec["width"])
+        data = np.frombuffer(self._map, dtype=np.uint8, count=length, offset=start)
+        if self.meta["format"] == "jpeg":
+            img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+            if img is None:
+                return False, None
+        else:
+            img = data.reshape(h, w, 3)
+
+        out_w, out_h = _scaled_size(w, h, self.width)
+        out = self._ring.next(out_h, out_w)
+        if (out_w, out_h) == (w, h):
+            np.copyto(out, img)
+        else:
+            cv2.resize(img, (out_w, out_h), dst=out, interpolation=cv2.INTER_AREA)
+        self.timestamp = ts
+        return True, out
+
+    def release(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def open_replay(url, width=None, pool_size=3):
+    """replay:///path/to/recording[?realtime=1&speed=2] -> ReplaySource."""
+    parsed = urlparse(url)
+    query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+    path = (parsed.netloc + parsed.path) if parsed.netloc else parsed.path
+    return ReplaySource(
+        path,
+        realtime=query.get("realtime", "0") in ("1", "true", "yes"),
+        speed=float(query.get("speed", 1.0)),
+        width=width,
+        pool_size=pool_size,
+    )
+
+
+# -------------------------------------------------------------------------------
+# Detection log: one canonical JSON line per frame, diffable between runs
+# -------------------------------------------------------------------------------
+
+class DetectionLog:
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "w")
+
+    def write(self, frame_num, source_ts, detections, alerts=None):
+        events = [{k: v for k, v in event.items() if k not in UNSTABLE_FIELDS} for event in alerts or ()]
+        line = {"frame_num": frame_num, "ts": round(source_ts, 6) if source_ts is not None else None,
+                "detections": detections, "alerts": events}
+        self._file.write(json.dumps(line, sort_keys=True, separators=(",", ":")) + "\n")
+
+    def close(self, alerts=None):
+        """alerts: events raised by the stream stopping, logged as a final line with frame_num null."""
+        if self._file.closed:
+            return
+        if alerts:
+            self.write(None, None, [], alerts)
+        self._file.close()
+
+
+def compare_logs(path_a, path_b, limit=10):
+    """Frame-by-frame comparison of two detection logs."""
+    differing, first = [], None
+    frames = 0
+    with open(path_a) as fa, open(path_b) as fb:
+        for line_a, line_b in zip(fa, fb):
+            frames += 1
+            if line_a == line_b:
+                continue
+            a, b = json.loads(line_a), json.loads(line_b)
+            keys = sorted(k for k in set(a) | set(b) if a.get(k) != b.get(k))
+            differing.append({"frame_num": a.get("frame_num"), "fields": keys})
+        extra_a, extra_b = sum(1 for _ in fa), sum(1 for _ in fb)
+    if differing:
+        first = differing[0]["frame_num"]
+    return {
+        "frames_compared": frames,
+        "identical": not differing and extra_a == extra_b == 0,
+        "differing_frames": len(differing),
+        "first_difference": first,
+        "differences": differing[:limit],
+        "extra_frames": {"a": extra_a, "b": extra_b},
+    }
+
+
+# -------------------------------------------------------------------------------
+# CLI: record a stream without running the model
+#
+#   python -m src.utils.frame_replay Cam424 --region us-east-1 --seconds 300
+#   python -m src.utils.frame_replay https://.../clip.mp4 --out /data/rec/clip1
+# -------------------------------------------------------------------------------
+
+def record_stream(source, out=None, seconds=60.0, region="ap-south-1", decode=None, fmt=None, width=720):
+    from src.utils.video_source import open_video_source
+
+    url = source
+    if not source.startswith(("https://", "http://", "rtsp://", "/")) and not os.path.exists(source):
+        from src.utils.kvs_stream import get_kvs_hls_url
+        url = get_kvs_hls_url(source, region)
+        if not url:
+            raise RuntimeError(f"No HLS URL for {source}")
+
+    cap = open_video_source(url, decode, width=width)
+    name = os.path.basename(source.rstrip("/")).split("?")[0] or "stream"
+    recorder = FrameRecorder(out or new_recording_path(name), fps=cap.fps, fmt=fmt, source=source)
+    deadline = time.monotonic() + seconds
+    try:
+        while cap.isOpened() and time.monotonic() < deadline:
+            ret, frame = cap.read()
+            if not ret or not recorder.write(frame, cap.timestamp):
+                break
+    finally:
+        cap.release()
+        recorder.close()
+    return recorder.path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record a camera's decoded frames for offline replay")
+    parser.add_argument("source", help="KVS stream name, URL or local video file")
+    parser.add_argument("--out", help="recording directory (default: PPE_RECORD_DIR/<name>-<time>)")
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--region", default="ap-south-1")
+    parser.add_argument("--format", choices=("raw", "jpeg"), default=DEFAULT_RECORD["format"])
+    parser.add_argument("--width", type=int, default=720, help="analysis width (the pipeline uses 720)")
+    args = parser.parse_args(argv)
+
+    path = record_stream(args.source, args.out, args.seconds, args.region, fmt=args.format, width=args.width)
+    print(f"{path}  (replay with video_url replay://{os.path.abspath(path)})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
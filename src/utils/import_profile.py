@@ -0,0 +1,100 @@
+import sys
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+# -------------------------------------------------------------------------------
+# Import-time profile
+#
+# Runs `python -X importtime -c "import <target>"` in a fresh interpreter and
+# summarizes CPython's per-module report (self / cumulative microseconds):
+# the slowest top-level imports, the slowest modules by their own time, and
+# self time rolled up per package. Usage:
+#
+#   python app.py --import-profile
+#   python -m src.utils.import_profile app --top 30
+# -------------------------------------------------------------------------------
+
+DEFAULT_TARGET = "app"
+DEFAULT_TOP = 20
+
+
+def parse_importtime(stderr):
+    """[(module, depth, self_us, cumulative_us), ...] in import order."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue        # the "self [us] | cumulative | imported package" header
+        name = parts[2].rstrip()
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        rows.append((stripped, depth, self_us, cumulative_us))
+    return rows
+
+
+def profile_imports(target=DEFAULT_TARGET, python=None):
+    """(rows, wall_seconds, returncode, stderr) for importing target in a child interpreter."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [python or sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    return parse_importtime(proc.stderr), wall, proc.returncode, proc.stderr
+
+
+def summarize(rows, wall, top=DEFAULT_TOP):
+    total_us = sum(r[2] for r in rows)
+    packages = defaultdict(int)
+    for name, _, self_us, _ in rows:
+        packages[name.split(".")[0]] += self_us
+
+    def ms(us):
+        return f"{us / 1000:9.1f}"
+
+    lines = [
+        f"Interpreter wall time: {wall * 1000:.1f} ms",
+        f"Modules imported:      {len(rows)}",
+        f"Total import time:     {total_us / 1000:.1f} ms",
+        "",
+        f"Slowest top-level imports (cumulative ms), top {top}:",
+    ]
+    for name, _, _, cumulative_us in sorted((r for r in rows if r[1] == 0), key=lambda r: -r[3])[:top]:
+        lines.append(f"  {ms(cumulative_us)}  {name}")
+
+    lines += ["", f"Slowest modules (self ms), top {top}:"]
+    for name, _, self_us, _ in sorted(rows, key=lambda r: -r[2])[:top]:
+        lines.append(f"  {ms(self_us)}  {name}")
+
+    lines += ["", f"Packages (self ms summed), top {top}:"]
+    for name, self_us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+        lines.append(f"  {ms(self_us)}  {name}  ({100.0 * self_us / max(total_us, 1):.1f}%)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize `python -X importtime` for a module")
+    parser.add_argument("target", nargs="?", default=DEFAULT_TARGET, help="module to import (default: app)")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="rows per section")
+    args = parser.parse_args(argv)
+
+    rows, wall, returncode, stderr = profile_imports(args.target)
+    print(summarize(rows, wall, args.top))
+    if returncode != 0:
+        # Import failed part-way: the report covers what loaded before the error
+        tail = [line for line in stderr.splitlines() if not line.startswith("import time:")]
+        print(f"\nimport {args.target} failed (exit {returncode}):", file=sys.stderr)
+        print("\n".join(tail[-15:]), file=sys.stderr)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,5 @@
 import time
 import logging
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
 
 logger = logging.getLogger("kvs")
 logger.setLevel(logging.INFO)
@@ -30,6 +28,10 @@ def get_kvs_hls_url(stream_name: str, region: str = "us-east-1", retries: int =
         logger.error("Stream name is required")
         return None
 
+    # Imported here: boto3 is only needed once a stream starts, not at process startup
+    import boto3
+    from botocore.exceptions import BotoCoreError, ClientError
+
     try:
         kvs_client = boto3.client("kinesisvideo", region_name=region)
 
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+
+from src.utils.metrics import LOOP_LAG, LOOP_STALLS
+from src.utils.profiler import collapse_stack
+
+logger = logging.getLogger("loop_monitor")
+logger.setLevel(logging.INFO)
+
+LOOP_LAG_INTERVAL = float(os.getenv("PPE_LOOP_LAG_INTERVAL", 0.1))
+# Blocking the loop longer than this logs the stack that is holding it
+LOOP_LAG_THRESHOLD = float(os.getenv("PPE_LOOP_LAG_THRESHOLD", 0.25))
+
+
+class LoopLagMonitor:
+    """
+    Event-loop latency probe plus a stall watchdog.
+
+    A heartbeat coroutine sleeps `interval` and records how late it woke up
+    (LOOP_LAG). A watchdog thread notices when the heartbeat has not run for
+    `threshold` seconds and logs the loop thread's current stack, i.e. the
+    callsite that is blocking every other client, once per stall.
+    """
+
+    def __init__(self, loop, interval=LOOP_LAG_INTERVAL, threshold=LOOP_LAG_THRESHOLD):
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self.loop_thread_id = None
+        self.stalls = 0
+        self._last_beat = time.monotonic()
+        self._task = None
+        self._stop = threading.Event()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+
+    def start(self):
+        self._task = self.loop.create_task(self._heartbeat())
+        self._watchdog.start()
+        logger.info(f"Loop-lag monitor started (interval {self.interval}s, threshold {self.threshold}s)")
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        self.loop_thread_id = threading.get_ident()
+        while not self._stop.is_set():
+            start = time.monotonic()
+            self._last_beat = start
+            await asyncio.sleep(self.interval)
+            LOOP_LAG.observe(max(0.0, time.monotonic() - start - self.interval))
+
+    def _watch(self):
+        stalled_since = None
+        while not self._stop.wait(self.threshold / 2):
+            behind = time.monotonic() - self._last_beat - self.interval
+            if behind <= self.threshold:
+                if stalled_since is not None:
+                    logger.warning(f"Event loop recovered after {time.monotonic() - stalled_since:.2f}s")
+                    stalled_since = None
+                continue
+            if stalled_since is not None or self.loop_thread_id is None:
+                continue
+
+            stalled_since = self._last_beat + self.interval
+            self.stalls += 1
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = collapse_stack(frame) if frame is not None else "<unavailable>"
+            del frame
+            logger.warning(f"Event loop blocked for {behind:.2f}s; loop thread is in: {stack}")
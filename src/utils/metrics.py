@@ -0,0 +1,335 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+
+logger = logging.getLogger("metrics")
+
+# When PROMETHEUS_MULTIPROC_DIR is set, samples recorded in the storage worker
+# processes (S3 upload / DB insert) are aggregated into /metrics as well.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+STAGES = (
+    "capture",      # cap.read() / decode
+    "preprocess",   # resize, colour conversion, letterbox
+    "inference",    # model forward + NMS (+ tiled pass)
+    "tracker",      # ByteTrack update
+    "ppe_logic",    # PPELogic.process_frame
+    "encode",       # JPEG / base64 / payload serialisation
+    "ws_send",      # WebSocket send on the event loop
+    "s3_upload",    # storage worker
+    "db_insert",    # storage worker
+)
+
+# 1 ms .. 5 s, dense where the per-frame stages live
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03, 0.05,
+    0.075, 0.1, 0.15, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+# ---------------- Metric families ----------------
+STAGE_LATENCY = Histogram(
+    "ppe_stage_seconds",
+    "Per-stream latency of each hot-path stage",
+    ["stream", "session", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+ACTIVE_SESSIONS = Gauge(
+    "ppe_active_sessions",
+    "WebSocket sessions currently streaming",
+    multiprocess_mode="livesum",
+)
+EXECUTOR_QUEUE = Gauge(
+    "ppe_executor_queue_depth",
+    "Tasks waiting in a thread pool executor",
+    ["executor"],
+    multiprocess_mode="livesum",
+)
+SPOOL_BACKLOG = Gauge(
+    "ppe_spool_backlog_bytes",
+    "Bytes written to a stream's storage spool and not yet flushed to S3/DB",
+    ["stream", "session"],
+    multiprocess_mode="livesum",
+)
+DROPPED_FRAMES = Counter(
+    "ppe_dropped_frames_total",
+    "Frames dropped on the hot path",
+    ["stream", "session", "reason"],
+)
+ALERT_DELIVERY = Histogram(
+    "ppe_alert_delivery_seconds",
+    "Time from an alert event being raised to its delivery, per sink",
+    ["sink"],
+    buckets=LATENCY_BUCKETS,
+)
+ALERTS_DROPPED = Counter(
+    "ppe_alerts_dropped_total",
+    "Alert events dropped because a sink's queue was full",
+    ["sink"],
+)
+DECISION_CACHE = Counter(
+    "ppe_decision_cache_total",
+    "PPELogic per-track decision cache events",
+    ["stream", "session", "event"],
+)
+LOOP_LAG = Histogram(
+    "ppe_event_loop_lag_seconds",
+    "How late the event loop runs a scheduled callback (time other callbacks held it)",
+    buckets=LATENCY_BUCKETS,
+)
+LOOP_STALLS = Counter(
+    "ppe_event_loop_stalls_total",
+    "Times the event loop was blocked beyond the loop-lag threshold",
+)
+
+
+# ---------------- Per-stream handle ----------------
+class _RingTap:
+    """Forwards observe() to the prometheus child and adds the value to the current frame's slot."""
+    __slots__ = ("child", "slot", "current")
+
+    def __init__(self, child, slot, current):
+        self.child = child
+        self.slot = slot
+        self.current = current
+
+    def observe(self, value):
+        self.current[self.slot] += value
+        self.child.observe(value)
+
+
+# Concurrent sessions per stream, numbered 0, 1, ... and reused once closed
+_session_slots = {}
+_sessions_lock = threading.Lock()
+
+
+def _claim_session(stream):
+    with _sessions_lock:
+        used = _session_slots.setdefault(stream, set())
+        number = 0
+        while number in used:
+            number += 1
+        used.add(number)
+        return str(number)
+
+
+def _release_session(stream, number):
+    with _sessions_lock:
+        used = _session_slots.get(stream, set())
+        used.discard(int(number))
+        if not used:
+            _session_slots.pop(stream, None)
+
+
+class StreamMetrics:
+    """
+    Label children pre-bound once per stream, so recording a sample on the
+    hot path is a single observe()/inc() with no label lookup or dict churn.
+    Children are keyed by (stream, session): two sessions on the same camera
+    get separate series, so one closing never removes the other's. Session
+    numbers are the lowest free per stream and are reused, so restarts add
+    no series (multiprocess files can't be removed from /metrics).
+    """
+
+    def __init__(self, stream, session=None):
+        self.stream = str(stream)
+        # A session number passed in belongs to the creator (e.g. the detection thread, for its storage worker)
+        self._owns_session = session is None
+        self.session = _claim_session(self.stream) if session is None else str(session)
+        for stage in STAGES:
+            setattr(self, stage, self._stage(stage))
+        self.spool_backlog = SPOOL_BACKLOG.labels(self.stream, self.session)
+        self.dropped_storage = DROPPED_FRAMES.labels(self.stream, self.session, "spool_full")
+        self.dropped_encode = DROPPED_FRAMES.labels(self.stream, self.session, "encode_failed")
+        self.cache_hits = DECISION_CACHE.labels(self.stream, self.session, "hit")
+        self.cache_misses = DECISION_CACHE.labels(self.stream, self.session, "miss")
+        self.cache_revalidations = DECISION_CACHE.labels(self.stream, self.session, "revalidation")
+        self._cache_seen = (0, 0, 0)
+
+        # encode is split across several call sites; it accumulates here and is
+        # observed once per frame, so the histogram gets one sample per frame.
+        self.encode_pending = 0.0
+
+        # Per-frame stage timing ring buffer, only allocated while enabled.
+        # Toggled from the event loop while the detection thread writes rows.
+        self.timings = None
+        self._current = None
+        self._timings_lock = threading.Lock()
+
+    def _stage(self, stage):
+        return STAGE_LATENCY.labels(self.stream, self.session, stage)
+
+    # ---------- Timing ring buffer ----------
+    def enable_timings(self, frames=1000):
+        """Start recording one row of stage timings per frame into a bounded ring."""
+        current = [0.0] * len(STAGES)
+        with self._timings_lock:
+            self.timings = deque(maxlen=int(frames))
+            self._current = current
+        for slot, stage in enumerate(STAGES):
+            setattr(self, stage, _RingTap(self._stage(stage), slot, current))
+
+    def disable_timings(self):
+        for stage in STAGES:
+            setattr(self, stage, self._stage(stage))
+        with self._timings_lock:
+            self.timings = None
+            self._current = None
+
+    def end_frame(self, frame_num):
+        """Close the current frame's timing row (no-op unless timings are enabled)."""
+        if self._current is None:
+            return
+        with self._timings_lock:
+            timings, current = self.timings, self._current
+            if current is None:
+                return
+            timings.append((frame_num, time.time(), *current))
+            for slot in range(len(current)):
+                current[slot] = 0.0
+
+    def timings_snapshot(self):
+        """
+        Rows of (frame_num, unix_time, <seconds per stage>). ws_send completes
+        asynchronously, so it usually lands on the following frame's row.
+        """
+        with self._timings_lock:
+            timings = self.timings
+            rows = list(timings) if timings is not None else []
+        return {
+            "stream": self.stream,
+            "enabled": timings is not None,
+            "columns": ["frame_num", "time"] + list(STAGES),
+            "rows": rows,
+        }
+
+    def observe_speed(self, speed):
+        """Record ultralytics Results.speed (milliseconds) as preprocess / inference."""
+        self.preprocess.observe(speed["preprocess"] / 1000.0)
+        self.inference.observe((speed["inference"] + speed["postprocess"]) / 1000.0)
+
+    def add_encode(self, seconds):
+        self.encode_pending += seconds
+
+    def flush_encode(self):
+        self.encode.observe(self.encode_pending)
+        self.encode_pending = 0.0
+
+    def sync_cache(self, cache_stats):
+        """Push PPELogic.cache_stats deltas since the last sync."""
+        hits, misses, revalidations = cache_stats["hits"], cache_stats["misses"], cache_stats["revalidations"]
+        last_hits, last_misses, last_revalidations = self._cache_seen
+        self.cache_hits.inc(hits - last_hits)
+        self.cache_misses.inc(misses - last_misses)
+        self.cache_revalidations.inc(revalidations - last_revalidations)
+        self._cache_seen = (hits, misses, revalidations)
+
+    def close(self):
+        """Drop this session's label sets so stopped streams don't linger in /metrics."""
+        for stage in STAGES:
+            _safe_remove(STAGE_LATENCY, self.stream, self.session, stage)
+        _safe_remove(SPOOL_BACKLOG, self.stream, self.session)
+        for reason in ("spool_full", "encode_failed"):
+            _safe_remove(DROPPED_FRAMES, self.stream, self.session, reason)
+        for event in ("hit", "miss", "revalidation"):
+            _safe_remove(DECISION_CACHE, self.stream, self.session, event)
+        if self._owns_session:
+            _release_session(self.stream, self.session)
+            self._owns_session = False
+
+
+def _safe_remove(metric, *labels):
+    try:
+        metric.remove(*labels)
+    except KeyError:
+        pass
+
+
+async def timed_send(ws, data, child):
+    """ws.send_text() / send_bytes() that records its own latency on the event loop."""
+    start = time.perf_counter()
+    if isinstance(data, bytes):
+        await ws.send_bytes(data)
+    else:
+        await ws.send_text(data)
+    child.observe(time.perf_counter() - start)
+
+
+# ---------------- Process-level gauges ----------------
+# Set explicitly rather than with set_function(), which multiprocess mode
+# (PROMETHEUS_MULTIPROC_DIR) ignores.
+_tracked_sessions = []
+
+
+def track_executor(name, executor):
+    """Count tasks submitted to executor that have not started running yet."""
+    gauge = EXECUTOR_QUEUE.labels(name)
+    submit = executor.submit
+
+    def tracked_submit(fn, /, *args, **kwargs):
+        started = threading.Event()
+
+        def run(*a, **kw):
+            started.set()
+            gauge.dec()
+            return fn(*a, **kw)
+
+        def done(future):
+            if not started.is_set():    # cancelled while queued
+                started.set()
+                gauge.dec()
+
+        gauge.inc()
+        try:
+            future = submit(run, *args, **kwargs)
+        except Exception:
+            gauge.dec()
+            raise
+        future.add_done_callback(done)
+        return future
+
+    # loop.run_in_executor() goes through submit() too
+    executor.submit = tracked_submit
+
+
+def track_sessions(sessions):
+    _tracked_sessions.append(sessions)
+    refresh_gauges()
+
+
+def refresh_gauges():
+    """Recount streaming sessions; called on every scrape and periodically."""
+    ACTIVE_SESSIONS.set(sum(1 for sessions in _tracked_sessions
+                            for s in list(sessions.values()) if s.get("streaming")))
+
+
+async def refresh_gauges_forever(interval=5.0):
+    """Keeps this worker's gauges current for scrapes that another worker answers."""
+    while True:
+        refresh_gauges()
+        await asyncio.sleep(interval)
+
+
+# ---------------- Exposition ----------------
+def render_metrics():
+    """Return (body, content_type) for the /metrics endpoint."""
+    refresh_gauges()
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import logging
+import tracemalloc
+from collections import Counter, deque
+
+logger = logging.getLogger("profiler")
+logger.setLevel(logging.INFO)
+
+MAX_PROFILE_SECONDS = 120
+MIN_INTERVAL = 0.001
+
+
+# -------------------------------------------------------------------------------
+# Sampling profiler (one thread, on demand)
+# -------------------------------------------------------------------------------
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame):
+    """Outermost-first 'a;b;c' stack string for a frame."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def sample_thread(thread_id, seconds, interval=0.005):
+    """
+    Sample one thread's Python stack every `interval` seconds for `seconds`.
+
+    Runs on the caller's thread and only reads sys._current_frames(), so the
+    sampled thread is never paused or instrumented. Returns (Counter of
+    collapsed stacks, number of samples).
+    """
+    seconds = min(float(seconds), MAX_PROFILE_SECONDS)
+    interval = max(float(interval), MIN_INTERVAL)
+
+    stacks = Counter()
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break  # thread exited
+        stacks[collapse_stack(frame)] += 1
+        samples += 1
+        del frame
+        time.sleep(interval)
+
+    return stacks, samples
+
+
+def render_collapsed(stacks):
+    """Brendan Gregg collapsed format: 'frame;frame;frame count' per line."""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def profile_session(session, seconds, interval=0.005):
+    """Profile a session's detection thread; returns collapsed-stack text."""
+    thread_id = session.get("thread_id")
+    if thread_id is None:
+        raise LookupError("session has no running detection thread")
+
+    logger.info(f"Profiling thread {thread_id} for {seconds}s (interval {interval}s)")
+    stacks, samples = sample_thread(thread_id, seconds, interval)
+    logger.info(f"Profile finished: {samples} samples, {len(stacks)} distinct stacks")
+    return render_collapsed(stacks)
+
+
+# -------------------------------------------------------------------------------
+# Allocation probe (tracemalloc, a bounded number of frames)
+# -------------------------------------------------------------------------------
+
+class AllocationProbe:
+    """
+    Per-frame allocation figures for one stream while tracemalloc runs:
+
+    peak_kb - high-water mark above the frame's starting usage, i.e. the
+              transient buffers a frame allocates and frees (allocator churn)
+    net_kb  - what the frame left allocated
+
+    Stops itself after `frames` frames (tracemalloc slows everything down)
+    and keeps the allocation sites that grew most over the window.
+    """
+
+    def __init__(self, frames=200, top=15):
+        self.frames = int(frames)
+        self.top = top
+        self.rows = deque(maxlen=self.frames)
+        self.sites = []
+        self.done = False
+        self._start_bytes = 0
+        self._baseline = None
+
+    def start(self):
+        if tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is already running (another probe?)")
+        tracemalloc.start(1)
+        self._baseline = tracemalloc.take_snapshot()
+
+    def frame_start(self):
+        if self.done:
+            return
+        tracemalloc.reset_peak()
+        self._start_bytes = tracemalloc.get_traced_memory()[0]
+
+    def frame_end(self, frame_num):
+        if self.done:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        self.rows.append((
+            frame_num,
+            round((peak - self._start_bytes) / 1024, 1),
+            round((current - self._start_bytes) / 1024, 1),
+        ))
+        if len(self.rows) >= self.frames:
+            self.stop()
+
+    def stop(self):
+        if self.done:
+            return
+        self.done = True
+        if not tracemalloc.is_tracing():
+            return
+        diff = tracemalloc.take_snapshot().compare_to(self._baseline, "lineno")
+        self.sites = [
+            {"site": str(stat.traceback), "size_kb": round(stat.size_diff / 1024, 1), "count": stat.count_diff}
+            for stat in diff[:self.top]
+        ]
+        tracemalloc.stop()
+        self._baseline = None
+
+    def report(self):
+        peaks = sorted(r[1] for r in self.rows)
+        nets = [r[2] for r in self.rows]
+        n = len(peaks)
+        return {
+            "done": self.done,
+            "frames": n,
+            "peak_kb": {
+                "p50": peaks[n // 2] if n else None,
+                "p95": peaks[min(n - 1, int(n * 0.95))] if n else None,
+                "max": peaks[-1] if n else None,
+            },
+            "net_kb_mean": round(sum(nets) / n, 1) if n else None,
+            "top_sites": self.sites,
+            "per_frame": [{"frame": f, "peak_kb": p, "net_kb": d} for f, p, d in self.rows],
+        }
@@ -0,0 +1,283 @@
+import os
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger("stream_supervisor")
+logger.setLevel(logging.INFO)
+
+# ---------- Defaults ----------
+DEFAULT_SUPERVISOR = {
+    "live": None,               # None = guess from the source (KVS stream, HLS/RTSP URL)
+    "stall_timeout": float(os.getenv("PPE_STALL_TIMEOUT", 10)),        # no frame for this long = stalled
+    "backoff_initial": 1.0,     # first reconnect delay (s), doubled per failed attempt
+    "backoff_max": 30.0,
+    "give_up_after": float(os.getenv("PPE_RECONNECT_GIVE_UP", 900)),   # outage length that ends the stream; 0 = never
+    "url_lifetime": 43200,      # KVS HLS session lifetime (get_kvs_hls_url Expires)
+    "renew_margin": 900,        # re-resolve the URL this long before it expires
+    "reset_after": 30.0,        # outages longer than this restart tracking (IDs / PPE history)
+}
+
+LIVE_PREFIXES = ("rtsp://", "rtsps://", "rtmp://", "udp://", "srt://")
+
+HEALTH_CONNECTED = "connected"
+HEALTH_STALLED = "stalled"
+HEALTH_RECONNECTING = "reconnecting"
+HEALTH_RENEWED = "renewed"
+HEALTH_FAILED = "failed"
+
+
+def normalize_supervisor(cfg):
+    opts = dict(DEFAULT_SUPERVISOR)
+    if isinstance(cfg, dict):
+        opts.update({k: v for k, v in cfg.items() if k in DEFAULT_SUPERVISOR})
+    return opts
+
+
+def validate_supervisor(cfg):
+    """Raise ValueError for supervisor options SupervisedSource cannot use; returns them normalized."""
+    if cfg is not None and not isinstance(cfg, dict):
+        raise ValueError("supervisor must be an object")
+    opts = normalize_supervisor(cfg)
+    if opts["live"] is not None:
+        opts["live"] = bool(opts["live"])
+    try:
+        for key in DEFAULT_SUPERVISOR:
+            if key != "live":
+                opts[key] = float(opts[key])
+    except (TypeError, ValueError):
+        raise ValueError("supervisor timings must be numbers")
+    if min(v for k, v in opts.items() if k != "live") < 0:
+        raise ValueError("supervisor timings must be non-negative")
+    if opts["stall_timeout"] <= 0 or opts["backoff_initial"] <= 0:
+        raise ValueError("stall_timeout and backoff_initial must be positive")
+    return opts
+
+
+def is_live(url, resolve=None):
+    if resolve is not None:
+        return True
+    url = (url or "").lower()
+    return url.startswith(LIVE_PREFIXES) or ".m3u8" in url
+
+
+# -------------------------------------------------------------------------------
+# Supervised source
+#
+# Drop-in for open_video_source() inside the detection loop. read() only
+# returns (False, None) once the stream is really over: end of file for
+# recorded sources, stop requested, or a live outage past give_up_after.
+# Everything in between happens inside read(), on the detection thread, so
+# the caller's StreamState (tracker, PPELogic buffers) and frame numbering
+# carry straight across a reconnect:
+#
+#   no frame for stall_timeout  -> "stalled", release, reconnect with
+#                                  exponential backoff + jitter, re-resolving
+#                                  the URL each attempt
+#   URL older than lifetime - renew_margin
+#                               -> a fresh URL is resolved and opened on a
+#                                  background thread and swapped in between
+#                                  two frames (no gap)
+#
+# Health changes go to on_health(event) as {"type": "stream_health", ...}.
+# -------------------------------------------------------------------------------
+
+class SupervisedSource:
+    """A video source that reconnects itself; see the notes above."""
+
+    def __init__(self, url, open_fn, resolve=None, cfg=None, on_health=None, should_run=None, name=""):
+        self.cfg = normalize_supervisor(cfg)
+        self.open_fn = open_fn          # url -> video source (open_video_source with the stream's decode options)
+        self.resolve = resolve          # () -> fresh URL or None; None for static URLs
+        self.on_health = on_health
+        self.should_run = should_run or (lambda: True)
+        self.name = name
+        self.live = self.cfg["live"] if self.cfg["live"] is not None else is_live(url, resolve)
+
+        self.url = url
+        self.url_time = time.monotonic()
+        self.state = None
+        self.reconnects = 0
+        self.resumed_after = None       # outage length (s) on the first frame after a reconnect
+        self.timestamp = None
+
+        self._closed = False
+        self._last_frame = time.monotonic()
+        self._outage_start = None
+        self._renewal = None            # background thread opening the next URL
+        self._renewed = None            # (source, url, resolved_at) ready to swap in
+        self._renew_due = self.url_time + self._renew_in()
+        self._lock = threading.Lock()
+
+        self.source = self._open(url)
+        if self.source is not None:
+            self._set_state(HEALTH_CONNECTED)
+        self.fps = self.source.fps if self.source is not None else 0.0
+        self.frame_width = self.source.frame_width if self.source is not None else 0
+        self.frame_height = self.source.frame_height if self.source is not None else 0
+
+    # ---------- Helpers ----------
+    def _renew_in(self):
+        if self.resolve is None or not self.cfg["url_lifetime"]:
+            return float("inf")
+        return max(60.0, self.cfg["url_lifetime"] - self.cfg["renew_margin"])
+
+    def _open(self, url):
+        if not url:
+            return None
+        try:
+            source = self.open_fn(url)
+        except Exception as e:
+            logger.warning(f"[{self.name}] Opening the stream failed: {e}")
+            return None
+        if not source.isOpened():
+            source.release()
+            return None
+        return source
+
+    def _set_state(self, state, **extra):
+        self.state = state
+        event = {"type": "stream_health", "state": state, "reconnects": self.reconnects, "time": time.time()}
+        event.update(extra)
+        if state != HEALTH_CONNECTED or extra:
+            logger.info(f"[{self.name}] Stream {state} {extra or ''}")
+        if self.on_health is not None:
+            try:
+                self.on_health(event)
+            except Exception:
+                logger.exception(f"[{self.name}] Health callback failed")
+
+    def _wait(self, seconds):
+        """Sleep in short steps; False as soon as the stream is stopped."""
+        deadline = time.monotonic() + seconds
+        while not self._closed and self.should_run():
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return True
+            time.sleep(min(left, 0.25))
+        return False
+
+    # ---------- URL renewal (make before break) ----------
+    def _start_renewal(self, now):
+        def renew():
+            try:
+                url = self.resolve()
+            except Exception as e:
+                logger.warning(f"[{self.name}] Resolving the stream URL failed: {e}")
+                url = None
+            source = self._open(url)
+            with self._lock:
+                if source is not None and not self._closed:
+                    self._renewed = (source, url, time.monotonic())
+                    return
+            if source is not None:
+                source.release()
+            logger.warning(f"[{self.name}] URL renewal failed; retrying")
+
+        # Retry in a minute if this attempt fails; a success resets the schedule at swap time
+        self._renew_due = now + 60.0
+        self._renewal = threading.Thread(target=renew, name=f"renew-{self.name}", daemon=True)
+        self._renewal.start()
+
+    def _swap_renewed(self):
+        with self._lock:
+            renewed, self._renewed = self._renewed, None
+        if renewed is None:
+            return
+        old = self.source
+        self.source, self.url, self.url_time = renewed
+        self._renew_due = self.url_time + self._renew_in()
+        if old is not None:
+            old.release()
+        self._set_state(HEALTH_RENEWED)
+
+    # ---------- Reconnect ----------
+    def _reconnect(self):
+        if self.source is not None:
+            self.source.release()
+            self.source = None
+        self._outage_start = self._outage_start or self._last_frame
+        backoff = self.cfg["backoff_initial"]
+        attempt = 0
+        while not self._closed and self.should_run():
+            outage = time.monotonic() - self._outage_start
+            if self.cfg["give_up_after"] and outage > self.cfg["give_up_after"]:
+                self._set_state(HEALTH_FAILED, outage_seconds=round(outage, 1))
+                return False
+
+            attempt += 1
+            self._set_state(HEALTH_RECONNECTING, attempt=attempt, outage_seconds=round(outage, 1))
+            url = self.url
+            if self.resolve is not None:
+                try:
+                    url = self.resolve() or url
+                except Exception as e:
+                    logger.warning(f"[{self.name}] Resolving the stream URL failed: {e}")
+            source = self._open(url)
+            if source is not None:
+                self.source = source
+                if url != self.url:
+                    self.url, self.url_time = url, time.monotonic()
+                    self._renew_due = self.url_time + self._renew_in()
+                self.reconnects += 1
+                self._last_frame = time.monotonic()     # the stall clock restarts with the new connection
+                return True
+
+            # Full jitter keeps many cameras behind one flaky uplink from reconnecting in lockstep
+            if not self._wait(random.uniform(0.5, 1.0) * backoff):
+                return False
+            backoff = min(backoff * 2, self.cfg["backoff_max"])
+        return False
+
+    # ---------- Video source interface ----------
+    def isOpened(self):
+        return not self._closed
+
+    def read(self):
+        while not self._closed:
+            if self._renewed is not None:
+                self._swap_renewed()
+
+            if self.source is not None:
+                ret, frame = self.source.read()
+                now = time.monotonic()
+                if ret:
+                    if self._outage_start is not None:
+                        self.resumed_after = now - self._outage_start
+                        self._outage_start = None
+                        self._set_state(HEALTH_CONNECTED, outage_seconds=round(self.resumed_after, 1))
+                    else:
+                        self.resumed_after = None
+                    self._last_frame = now
+                    self.timestamp = self.source.timestamp
+                    if now >= self._renew_due and (self._renewal is None or not self._renewal.is_alive()):
+                        self._start_renewal(now)
+                    return True, frame
+
+                if not self.live:
+                    return False, None         # end of a recorded source
+                if now - self._last_frame < self.cfg["stall_timeout"]:
+                    # Transient decode error: keep reading until stall_timeout without a frame
+                    if not self._wait(0.05):
+                        return False, None
+                    continue
+                if self._outage_start is None:
+                    self._set_state(HEALTH_STALLED, stalled_seconds=round(now - self._last_frame, 1))
+            elif not self.live:
+                return False, None             # a recorded source that failed to open
+
+            if not self._reconnect():
+                self.release()
+                return False, None
+        return False, None
+
+    def release(self):
+        with self._lock:
+            self._closed = True
+            renewed, self._renewed = self._renewed, None
+        if renewed is not None:
+            renewed[0].release()
+        if self.source is not None:
+            self.source.release()
+            self.source = None
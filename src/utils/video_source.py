@@ -0,0 +1,252 @@
+import os
+import time
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("video_source")
+logger.setLevel(logging.INFO)
+
+DEFAULT_DECODE = {
+    "backend": os.getenv("PPE_DECODE_BACKEND", "opencv"),   # "opencv" | "pyav"
+    "width": None,            # output width; height keeps the aspect ratio
+    "threads": int(os.getenv("PPE_DECODE_THREADS", 0)),     # 0 = decoder default
+    "keyframes_only": False,  # decode I-frames only (low-FPS analysis)
+    "pool_size": 3,           # reused output buffers handed out round-robin
+    "timeout": float(os.getenv("PPE_DECODE_TIMEOUT", 10)),  # seconds an open / read may block
+}
+
+
+def normalize_decode(cfg, **overrides):
+    decode = dict(DEFAULT_DECODE)
+    decode.update({k: v for k, v in overrides.items() if v is not None})
+    if isinstance(cfg, dict):
+        decode.update({k: v for k, v in cfg.items() if k in DEFAULT_DECODE})
+    return decode
+
+
+def _scaled_size(src_w, src_h, width):
+    if not width or width == src_w:
+        return src_w, src_h
+    return int(width), int(round(src_h * width / src_w))
+
+
+class _BufferRing:
+    """
+    Fixed set of output arrays reused round-robin. A frame returned by read()
+    stays valid until pool_size further reads, so consumers that finish with a
+    frame inside one loop iteration never see it overwritten.
+    """
+
+    def __init__(self, pool_size):
+        self.pool_size = max(1, int(pool_size))
+        self.shape = None
+        self.buffers = []
+        self.index = 0
+
+    def next(self, h, w):
+        if self.shape != (h, w):
+            self.shape = (h, w)
+            self.buffers = [np.empty((h, w, 3), dtype=np.uint8) for _ in range(self.pool_size)]
+            self.index = 0
+        buf = self.buffers[self.index]
+        self.index = (self.index + 1) % self.pool_size
+        return buf
+
+
+class _StreamClock:
+    """
+    Maps a stream's presentation times (seconds) to epoch seconds, anchored
+    at the first frame. Every backend's `timestamp` is this: wall-clock-like,
+    but advancing with the stream itself, so a file read faster than real time
+    still spans its own duration. Re-anchors on a jump back (HLS
+    discontinuity, reconnect) and when the backend reports no position.
+    """
+
+    def __init__(self):
+        self.offset = None
+        self.last = None
+
+    def __call__(self, pts):
+        if pts is None:
+            return time.time()
+        if self.offset is None or pts <= self.last:
+            self.offset = time.time() - pts
+        self.last = pts
+        return self.offset + pts
+
+
+# -------------------------------------------------------------------------------
+# OpenCV / FFmpeg backend
+# -------------------------------------------------------------------------------
+
+class OpenCVSource:
+    """cv2.VideoCapture with reused decode and resize buffers."""
+
+    def __init__(self, url, width=None, threads=0, keyframes_only=False, pool_size=3, timeout=None):
+        if keyframes_only:
+            logger.warning("keyframes_only is not supported by the opencv backend; decoding every frame")
+
+        self.url = url
+        # Per-capture open parameters (never the process-wide OPENCV_FFMPEG_CAPTURE_OPTIONS,
+        # which concurrent streams would overwrite)
+        params = []
+        if threads:
+            if hasattr(cv2, "CAP_PROP_N_THREADS"):
+                params += [cv2.CAP_PROP_N_THREADS, int(threads)]
+            else:
+                logger.warning("This OpenCV build cannot set decoder threads per capture; using its default")
+        if timeout and hasattr(cv2, "CAP_PROP_READ_TIMEOUT_MSEC"):
+            # A dead network stream fails read() after `timeout` instead of blocking forever
+            ms = int(timeout * 1000)
+            params += [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, ms]
+        self.cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG, params) if params else cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+        self.width = width
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.frame_width, self.frame_height = _scaled_size(
+            int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), width
+        )
+        self.timestamp = None
+        self._clock = _StreamClock()
+        self._raw = None
+        self._ring = _BufferRing(pool_size)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        if self._raw is not None:
+            ret, raw = self.cap.read(self._raw)
+        else:
+            ret, raw = self.cap.read()
+        if not ret:
+            return False, None
+        self._raw = raw
+
+        pos = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        self.timestamp = self._clock(pos / 1000.0 if pos >= 0 else None)
+        h, w = raw.shape[:2]
+        out_w, out_h = _scaled_size(w, h, self.width)
+        out = self._ring.next(out_h, out_w)
+        if (out_w, out_h) == (w, h):
+            np.copyto(out, raw)
+        else:
+            cv2.resize(raw, (out_w, out_h), dst=out, interpolation=cv2.INTER_AREA)
+        return True, out
+
+    def release(self):
+        self.cap.release()
+
+
+# -------------------------------------------------------------------------------
+# PyAV backend: scaling + BGR conversion inside swscale, threaded decode
+# -------------------------------------------------------------------------------
+
+class PyAVSource:
+    """
+    PyAV/FFmpeg decoder. Scaling and pixel-format conversion happen in one
+    swscale pass at decode time, and keyframes_only tells the codec to skip
+    non-key frames entirely instead of decoding and discarding them.
+    """
+
+    def __init__(self, url, width=None, threads=0, keyframes_only=False, pool_size=3, timeout=None):
+        import av
+
+        self.url = url
+        self.width = width
+        self.timestamp = None
+        self._clock = _StreamClock()
+        self._ring = _BufferRing(pool_size)
+        self._opened = False
+        self.fps = 0.0
+        self.frame_width = self.frame_height = 0
+
+        try:
+            self.container = av.open(url, timeout=timeout or 10.0)
+            self.stream = self.container.streams.video[0]
+        except Exception as e:
+            logger.error(f"Failed to open {url} with PyAV: {e}")
+            self.container = None
+            return
+
+        ctx = self.stream.codec_context
+        self.stream.thread_type = "AUTO"
+        if threads:
+            ctx.thread_count = int(threads)
+        if keyframes_only:
+            ctx.skip_frame = "NONKEY"
+
+        rate = self.stream.average_rate or self.stream.guessed_rate
+        self.fps = float(rate) if rate else 0.0
+        self.frame_width, self.frame_height = _scaled_size(ctx.width, ctx.height, width)
+        self._frames = self.container.decode(self.stream)
+        self._opened = True
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        try:
+            frame = next(self._frames)
+        except StopIteration:
+            self._opened = False
+            return False, None
+        except Exception as e:
+            logger.warning(f"PyAV decode error on {self.url}: {e}")
+            return False, None
+
+        out_w, out_h = _scaled_size(frame.width, frame.height, self.width)
+        rgb = frame.reformat(width=out_w, height=out_h, format="bgr24")
+
+        # Copy straight from the plane into a reused buffer (strip row padding)
+        plane = rgb.planes[0]
+        rows = np.frombuffer(plane, dtype=np.uint8).reshape(out_h, plane.line_size)
+        out = self._ring.next(out_h, out_w)
+        np.copyto(out, rows[:, :out_w * 3].reshape(out_h, out_w, 3))
+
+        self.timestamp = self._clock(float(frame.time) if frame.time is not None else None)
+        return True, out
+
+    def release(self):
+        if self.container is not None:
+            self.container.close()
+        self._opened = False
+
+
+BACKENDS = {
+    "opencv": OpenCVSource,
+    "pyav": PyAVSource,
+}
+
+
+def open_video_source(url, decode=None, **overrides):
+    """Open url with the configured decode backend (see DEFAULT_DECODE)."""
+    cfg = normalize_decode(decode, **overrides)
+    if url.startswith("replay://"):
+        # Recorded frames (src.utils.frame_replay); nothing to decode
+        from src.utils.frame_replay import open_replay
+        return open_replay(url, width=cfg["width"], pool_size=cfg["pool_size"])
+
+    backend = cfg["backend"]
+    cls = BACKENDS.get(backend)
+    if cls is None:
+        logger.warning(f"Unknown decode backend {backend!r}; using opencv")
+        cls = OpenCVSource
+    elif backend == "pyav":
+        try:
+            import av  # noqa: F401
+        except ImportError:
+            logger.warning("PyAV not installed; falling back to the opencv decode backend")
+            cls = OpenCVSource
+
+    return cls(
+        url,
+        width=cfg["width"],
+        threads=cfg["threads"],
+        keyframes_only=cfg["keyframes_only"],
+        pool_size=cfg["pool_size"],
+        timeout=cfg["timeout"],
+    )
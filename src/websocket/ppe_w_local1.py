@@ -1,158 +1,332 @@
+import os
 import cv2
 import json
-import base64
 import asyncio
 import time
 import logging
+import threading
 from concurrent.futures import ThreadPoolExecutor
 from src.models.ppe_local import ppe_detection
+from src.local_models.ppe_code.inference import StreamState
+from src.local_models.ppe_code.ppe_rules import load_camera_rules
 
 from src.store_s3.ppe_store import upload_to_s3
-from src.database.ppe_query import insert_ppe_frame
-from multiprocessing import Process, Queue
+from src.database.ppe_query import insert_compliance_rollups, insert_ppe_frames_bulk
+from src.utils.metrics import StreamMetrics, timed_send
+from src.alerts.alert_pipeline import AlertTracker, AlertDispatcher, WebSocketSink, WebhookSink, shared_sinks, validate_webhook
+from src.store_s3.clip_recorder import ClipRecorder
+from src.analytics.rollups import ComplianceRollup
+from src.store_s3.spool import DEFAULT_SPOOL, SpoolReader, SpoolWriter, claim_orphans, new_spool_path, remove_spool
+from src.utils.video_source import open_video_source
+from src.utils.frame_replay import REPLAY_SCHEME, DetectionLog, start_recording
+from src.utils.stream_supervisor import SupervisedSource
+from src.websocket.stream_hub import FrameEncoder, send_frame, stream_subscribers
+from src.utils.kvs_stream import get_kvs_hls_url
+from multiprocessing import Event, Process
 
-from PIL import Image
 
 logger = logging.getLogger("ppe_monitoring")
 logger.setLevel(logging.INFO)
 
+# Periodic snapshot rate (frames); 0 disables. Alert clips cover the violations.
+SNAPSHOT_INTERVAL = int(os.getenv("PPE_SNAPSHOT_INTERVAL", 600))
+
 
 # ---------------------------------------------------------
-# MULTIPROCESSING STORAGE WORKER
+# MULTIPROCESSING STORAGE WORKER (drains the disk spool)
 # ---------------------------------------------------------
 
-def run_storage_worker(q, client_id):
+def store_batch(records, uploaded, metrics):
     """
-    Runs in a SEPARATE PROCESS.
-    Handles S3 upload + DB insert.
+    Upload each snapshot's JPEG (once per batch, across retries) and bulk
+    insert the rows; compliance rollup records are upserted alongside.
     """
-
-    logger.info(f"[{client_id}] Storage worker started.")
-
+    rows, rollups = [], []
+    for position, meta, blob in records:
+        if meta.get("kind") == "rollup":
+            rollups.append(meta)
+            continue
+        s3_url = uploaded.get(position)
+        if s3_url is None:
+            t0 = time.perf_counter()
+            s3_url = upload_to_s3(blob, meta["frame_num"])
+            metrics.s3_upload.observe(time.perf_counter() - t0)
+            uploaded[position] = s3_url
+        rows.append((meta, s3_url))
+
+    t0 = time.perf_counter()
+    if insert_ppe_frames_bulk(rows) is None:
+        raise RuntimeError(f"bulk insert of {len(rows)} frames failed")
+    if insert_compliance_rollups(rollups) is None:
+        raise RuntimeError(f"upsert of {len(rollups)} compliance rollups failed")
+    metrics.db_insert.observe(time.perf_counter() - t0)
+
+
+def drain_spool(reader, client_id, metrics, stop, until_empty=False):
+    """
+    Flush the spool in batches, checkpointing after each. While S3/DB are
+    down the batch is retried with backoff and the backlog stays on disk.
+    Returns True once everything is flushed and stop (or until_empty) is set.
+    """
+    uploaded = {}
+    backoff = 1.0
     while True:
-        item = q.get()
-
-        # Sentinel: exit
-        if item is None:
-            break
-
-        frame_id, annotated_frame, detections = item
+        # Read stop first: the writer is closed before stop is set, so an empty read after it is final
+        stopping = stop.is_set()
+        records = reader.read_batch(DEFAULT_SPOOL["batch"])
+        if not records:
+            if until_empty or stopping:
+                return True
+            stop.wait(DEFAULT_SPOOL["poll"])
+            continue
 
         try:
-            # Upload to S3
-            s3_url = upload_to_s3(annotated_frame, frame_id)
+            store_batch(records, uploaded, metrics)
+        except Exception as e:
+            logger.error(f"[{client_id}] Storing {len(records)} spooled frames failed: {e}; retrying in {backoff:.0f}s")
+            if stop.wait(backoff):
+                return False    # left on disk for the next worker
+            backoff = min(backoff * 2, DEFAULT_SPOOL["max_backoff"])
+            continue
 
-            # DB insert
-            insert_ppe_frame(detections, s3_url)
+        reader.commit()
+        uploaded.clear()
+        backoff = 1.0
+        metrics.spool_backlog.set(reader.backlog_bytes())
+        logger.info(f"[{client_id}] Stored {len(records)} frames (through frame {records[-1][1]['frame_num']})")
 
-            logger.info(f"[{client_id}] Stored frame {frame_id}")
 
-        except Exception as e:
-            logger.error(f"[{client_id}] Error storing frame {frame_id}: {e}")
+def run_storage_worker(spool_path, client_id, stream, session, stop):
+    """
+    Runs in a SEPARATE PROCESS.
+    Handles S3 upload + DB insert from the stream's spool, after flushing any
+    spools orphaned by earlier runs.
+    """
+
+    logger.info(f"[{client_id}] Storage worker started.")
+    metrics = StreamMetrics(stream, session)
+
+    for orphan in claim_orphans(exclude=[spool_path]):
+        logger.info(f"[{client_id}] Flushing orphaned spool {orphan.path}")
+        flushed = drain_spool(orphan, client_id, metrics, stop, until_empty=True)
+        orphan.close()
+        if flushed:
+            remove_spool(orphan.path)
+
+    reader = SpoolReader(spool_path)
+    flushed = drain_spool(reader, client_id, metrics, stop)
+    reader.close()
+    if flushed:
+        remove_spool(spool_path)
+    metrics.spool_backlog.set(0)
 
     logger.info(f"[{client_id}] Storage worker exiting...")
 
-    
 
 def run_ppe_detection(client_id: str, video_url: str, camera_id: int, user_id: int, org_id: int, sessions: dict, loop: asyncio.AbstractEventLoop, storage_executor: ThreadPoolExecutor):
     """
     Runs PPE detection in a separate thread.
     Sends WebSocket messages safely and stores frames to S3/DB in background threads to avoid blocking inference.
     """
-    cap = cv2.VideoCapture(video_url)
+    session = sessions.get(client_id, {})
+    config = session.get("config", {})
+
+    # Everyone watching this stream: one viewer standalone, many behind the StreamHub
+    subscribers = stream_subscribers(sessions[client_id], client_id, loop, camera_id, user_id, org_id)
+
+    def publish_health(event):
+        text = json.dumps(dict(event, camera_id=camera_id))
+        for sub in list(subscribers.values()):
+            if sub.ws is not None:
+                asyncio.run_coroutine_threadsafe(sub.ws.send_text(text), sub.loop)
+
+    # Rules (incl. PPE_RULES_FILE) and analysis options are built before the source
+    # opens, so a bad entry ends the stream here without an open capture behind it
+    try:
+        state = StreamState(
+            tiling=config.get("tiling"),
+            pipeline=config.get("pipeline", "detector"),
+            two_stage=config.get("two_stage"),
+            decision_cache=config.get("decision_cache"),
+            rules=config.get("rules") or load_camera_rules(camera_id),
+            association=config.get("association")
+        )
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.error(f"[{client_id}] PPE stream not started: invalid rules or options: {e}")
+        text = json.dumps({"success": False, "message": f"Invalid rules or options: {e}"})
+        for sub in list(subscribers.values()):
+            if sub.ws is not None:
+                asyncio.run_coroutine_threadsafe(sub.ws.send_text(text), sub.loop)
+        if client_id in sessions:
+            sessions[client_id]["streaming"] = False
+        return
+
+    # Live sources are supervised: stalls reconnect with backoff and KVS HLS URLs
+    # are renewed before they expire, all inside cap.read() so tracking carries over
+    stream_name, region = session.get("stream_name"), session.get("region")
+    resolve = None
+    if stream_name and not stream_name.startswith("https"):
+        resolve = lambda: get_kvs_hls_url(stream_name, region or "ap-south-1")
+    # Frames come out already scaled to the 720 px analysis width
+    cap = SupervisedSource(
+        video_url,
+        lambda url: open_video_source(url, config.get("decode"), width=720),
+        resolve=resolve,
+        cfg=config.get("supervisor"),
+        on_health=publish_health,
+        should_run=lambda: sessions.get(client_id, {}).get("streaming", False),
+        name=client_id,
+    )
     frame_num = 0
+
+    state.frame_rate = int(cap.fps or 30)     # read when the tracker is built on the first frame
+    metrics = StreamMetrics(camera_id)
+    state.metrics = metrics
+
+    # Exposed to the admin profiling endpoints
+    if client_id in sessions:
+        sessions[client_id]["thread_id"] = threading.get_ident()
+        sessions[client_id]["metrics"] = metrics
     # ---------------------------------------------------------
     # START MULTIPROCESS STORAGE WORKER
     # ---------------------------------------------------------
-    store_queue = Queue(maxsize=1000)
+    # Snapshots go to a disk spool, so S3/DB outages neither block nor lose them
+    spool = SpoolWriter(new_spool_path(f"camera-{camera_id}"))
+    storage_stop = Event()
 
     storage_process = Process(
         target=run_storage_worker,
-        args=(store_queue, client_id),
+        args=(spool.path, client_id, metrics.stream, metrics.session, storage_stop),
         daemon=True
     )
     storage_process.start()
 
-    
+    # ---------------------------------------------------------
+    # ALERT STREAM (debounced, fanned out off the frame path)
+    # ---------------------------------------------------------
+    def send(sub, data):
+        asyncio.run_coroutine_threadsafe(timed_send(sub.ws, data, metrics.ws_send), sub.loop)
+
+    alert_tracker = AlertTracker(camera_id, user_id, org_id, config.get("alerts"))
+    own_sinks = [WebSocketSink(subscribers)]
+    if config.get("alert_webhook"):
+        # Checked by the handler too; jobs from a cluster broker come through here unchecked
+        try:
+            own_sinks.append(WebhookSink(validate_webhook(config["alert_webhook"]), name="webhook-camera"))
+        except ValueError as e:
+            logger.warning(f"[{client_id}] alert_webhook ignored: {e}")
+    alert_dispatcher = AlertDispatcher(own_sinks + shared_sinks())
+    clip_recorder = ClipRecorder(camera_id, config.get("clips"))
+    # Per-minute compliance from every analyzed frame; closed minutes go out through the spool
+    rollup = ComplianceRollup(camera_id, user_id, org_id, frame_interval=1.0 / (cap.fps or 30))
+
+    snapshot_interval = config.get("snapshot_interval")
+    snapshot_interval = SNAPSHOT_INTERVAL if snapshot_interval is None else int(snapshot_interval)
+
+    # ---------------------------------------------------------
+    # RECORD / REPLAY (src.utils.frame_replay)
+    # ---------------------------------------------------------
+    # "record" saves every analyzed frame with its source timestamp; replay:// URLs
+    # play a recording back. With the "source" clock, alerts and rollups run on
+    # those timestamps, so a replay behaves the same at any speed and
+    # "detection_log" output can be diffed between runs.
+    recorder = start_recording(config.get("record"), f"camera-{camera_id}", cap.fps, video_url)
+    detection_log = DetectionLog(config["detection_log"]) if config.get("detection_log") else None
+    clock = config.get("clock") or ("source" if video_url.startswith(REPLAY_SCHEME) else "wall")
+    source_clock = clock == "source"
+    now = None
 
     while cap.isOpened() and sessions.get(client_id, {}).get("streaming", False):
+        # Set by the admin allocations endpoint for a bounded number of frames
+        probe = sessions.get(client_id, {}).get("alloc_probe")
+        if probe is not None:
+            probe.frame_start()
+        # Rules pushed by update_rules take effect at the next frame boundary
+        rules = sessions.get(client_id, {}).pop("rules_update", None)
+        if rules is not None:
+            state.ppe_logic.set_rules(rules)
+            logger.info(f"[{client_id}] PPE rules updated: {rules.source}")
+        t0 = time.perf_counter()
         ret, frame = cap.read()
         if not ret:
-            # No more frames
+            # End of file, stopped, or a live outage the supervisor gave up on
             break
+        t1 = time.perf_counter()
+        if cap.resumed_after is not None:
+            # Short gaps keep tracks and PPE history; after a long one the scene has changed
+            if cap.resumed_after > cap.cfg["reset_after"]:
+                state.reset_tracks()
+                logger.info(f"[{client_id}] Tracking reset after a {cap.resumed_after:.0f}s outage")
+        else:
+            metrics.capture.observe(t1 - t0)
+        if recorder is not None and not recorder.write(frame, cap.timestamp or time.time()):
+            recorder.close()
+            recorder = None
 
-        # Convert to RGB and PIL Image for YOLO input
-        h, w = frame.shape[:2]
-        new_w = 720
-        new_h = int((new_w / w) * h)
-        
-        frame = cv2.resize(frame, (new_w, new_h))
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        image_pil = Image.fromarray(frame_rgb)
-        
         frame_num += 1
         try:
             # ---------------- PPE inference ----------------
-            result, error, annotated_frame,alert = ppe_detection(image_pil)
-            ts = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
+            # The decoded BGR buffer goes straight to YOLO: no RGB copy, no PIL image
+            result, error, annotated_frame, _ = ppe_detection(frame, state)
+            now = cap.timestamp if source_clock and cap.timestamp is not None else time.time()
+            ts = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(now))
             payload = {}
 
-            ws = sessions[client_id]["ws"]
+            # Alerts are raised before any frame encoding and delivered by their own sinks
+            alert = None
+            if result:
+                alert = alert_tracker.update(result["detections"], now, frame_num) or None
+                rollup.update(result["detections"], now)
+                rollup.count_alerts(alert)
+                for row in rollup.drain(now):
+                    if not spool.append(row):
+                        metrics.dropped_storage.inc()
+                        logger.warning(f"[{client_id}] Storage spool full; rollup for minute {row['minute']} dropped.")
+                if alert:
+                    for event in alert:
+                        alert_dispatcher.publish(event)
+                        if event["event"] == "fired":
+                            clip_recorder.trigger(event["alert_id"], now)
+                if detection_log is not None:
+                    detection_log.write(frame_num, cap.timestamp, result["detections"], alert)
 
             if result and annotated_frame is not None:
+                t0 = time.perf_counter()
                 success, buffer = cv2.imencode(".jpg", annotated_frame)
                 if not success:
-                    continue
-
-                frame_base64 = base64.b64encode(buffer).decode("utf-8")
-                payload = {
-                    "frame_num": frame_num,
-                    "user_id": user_id,
-                    "camera_id": camera_id,
-                    "org_id": org_id,
-                    "time_stamp": ts,
-                    "detections": result["detections"],
-                    "annotated_frame":frame_base64,
-                    "alert":alert
-                }
-            # ---------------- WebSocket send ----------------
-            
-                if payload:
-                    asyncio.run_coroutine_threadsafe(
-                        ws.send_text(json.dumps(payload)),
-                        loop
-                    )
-                elif error:
-                    asyncio.run_coroutine_threadsafe(
-                        ws.send_text(json.dumps(error)),
-                        loop
-                    )
-                    break
-
-                
-
-                # ------------------ STORE EVERY 20th FRAME -----------------
-                if frame_num % 20 == 0:
-
-                    if annotated_frame is not None:
-                        # JSON COPY to avoid race condition
-                        safe_copy = json.loads(json.dumps(payload))
-
-                        try:
-                            store_queue.put_nowait(
-                                (frame_num, buffer, safe_copy)
-                            )
-                        except:
+                    # Nothing to send; the per-frame bookkeeping below still runs
+                    metrics.dropped_encode.inc()
+                else:
+                    clip_recorder.add_frame(buffer, now)
+
+                    payload = {
+                        "frame_num": frame_num,
+                        "time_stamp": ts,
+                        "detections": result["detections"],
+                        "alert": alert
+                    }
+                    # ---------------- WebSocket send (per-viewer rendering) ----------------
+                    encoder = FrameEncoder(annotated_frame, buffer, state.pool)
+                    send_frame(subscribers, encoder, payload, now, send)
+                    metrics.add_encode(time.perf_counter() - t0)
+                    metrics.flush_encode()
+
+                    # ------------------ LOW-RATE PERIODIC SNAPSHOT -----------------
+                    if snapshot_interval and frame_num % snapshot_interval == 0:
+                        record = dict(payload, user_id=user_id, camera_id=camera_id, org_id=org_id)
+                        if not spool.append(record, buffer):
+                            metrics.dropped_storage.inc()
                             logger.warning(
-                                f"[{client_id}] Storage queue full; frame {frame_num} dropped."
+                                f"[{client_id}] Storage spool full; frame {frame_num} dropped."
                             )
 
             else:
-                if ws:
-                    asyncio.run_coroutine_threadsafe(
-                        ws.send_text(json.dumps({"success": False, "message": error})),
-                        loop
-                    )
+                for sub in list(subscribers.values()):
+                    if sub.ws is not None:
+                        asyncio.run_coroutine_threadsafe(
+                            sub.ws.send_text(json.dumps({"success": False, "message": error})),
+                            sub.loop
+                        )
                 logger.warning(f"[{client_id}] Frame {frame_num}: No detections - {error}")
                 break
 
@@ -160,13 +334,40 @@ def run_ppe_detection(client_id: str, video_url: str, camera_id: int, user_id: i
         except Exception as e:
             print(f"[{client_id}] Frame {frame_num} pipeline error -> {e}")
 
+        metrics.end_frame(frame_num)
+        if probe is not None:
+            probe.frame_end(frame_num)
+        if frame_num % 100 == 0:
+            metrics.sync_cache(state.ppe_logic.cache_stats)
+
     cap.release()
+    if recorder is not None:
+        recorder.close()
+
+    probe = sessions.get(client_id, {}).get("alloc_probe")
+    if probe is not None:
+        probe.stop()
+
+    # Stamped with the last frame's clock time, so a replay's closing events match between runs
+    closing = alert_tracker.close(now if source_clock and now is not None else time.time())
+    for event in closing:
+        alert_dispatcher.publish(event)
+    if detection_log is not None:
+        detection_log.close(closing)
+    for row in rollup.drain(final=True):
+        spool.append(row)
+    clip_recorder.flush()
+    for sink in own_sinks:
+        sink.close()
 
     # STOP STORAGE PROCESS
-    store_queue.put(None)
+    spool.close()
+    storage_stop.set()
     storage_process.join(timeout=5)
     
     if client_id in sessions:
         sessions[client_id]["streaming"] = False
 
+    logger.info(f"[{client_id}] PPE decision cache: {state.ppe_logic.cache_metrics()}")
+    metrics.close()
     logger.info(f"[{client_id}] PPE Detection stopped and resources released")
\ No newline at end of file
@@ -0,0 +1,302 @@
+import json
+import base64
+import hashlib
+import logging
+import itertools
+import threading
+
+from src.utils.detection_codec import CODEC_FORMATS, DetectionEncoder
+
+logger = logging.getLogger("stream_hub")
+logger.setLevel(logging.INFO)
+
+# ---------- Per-viewer rendering ----------
+DEFAULT_RENDER = {
+    "annotated": True,      # send the annotated JPEG; False = detections only
+    "quality": 95,          # JPEG quality (95 is OpenCV's default)
+    "width": None,          # downscale before encoding (thumbnails, video walls)
+    "max_fps": None,        # cap the frame rate this viewer receives
+    "alerts": True,         # receive ppe_alert events
+    "codec": None,          # None = verbose JSON; "json" / "msgpack" = compact delta encoding
+    "keyframe_interval": 30,    # compact codec: full state every N frames sent
+}
+
+# start_stream fields that only change what one viewer receives, not the analysis
+VIEWER_FIELDS = ("render",)
+
+
+def normalize_render(cfg):
+    render = dict(DEFAULT_RENDER)
+    if isinstance(cfg, dict):
+        render.update({k: v for k, v in cfg.items() if k in DEFAULT_RENDER})
+    return render
+
+
+def validate_render(cfg):
+    """Raise ValueError for render options a Subscriber cannot serve."""
+    if cfg is not None and not isinstance(cfg, dict):
+        raise ValueError("render must be an object")
+    render = normalize_render(cfg)
+    if render["codec"] not in (None,) + CODEC_FORMATS:
+        raise ValueError(f"Unknown codec {render['codec']!r}; expected one of {list(CODEC_FORMATS)}")
+    try:
+        quality = int(render["quality"])
+        width = int(render["width"]) if render["width"] is not None else None
+        max_fps = float(render["max_fps"]) if render["max_fps"] is not None else None
+        int(render["keyframe_interval"] or 1)
+    except (TypeError, ValueError):
+        raise ValueError("quality, width, max_fps and keyframe_interval must be numbers")
+    if not 1 <= quality <= 100:
+        raise ValueError("quality must be within [1, 100]")
+    if width is not None and width <= 0 or max_fps is not None and max_fps < 0:
+        raise ValueError("width must be positive and max_fps non-negative")
+    return render
+
+
+class Subscriber:
+    """One viewer of a stream: where to send, whose IDs to stamp, how to render."""
+
+    def __init__(self, client_id, ws, loop, camera_id, user_id, org_id, render=None, session=None):
+        self.client_id = client_id
+        self.ws = ws
+        self.loop = loop
+        self.camera_id = camera_id
+        self.user_id = user_id
+        self.org_id = org_id
+        self.render = normalize_render(render)
+        self.session = session          # the viewer's ppe_sessions entry, if any
+        self.codec = None
+        if self.render["codec"]:
+            self.codec = DetectionEncoder(self.render["codec"], self.render["keyframe_interval"],
+                                          ids=(user_id, camera_id, org_id))
+        self._next_due = 0.0
+
+    def due(self, now):
+        """Frame-rate cap: True if this viewer should get the current frame."""
+        max_fps = self.render["max_fps"]
+        if not max_fps:
+            return True
+        if now < self._next_due:
+            return False
+        self._next_due = max(self._next_due + 1.0 / max_fps, now - 1.0)
+        return True
+
+
+class FrameEncoder:
+    """
+    Encodes one annotated frame once per distinct (quality, width) among the
+    current viewers, so ten viewers with default settings cost one JPEG.
+    """
+
+    def __init__(self, frame, default_jpeg=None, pool=None):
+        self.frame = frame
+        self.pool = pool
+        self._jpeg = {}
+        self._b64 = {}
+        if default_jpeg is not None:
+            self._jpeg[(DEFAULT_RENDER["quality"], None)] = default_jpeg
+
+    def _key(self, render):
+        width = render["width"]
+        if width and width >= self.frame.shape[1]:
+            width = None
+        return int(render["quality"]), width
+
+    def _encode(self, key):
+        if key not in self._jpeg:
+            import cv2          # only detection threads encode; keeps cv2 off the web startup path
+            quality, width = key
+            img = self.frame
+            if width:
+                h = int(round(img.shape[0] * width / img.shape[1]))
+                dst = self.pool.get(f"render-{width}", (h, width, 3)) if self.pool is not None else None
+                img = cv2.resize(img, (width, h), dst=dst, interpolation=cv2.INTER_AREA)
+            ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            self._jpeg[key] = buf if ok else None
+        return self._jpeg[key]
+
+    def jpeg(self, render):
+        """Raw JPEG bytes, for binary (msgpack) viewers."""
+        buf = self._encode(self._key(render))
+        return buf.tobytes() if buf is not None else None
+
+    def b64(self, render):
+        key = self._key(render)
+        if key not in self._b64:
+            buf = self._encode(key)
+            self._b64[key] = base64.b64encode(buf).decode("utf-8") if buf is not None else None
+        return self._b64[key]
+
+
+# -------------------------------------------------------------------------------
+# Stream hub: one analysis pipeline per (stream_name, camera, org, analysis config)
+# -------------------------------------------------------------------------------
+
+def pipeline_key(stream_name, config, org_id=None, camera_id=None):
+    # Alerts, rollups, clips and snapshots carry the pipeline's camera and org: never shared across either
+    analysis = {k: v for k, v in (config or {}).items() if k not in VIEWER_FIELDS}
+    analysis["org_id"] = org_id
+    analysis["camera_id"] = camera_id
+    digest = hashlib.sha1(json.dumps(analysis, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    return f"{stream_name}#{digest}"
+
+
+class StreamHub:
+    """
+    Deduplicates camera analysis across viewers. The first start_stream for
+    a (stream_name, camera, org, config) launches run_fn; later ones attach as extra
+    subscribers of the running pipeline. The pipeline stops when its last
+    subscriber leaves. A viewer repeating start_stream for the pipeline it
+    already watches (e.g. new render options) is updated in place.
+
+    Pipelines live in self.pipelines, which is the `sessions` dict handed
+    to run_fn: each entry carries a "subscribers" dict that the detection
+    thread reads every frame.
+    """
+
+    def __init__(self, executor, storage_executor, run_fn):
+        self.executor = executor
+        self.storage_executor = storage_executor
+        self.run_fn = run_fn
+        self.pipelines = {}         # run_id -> session-like dict (the run_fn `sessions`)
+        self.active = {}            # pipeline key -> run_id of its live pipeline
+        self.viewers = {}           # client_id -> run_id
+        self._runs = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, subscriber, stream_name, video_url, config, loop):
+        """
+        Attach a viewer; returns (run_id, True if a new pipeline was started).
+        Returns (None, False) when a new pipeline is needed but video_url is
+        None (it stopped since running() was checked): resolve and retry.
+        """
+        key = pipeline_key(stream_name, config, subscriber.org_id, subscriber.camera_id)
+        with self._lock:
+            run_id = self.active.get(key)
+            pipeline = self.pipelines.get(run_id)
+            if pipeline is not None and pipeline["streaming"] and self.viewers.get(subscriber.client_id) == run_id:
+                # Same pipeline: swap the viewer's settings without dropping its last-viewer claim
+                pipeline["subscribers"][subscriber.client_id] = subscriber
+                logger.info(f"[{run_id}] {subscriber.client_id} updated")
+                return run_id, False
+            started = pipeline is None or not pipeline["streaming"]
+            if started and video_url is None:
+                return None, False
+        self.unsubscribe(subscriber.client_id)
+
+        with self._lock:
+            run_id = self.active.get(key)
+            pipeline = self.pipelines.get(run_id)
+            started = pipeline is None or not pipeline["streaming"]
+            if started and video_url is None:
+                return None, False
+            if started:
+                # A stopping pipeline keeps its own run_id, so it cannot pick up the new one's flag
+                run_id = f"{key}/{next(self._runs)}"
+                pipeline = {
+                    "ws": None,
+                    "streaming": True,
+                    "inference_tasks": [],
+                    "config": config,
+                    "subscribers": {},
+                    "stream_name": stream_name,
+                    "region": (subscriber.session or {}).get("region"),
+                }
+                self.pipelines[run_id] = pipeline
+                self.active[key] = run_id
+            pipeline["subscribers"][subscriber.client_id] = subscriber
+            self.viewers[subscriber.client_id] = run_id
+
+        if started:
+            future = loop.run_in_executor(
+                self.executor, self._run, key, run_id, video_url, subscriber, loop
+            )
+            pipeline["inference_tasks"].append(future)
+            logger.info(f"[{run_id}] Pipeline started for {subscriber.client_id}")
+        else:
+            logger.info(f"[{run_id}] {subscriber.client_id} joined ({len(pipeline['subscribers'])} viewers)")
+        return run_id, started
+
+    def unsubscribe(self, client_id):
+        with self._lock:
+            run_id = self.viewers.pop(client_id, None)
+            pipeline = self.pipelines.get(run_id)
+            if pipeline is None:
+                return
+            pipeline["subscribers"].pop(client_id, None)
+            remaining = len(pipeline["subscribers"])
+            if remaining == 0:
+                pipeline["streaming"] = False
+        if remaining == 0:
+            logger.info(f"[{run_id}] Last viewer left; stopping pipeline")
+        else:
+            logger.info(f"[{run_id}] {client_id} left ({remaining} viewers)")
+
+    def running(self, stream_name, config, org_id=None, camera_id=None):
+        """True if viewers of this stream/camera/org/config would join a live pipeline (no URL needed)."""
+        with self._lock:
+            pipeline = self.pipelines.get(self.active.get(pipeline_key(stream_name, config, org_id, camera_id)))
+            return pipeline is not None and pipeline["streaming"]
+
+    def pipeline_for(self, client_id):
+        return self.pipelines.get(self.viewers.get(client_id))
+
+    def _run(self, key, run_id, video_url, first, loop):
+        try:
+            self.run_fn(run_id, video_url, first.camera_id, first.user_id, first.org_id,
+                        self.pipelines, loop, self.storage_executor)
+        finally:
+            with self._lock:
+                pipeline = self.pipelines.pop(run_id)
+                if self.active.get(key) == run_id:
+                    del self.active[key]
+                orphans = [s for s in pipeline["subscribers"].values() if self.viewers.get(s.client_id) == run_id]
+                for sub in orphans:
+                    del self.viewers[sub.client_id]
+            # Stream ended on its own (EOF, decode error): viewers can restart it
+            for sub in orphans:
+                if sub.session is not None:
+                    sub.session["streaming"] = False
+            logger.info(f"[{run_id}] Pipeline finished")
+
+    def status(self):
+        with self._lock:
+            return {
+                run_id: {"stream_name": p["stream_name"], "viewers": sorted(p["subscribers"]), "streaming": p["streaming"]}
+                for run_id, p in self.pipelines.items()
+            }
+
+
+def stream_subscribers(session, client_id, loop, camera_id, user_id, org_id):
+    """
+    The subscriber dict a detection thread serves: the hub's shared one, or a
+    single viewer built from a plain session (standalone, cluster node, bench).
+    """
+    subscribers = session.get("subscribers")
+    if subscribers is None:
+        subscribers = {client_id: Subscriber(
+            client_id, session.get("ws"), loop, camera_id, user_id, org_id,
+            (session.get("config") or {}).get("render"), session
+        )}
+        session["subscribers"] = subscribers
+    return subscribers
+
+
+def send_frame(subscribers, encoder, base_payload, now, send):
+    """
+    Build and send each viewer's message; send(sub, data) schedules the write
+    (str -> text frame, bytes -> binary frame).
+    """
+    for sub in list(subscribers.values()):
+        if sub.ws is None or not sub.due(now):
+            continue
+        if sub.codec is not None:
+            message = sub.codec.encode(base_payload)
+            if sub.render["annotated"]:
+                message["img"] = encoder.jpeg(sub.render) if sub.codec.binary else encoder.b64(sub.render)
+            send(sub, sub.codec.pack(message))
+            continue
+        payload = dict(base_payload, user_id=sub.user_id, camera_id=sub.camera_id, org_id=sub.org_id)
+        if sub.render["annotated"]:
+            payload["annotated_frame"] = encoder.b64(sub.render)
+        send(sub, json.dumps(payload))